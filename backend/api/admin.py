@@ -1,8 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth import get_user_model
 from .user_models import UserProfile
-from .models import Course, CourseEnrollment, EvalNode, EvalEntry, Threshold
+from .models import Course, CourseEnrollment, EnrollmentSummary, EvalNode, EvalEntry, Threshold
+from .rollover import duplicate_courses
 
 User = get_user_model()
 
@@ -46,6 +47,17 @@ class CourseAdmin(admin.ModelAdmin):
     list_filter = ['year', 'term', 'target_enrollment_year', 'is_required']
     search_fields = ['name']
     inlines = [CourseEnrollmentInline]
+    actions = ['duplicate_to_next_year']
+
+    @admin.action(description='選択した科目を翌年度へ複製（評価ツリー・閾値を含む）')
+    def duplicate_to_next_year(self, request, queryset):
+        report = duplicate_courses(queryset)
+        self.message_user(
+            request,
+            f"{report['created']}科目（評価ノード{report['nodes']}件）を複製しました。"
+            f"既に存在する{report['skipped']}科目はスキップしました。",
+            messages.SUCCESS,
+        )
 
 
 class CourseEnrollmentAdmin(admin.ModelAdmin):
@@ -68,3 +80,4 @@ admin.site.register(CourseEnrollment, CourseEnrollmentAdmin)
 admin.site.register(EvalNode)
 admin.site.register(EvalEntry)
 admin.site.register(Threshold)
+admin.site.register(EnrollmentSummary)
@@ -0,0 +1,196 @@
+"""
+Token authentication with a process-local identity cache and token expiry.
+
+DRF's TokenAuthentication loads the token and its user on every request,
+and most views then load user.profile for enrollment_year. Here a token
+key maps to the user and profile fields the API reads (USER_FIELDS,
+PROFILE_FIELDS: flags, enrollment_year and what /api/me/ returns) for
+TOKEN_CACHE_TTL seconds. The request user and profile are rebuilt from
+those values with the remaining fields (password, timestamps) deferred,
+so authenticated reads usually need no identity queries at all.
+
+Tokens older than TOKEN_EXPIRE_SECONDS (unset: never) are deleted and
+rejected with "Token has expired.", which the frontend already handles.
+Cache entries are evicted on logout, token deletion and user or profile
+changes (signals.py). Other processes rely on the TTL.
+
+Calendar apps cannot send an Authorization header, so the iCalendar feed
+also accepts ?key=, a signed user id (feed_key()). The signature covers
+the password hash, so changing the password revokes old feed URLs, and
+the API token itself never appears in a URL.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.db import router
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .user_models import UserProfile
+
+USER_FIELDS = ('id', 'username', 'email', 'is_active', 'is_staff', 'is_superuser')
+PROFILE_FIELDS = ('id', 'user_id', 'full_name', 'student_id', 'date_of_birth', 'enrollment_year')
+
+
+class Identity:
+    __slots__ = ('user_values', 'profile_values', 'user_id', 'expires_at')
+
+    def __init__(self, user_values, profile_values, expires_at):
+        self.user_values = user_values
+        self.profile_values = profile_values
+        self.user_id = user_values['id']
+        self.expires_at = expires_at
+
+
+class IdentityCache:
+    """Thread-safe, bounded token key -> Identity map with per-entry expiry."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            identity = self._entries.get(key)
+            if identity is None:
+                return None
+            if identity.expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return identity
+
+    def put(self, key, identity):
+        with self._lock:
+            self._entries[key] = identity
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def evict_user(self, user_id):
+        with self._lock:
+            for key in [key for key, identity in self._entries.items() if identity.user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+identity_cache = IdentityCache(getattr(settings, 'TOKEN_CACHE_SIZE', 10000))
+
+
+def _seconds_left(created):
+    """Seconds the token stays valid, or None when tokens do not expire."""
+    lifetime = getattr(settings, 'TOKEN_EXPIRE_SECONDS', None)
+    if lifetime is None:
+        return None
+    return (created + timedelta(seconds=lifetime) - timezone.now()).total_seconds()
+
+
+def token_expired(created):
+    seconds_left = _seconds_left(created)
+    return seconds_left is not None and seconds_left <= 0
+
+
+def _from_db(model, values):
+    """Instance with only the given {attname: value} loaded; from_db wants them in concrete field order."""
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in values]
+    return model.from_db(router.db_for_read(model), names, [values[name] for name in names])
+
+
+def _build_user(identity):
+    user = _from_db(get_user_model(), identity.user_values)
+    profile = None
+    if identity.profile_values is not None:
+        profile = _from_db(UserProfile, identity.profile_values)
+        profile._state.fields_cache['user'] = user
+    # Reverse one-to-one cache: user.profile raises DoesNotExist when None.
+    user._state.fields_cache['profile'] = profile
+    return user
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        identity = identity_cache.get(key)
+        if identity is None:
+            identity = self._load(key)
+        return _build_user(identity), key
+
+    def _load(self, key):
+        try:
+            token = Token.objects.select_related('user', 'user__profile').get(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        user = token.user
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        if token_expired(token.created):
+            token.delete()
+            raise exceptions.AuthenticationFailed(_('Token has expired.'))
+
+        try:
+            profile = user.profile
+            profile_values = {field: getattr(profile, field) for field in PROFILE_FIELDS}
+        except UserProfile.DoesNotExist:
+            profile_values = None
+
+        ttl = getattr(settings, 'TOKEN_CACHE_TTL', 60)
+        seconds_left = _seconds_left(token.created)
+        if seconds_left is not None:
+            ttl = min(ttl, seconds_left)
+        identity = Identity(
+            {field: getattr(user, field) for field in USER_FIELDS},
+            profile_values,
+            time.monotonic() + ttl,
+        )
+        identity_cache.put(key, identity)
+        return identity
+
+
+FEED_KEY_SALT = 'api.authentication.calendar-feed'
+
+
+def _password_digest(user):
+    return salted_hmac(FEED_KEY_SALT, user.password).hexdigest()[:16]
+
+
+def feed_key(user):
+    """Signed key for the calendar feed URL of this user."""
+    return signing.dumps([user.pk, _password_digest(user)], salt=FEED_KEY_SALT, compress=True)
+
+
+class CalendarFeedAuthentication(BaseAuthentication):
+    """Authenticates ?key=<feed_key()>; requests without the parameter fall through."""
+
+    def authenticate(self, request):
+        key = request.query_params.get('key')
+        if not key:
+            return None
+        try:
+            user_id, digest = signing.loads(key, salt=FEED_KEY_SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise exceptions.AuthenticationFailed(_('Invalid feed key.'))
+        User = get_user_model()
+        user = User.objects.select_related('profile').filter(pk=user_id, is_active=True).first()
+        if user is None or not constant_time_compare(digest, _password_digest(user)):
+            raise exceptions.AuthenticationFailed(_('Invalid feed key.'))
+        return user, None
@@ -0,0 +1,182 @@
+"""
+Vectorized summaries for every enrolled student of a course.
+
+A course's entries are loaded into students x leaves score and completion
+matrices. The tree is then evaluated bottom-up with one vector operation
+per child, across all students at once, accumulating the sums in the same
+order as CalculationService.evaluate_tree and summarize. Every student's
+totals therefore round exactly like the per-user path.
+"""
+import numpy as np
+
+from .course_tree import get_compiled_tree
+from .models import CourseEnrollment, EvalEntry, EvalNode
+from .services import CalculationService
+
+ENTRY_FIELDS = ('user_id', 'node_id', 'earned', 'max', 'rate', 'attended', 'total', 'adjustment', 'status')
+
+
+def _column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def leaf_score_vector(input_types, earned, max_, rate, attended, total, adjustment):
+    """Vectorized CalculationService.calculate_leaf_score; missing values are NaN."""
+    base = np.zeros(len(input_types))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        by_score = np.isin(input_types, [EvalNode.InputType.SCORE, EvalNode.InputType.NONE])
+        by_score &= (max_ > 0) & ~np.isnan(earned)
+        base[by_score] = earned[by_score] / max_[by_score]
+
+        by_rate = (input_types == EvalNode.InputType.RATE) & ~np.isnan(rate)
+        base[by_rate] = rate[by_rate] / 100.0
+
+        by_attendance = (input_types == EvalNode.InputType.ATTENDANCE) & (total > 0) & ~np.isnan(attended)
+        base[by_attendance] = attended[by_attendance] / total[by_attendance]
+
+    score_100 = base * 100 + np.nan_to_num(adjustment)
+    return np.clip(score_100 / 100.0, 0.0, 1.0)
+
+
+class CohortSummaries:
+    """
+    Unrounded course totals of every enrolled student, as arrays aligned with
+    user_ids. summary(i) formats one student exactly like get_course_summary.
+    """
+
+    def __init__(self, course, tree, enrollments, totals):
+        self.course = course
+        self.tree = tree
+        self.enrollment_ids = np.array([row[0] for row in enrollments], dtype=np.int64)
+        self.user_ids = np.array([row[1] for row in enrollments], dtype=np.int64)
+        self.usernames = [row[2] for row in enrollments]
+        self.attendance_masks = [row[3] for row in enrollments]
+        self.has_nodes = totals is not None
+        if self.has_nodes:
+            self.current, self.predicted, self.maximum = totals
+            self.threshold = tree.threshold
+        else:
+            self.current = self.predicted = self.maximum = np.zeros(len(enrollments))
+            self.threshold = 60.0
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @property
+    def deficit(self):
+        if not self.has_nodes:
+            return np.zeros(len(self))
+        return np.maximum(0, self.threshold - self.predicted)
+
+    @property
+    def is_certain_fail(self):
+        if not self.has_nodes:
+            return np.zeros(len(self), dtype=bool)
+        return self.maximum < self.threshold
+
+    def summary(self, i):
+        totals = None
+        if self.has_nodes:
+            totals = (float(self.current[i]), float(self.predicted[i]), float(self.maximum[i]))
+        return CalculationService.build_summary(self.course, self.attendance_masks[i], totals, self.threshold)
+
+
+def evaluate_cohort(course):
+    """
+    Computes CohortSummaries for all enrollments of the course
+    with one enrollment query and one entry query.
+    """
+    tree = get_compiled_tree(course)
+    enrollments = list(
+        CourseEnrollment.objects.filter(course=course)
+        .order_by('user_id')
+        .values_list('id', 'user_id', 'user__username', 'attendance_mask')
+    )
+    if not tree.roots:
+        return CohortSummaries(course, tree, enrollments, None)
+
+    row_of = {row[1]: r for r, row in enumerate(enrollments)}
+    leaves = tree.leaves
+    column_of = {tree.node_ids[i]: c for c, i in enumerate(leaves)}
+    scores = np.zeros((len(enrollments), len(leaves)))
+    completed = np.zeros((len(enrollments), len(leaves)), dtype=bool)
+
+    entries = [
+        row for row in EvalEntry.objects.filter(node__course=course).values_list(*ENTRY_FIELDS)
+        if row[0] in row_of and row[1] in column_of
+    ]
+    if entries:
+        rows = np.array([row_of[e[0]] for e in entries])
+        columns = np.array([column_of[e[1]] for e in entries])
+        leaf_scores = leaf_score_vector(
+            np.array([tree.input_type[leaves[c]] for c in columns]),
+            *(_column(e[k] for e in entries) for k in range(2, 8)),
+        )
+        done = np.array([e[8] == EvalEntry.Status.COMPLETED for e in entries])
+        scores[rows, columns] = leaf_scores
+        completed[rows, columns] = done
+
+    current_nodes, predicted_nodes, max_nodes = _node_scores(tree, scores, completed)
+    defined_weight_sum = 0.0
+    current = np.zeros(len(enrollments))
+    predicted_sum = np.zeros(len(enrollments))
+    max_sum = np.zeros(len(enrollments))
+    for i in tree.top_level:
+        w = tree.weight[i]
+        defined_weight_sum += w
+        attempted = ~np.isnan(current_nodes[:, i])
+        current = current + np.where(attempted, current_nodes[:, i] * w, 0.0)
+        predicted_sum = predicted_sum + predicted_nodes[:, i] * w
+        max_sum = max_sum + max_nodes[:, i] * w
+
+    if defined_weight_sum > 0:
+        predicted = (predicted_sum / defined_weight_sum) * 100.0
+    else:
+        predicted = np.zeros(len(enrollments))
+    maximum = max_sum + max(0.0, 100.0 - defined_weight_sum)
+    return CohortSummaries(course, tree, enrollments, (current, predicted, maximum))
+
+
+def _node_scores(tree, scores, completed):
+    """
+    students x nodes (current, predicted, max) scores, as evaluate_tree computes
+    them; current is NaN where a node has no attempted leaf.
+    """
+    students = scores.shape[0]
+    current = np.full((students, len(tree)), np.nan)
+    predicted = np.zeros((students, len(tree)))
+    maximum = np.zeros((students, len(tree)))
+    column_of = {i: c for c, i in enumerate(tree.leaves)}
+    for i in tree.post_order:
+        if tree.is_leaf[i]:
+            c = column_of[i]
+            current[:, i] = np.where(completed[:, c], scores[:, c], np.nan)
+            predicted[:, i] = np.where(completed[:, c], scores[:, c], 0.0)
+            maximum[:, i] = np.where(completed[:, c], scores[:, c], 1.0)
+            continue
+        children = tree.children[i]
+        if not children:
+            continue
+
+        current_sum = np.zeros(students)
+        current_weight = np.zeros(students)
+        found = np.zeros(students, dtype=bool)
+        predicted_sum = np.zeros(students)
+        max_sum = np.zeros(students)
+        total_weight = 0.0
+        for child in children:
+            w = tree.weight[child]
+            attempted = ~np.isnan(current[:, child])
+            found |= attempted
+            current_sum = np.where(attempted, current_sum + w * current[:, child], current_sum)
+            current_weight = np.where(attempted, current_weight + w, current_weight)
+            predicted_sum = predicted_sum + w * predicted[:, child]
+            max_sum = max_sum + w * maximum[:, child]
+            total_weight += w
+
+        value = np.divide(current_sum, current_weight, out=np.zeros(students), where=current_weight != 0)
+        current[:, i] = np.where(found, value, np.nan)
+        if total_weight != 0:
+            predicted[:, i] = predicted_sum / total_weight
+            maximum[:, i] = max_sum / total_weight
+    return current, predicted, maximum
@@ -0,0 +1,197 @@
+"""
+Compiled, versioned course trees.
+
+The EvalNode tree of a course is edited rarely but read on every summary,
+so it is compiled once per Course.tree_version into flat arrays and kept
+in a bounded, process-local LRU. signals.py bumps the version (and evicts
+the local copy) whenever a node or the threshold of the course changes.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F
+
+from .models import Course, EvalNode, Threshold
+
+DEFAULT_THRESHOLD = 60.0
+
+NODE_FIELDS = ('id', 'parent_id', 'name', 'weight', 'input_type', 'is_leaf', 'order', 'due_date')
+
+
+class CompiledTree:
+    """
+    Flat, read-only representation of one version of a course tree.
+
+    Node i is the i-th node of the course in ('order', 'id') order; all
+    per-node attributes are tuples indexed by that position.
+    """
+    __slots__ = (
+        'course_id', 'version', 'threshold',
+        'node_ids', 'parent_index', 'order', 'weight', 'normalized_weight',
+        'is_leaf', 'input_type', 'name', 'due_date',
+        'index', 'children', 'roots', 'post_order', 'top_level',
+    )
+
+    def __init__(self, course_id, version, rows, threshold=None):
+        """
+        Args:
+            course_id: Course primary key
+            version: Course.tree_version the rows were read at
+            rows: tuples of NODE_FIELDS, ordered by ('order', 'id')
+            threshold: Threshold.value, or None when the course has none
+        """
+        self.course_id = course_id
+        self.version = version
+        self.threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+
+        rows = list(rows)
+        self.node_ids = tuple(row[0] for row in rows)
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.parent_index = tuple(
+            -1 if row[1] is None else self.index.get(row[1], -1) for row in rows
+        )
+        self.name = tuple(row[2] for row in rows)
+        self.weight = tuple(row[3] for row in rows)
+        self.input_type = tuple(row[4] for row in rows)
+        self.is_leaf = tuple(row[5] for row in rows)
+        self.order = tuple(row[6] for row in rows)
+        self.due_date = tuple(row[7] for row in rows)
+
+        children = [[] for _ in rows]
+        roots = []
+        for i, parent in enumerate(self.parent_index):
+            if rows[i][1] is None:
+                roots.append(i)
+            elif parent >= 0:
+                children[parent].append(i)
+        self.children = tuple(tuple(c) for c in children)
+        self.roots = tuple(roots)
+
+        # Weight of each node relative to its siblings (0.0 when they sum to 0).
+        normalized = [0.0] * len(rows)
+        for siblings in (self.roots,) + self.children:
+            total = sum(self.weight[i] for i in siblings)
+            if total != 0:
+                for i in siblings:
+                    normalized[i] = self.weight[i] / total
+        self.normalized_weight = tuple(normalized)
+
+        # Pre-order walk from the roots; reversed, every child comes before its parent.
+        walk = []
+        stack = list(self.roots)
+        while stack:
+            i = stack.pop()
+            walk.append(i)
+            stack.extend(self.children[i])
+        self.post_order = tuple(reversed(walk))
+
+        # Nodes contributing directly to the course score: the roots, or the
+        # children of a single container root ("全体評価 (100%)").
+        if len(self.roots) == 1 and self.children[self.roots[0]]:
+            self.top_level = self.children[self.roots[0]]
+        else:
+            self.top_level = self.roots
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    @property
+    def leaves(self):
+        return tuple(i for i in range(len(self)) if self.is_leaf[i])
+
+
+class TreeCache:
+    """Thread-safe LRU of CompiledTree keyed by course id."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._trees = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, course_id, version):
+        with self._lock:
+            tree = self._trees.get(course_id)
+            if tree is None or tree.version != version:
+                return None
+            self._trees.move_to_end(course_id)
+            return tree
+
+    def put(self, tree):
+        with self._lock:
+            self._trees[tree.course_id] = tree
+            self._trees.move_to_end(tree.course_id)
+            while len(self._trees) > self.maxsize:
+                self._trees.popitem(last=False)
+
+    def evict(self, course_id):
+        with self._lock:
+            self._trees.pop(course_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+
+    def __len__(self):
+        return len(self._trees)
+
+
+tree_cache = TreeCache(getattr(settings, 'COURSE_TREE_CACHE_SIZE', 256))
+
+
+def get_compiled_trees(courses, store=True):
+    """
+    Returns {course_id: CompiledTree} for the given Course instances.
+    Cache misses are compiled together with one node query and one threshold query.
+    With store=False they are not added to the cache (bulk scans such as
+    exports would otherwise evict the hot trees).
+    """
+    trees = {}
+    missing = {}
+    for course in courses:
+        tree = tree_cache.get(course.id, course.tree_version)
+        if tree is None:
+            missing[course.id] = course.tree_version
+        else:
+            trees[course.id] = tree
+    if not missing:
+        return trees
+
+    rows = {course_id: [] for course_id in missing}
+    node_rows = (
+        EvalNode.objects.filter(course_id__in=missing)
+        .order_by('order', 'id')
+        .values_list('course_id', *NODE_FIELDS)
+    )
+    for row in node_rows:
+        rows[row[0]].append(row[1:])
+    thresholds = dict(
+        Threshold.objects.filter(course_id__in=missing).values_list('course_id', 'value')
+    )
+    for course_id, version in missing.items():
+        tree = CompiledTree(course_id, version, rows[course_id], thresholds.get(course_id))
+        if store:
+            tree_cache.put(tree)
+        trees[course_id] = tree
+    return trees
+
+
+def get_compiled_tree(course):
+    """Returns the CompiledTree for the course's current tree_version."""
+    return get_compiled_trees([course])[course.id]
+
+
+def bump_tree_version(course_id):
+    """Invalidates every compiled copy of the course tree (all processes)."""
+    Course.objects.filter(pk=course_id).update(tree_version=F('tree_version') + 1)
+    tree_cache.evict(course_id)
+
+
+def warm_tree_cache(limit=None):
+    """
+    Compiles the trees of the most recent courses into this process's cache.
+    Intended to run once per worker at boot (see config/wsgi.py).
+    """
+    limit = tree_cache.maxsize if limit is None else min(limit, tree_cache.maxsize)
+    courses = list(Course.objects.order_by('-year', '-updated_at').only('id', 'tree_version')[:limit])
+    return len(get_compiled_trees(courses))
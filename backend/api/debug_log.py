@@ -0,0 +1,135 @@
+"""
+Structured debug log (JSON lines) shared by views, serializers and apps.
+
+log_debug() only samples and enqueues; a daemon thread drains the bounded
+queue in batches, appends them to DEBUG_LOG_PATH and rotates the file by
+size. When the queue is full records are dropped rather than blocking the
+request. A category (the hypothesis id) with a sampling rate of 0 costs a
+dict lookup; guard expensive payloads with enabled(category).
+"""
+import atexit
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+from django.conf import settings
+
+BATCH_SIZE = 256
+
+
+def _sample_rate(category):
+    rates = getattr(settings, 'DEBUG_LOG_SAMPLING', {})
+    return rates.get(category, rates.get('*', 1.0))
+
+
+def enabled(category=None):
+    """False when logging is off or the category is sampled out entirely."""
+    return bool(getattr(settings, 'DEBUG_LOG_PATH', '')) and _sample_rate(category) > 0
+
+
+class DebugLogWriter:
+    """Bounded queue drained by a background thread into a size-rotated file."""
+
+    def __init__(self, path, max_bytes, backup_count, queue_size):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, record):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='debug-log-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                pass
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        lines = ''.join(json.dumps(record, ensure_ascii=False, default=str) + '\n' for record in batch)
+        log_dir = os.path.dirname(self.path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) + len(lines) > self.max_bytes:
+            self._rotate()
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f'{self.path}.{i}'
+            if os.path.exists(source):
+                os.replace(source, f'{self.path}.{i + 1}')
+        if self.backup_count > 0:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+    def flush(self):
+        """Blocks until every queued record has been written."""
+        if self._thread is not None:
+            self._queue.join()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = DebugLogWriter(
+                    settings.DEBUG_LOG_PATH,
+                    max_bytes=getattr(settings, 'DEBUG_LOG_MAX_BYTES', 10 * 1024 * 1024),
+                    backup_count=getattr(settings, 'DEBUG_LOG_BACKUP_COUNT', 3),
+                    queue_size=getattr(settings, 'DEBUG_LOG_QUEUE_SIZE', 10000),
+                )
+    return _writer
+
+
+def log_debug(location, message, data, hypothesis_id=None):
+    """Enqueues one record; never blocks on I/O and never raises."""
+    if not getattr(settings, 'DEBUG_LOG_PATH', ''):
+        return
+    rate = _sample_rate(hypothesis_id)
+    if rate <= 0 or (rate < 1 and random.random() >= rate):
+        return
+    get_writer().put({
+        'sessionId': 'debug-session',
+        'runId': 'run1',
+        'hypothesisId': hypothesis_id,
+        'location': location,
+        'message': message,
+        'data': data,
+        'timestamp': int(time.time() * 1000),
+    })
@@ -0,0 +1,179 @@
+"""
+Streaming CSV exports of course trees, entries and computed summaries.
+
+iter_csv() returns a generator for StreamingHttpResponse (or a file, see
+the export_csv command). Courses are read in chunks of
+COURSE_CHUNK with .iterator(); each chunk costs one node query and one
+threshold query. Entries stream with a chunked .iterator() of their own.
+Summaries are evaluated per course with the cohort engine. Memory is
+bounded by one chunk of trees and one course's cohort, whatever the size
+of the export.
+
+The output is recomputable: courses.csv holds the full tree (node_id and
+parent_id, parents before children) plus the threshold, and entries.csv
+holds every input value keyed by those node ids, so the summaries can be
+recomputed from the two files alone. importer.parse_csv (and the
+import_catalog command) loads them back, with summaries.csv supplying
+the attendance masks.
+"""
+import csv
+from itertools import islice
+
+from . import summaries
+from .cohort import evaluate_cohort
+from .course_tree import get_compiled_trees
+from .models import CourseEnrollment, EnrollmentSummary, EvalEntry
+from .renderers import PlainTextErrorRenderer
+
+COURSE_CHUNK = 100
+ENTRY_CHUNK = 2000
+ROWS_PER_YIELD = 500
+
+COURSE_COLUMNS = (
+    'course_id', 'course_name', 'year', 'term', 'is_required', 'total_classes', 'target_enrollment_year',
+    'threshold', 'node_id', 'parent_id', 'node_path', 'node_name', 'weight', 'input_type', 'is_leaf',
+    'order', 'due_date',
+)
+ENTRY_VALUE_FIELDS = ('earned', 'max', 'rate', 'attended', 'total', 'adjustment', 'status')
+ENTRY_COLUMNS = ('course_id', 'course_name', 'node_id', 'node_path', 'username', *ENTRY_VALUE_FIELDS, 'updated_at')
+SUMMARY_COLUMNS = ('course_id', 'course_name', 'username', 'attendance_mask', *EnrollmentSummary.SUMMARY_FIELDS)
+
+
+class CSVRenderer(PlainTextErrorRenderer):
+    """Lets text/csv clients through content negotiation; only error bodies are rendered here."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer in generators."""
+
+    def write(self, value):
+        return value
+
+
+def _course_chunks(courses):
+    iterator = courses.order_by('pk').iterator(chunk_size=COURSE_CHUNK)
+    while True:
+        chunk = list(islice(iterator, COURSE_CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _pre_order(tree):
+    """Node positions with every parent before its children, siblings in order."""
+    stack = list(reversed(tree.roots))
+    while stack:
+        i = stack.pop()
+        yield i
+        stack.extend(reversed(tree.children[i]))
+
+
+def _node_paths(tree):
+    """{node_id: 'root/child/leaf'}"""
+    paths = {}
+    for i in _pre_order(tree):
+        parent = tree.parent_index[i]
+        name = tree.name[i]
+        paths[tree.node_ids[i]] = f'{paths[tree.node_ids[parent]]}/{name}' if parent >= 0 else name
+    return paths
+
+
+def _stream(header, rows):
+    """CSV text in blocks of ROWS_PER_YIELD rows, with a BOM so spreadsheet apps detect UTF-8."""
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(header)
+    block = []
+    for row in rows:
+        block.append(writer.writerow(row))
+        if len(block) >= ROWS_PER_YIELD:
+            yield ''.join(block)
+            block = []
+    if block:
+        yield ''.join(block)
+
+
+def _course_rows(courses):
+    for chunk in _course_chunks(courses):
+        trees = get_compiled_trees(chunk, store=False)
+        for course in chunk:
+            tree = trees[course.id]
+            head = (
+                course.id, course.name, course.year, course.term, course.is_required, course.total_classes,
+                course.target_enrollment_year, tree.threshold,
+            )
+            if not tree.roots:
+                yield head + ('',) * (len(COURSE_COLUMNS) - len(head))
+                continue
+            paths = _node_paths(tree)
+            for i in _pre_order(tree):
+                node_id = tree.node_ids[i]
+                parent = tree.parent_index[i]
+                yield head + (
+                    node_id, tree.node_ids[parent] if parent >= 0 else '', paths[node_id], tree.name[i],
+                    tree.weight[i], tree.input_type[i], tree.is_leaf[i], tree.order[i], tree.due_date[i] or '',
+                )
+
+
+def _entry_rows(courses, user):
+    for chunk in _course_chunks(courses):
+        trees = get_compiled_trees(chunk, store=False)
+        names = {course.id: course.name for course in chunk}
+        paths = {}
+        for tree in trees.values():
+            paths.update(_node_paths(tree))
+        entries = EvalEntry.objects.filter(node__course_id__in=names)
+        if user is not None:
+            entries = entries.filter(user=user)
+        entries = entries.order_by('node__course_id', 'user__username', 'node_id').values_list(
+            'node__course_id', 'node_id', 'user__username', *ENTRY_VALUE_FIELDS, 'updated_at',
+        )
+        for course_id, node_id, username, *values, updated_at in entries.iterator(chunk_size=ENTRY_CHUNK):
+            yield (course_id, names[course_id], node_id, paths.get(node_id, ''), username, *values, updated_at.isoformat())
+
+
+def _summary_rows(courses, user):
+    for chunk in _course_chunks(courses):
+        if user is not None:
+            enrollments = {
+                enrollment.course_id: enrollment
+                for enrollment in CourseEnrollment.objects.select_related('summary').filter(user=user, course__in=chunk)
+            }
+            enrolled = [course for course in chunk if course.id in enrollments]
+            computed = summaries.get_summaries(enrolled, user, enrollments)
+            for course in enrolled:
+                summary = computed[course.id]
+                yield (
+                    course.id, course.name, user.username, enrollments[course.id].attendance_mask,
+                    *(summary[field] for field in EnrollmentSummary.SUMMARY_FIELDS),
+                )
+            continue
+        for course in chunk:
+            cohort = evaluate_cohort(course)
+            for i in range(len(cohort)):
+                summary = cohort.summary(i)
+                yield (
+                    course.id, course.name, cohort.usernames[i], cohort.attendance_masks[i],
+                    *(summary[field] for field in EnrollmentSummary.SUMMARY_FIELDS),
+                )
+
+
+KINDS = ('courses', 'entries', 'summaries')
+
+
+def iter_csv(kind, courses, user=None):
+    """
+    CSV of the courses, streamed:
+        courses: one row per node (empty node columns for a course without a tree)
+        entries: one row per EvalEntry
+        summaries: one row per enrollment with its computed summary
+    With a user, entries and summaries are limited to that user's own rows.
+    """
+    if kind == 'courses':
+        return _stream(COURSE_COLUMNS, _course_rows(courses))
+    if kind == 'entries':
+        return _stream(ENTRY_COLUMNS, _entry_rows(courses, user))
+    if kind == 'summaries':
+        return _stream(SUMMARY_COLUMNS, _summary_rows(courses, user))
+    raise ValueError(f'unknown export: {kind}')
@@ -0,0 +1,86 @@
+"""
+iCalendar (RFC 5545) feed of dated evaluation nodes.
+
+iter_calendar() is a generator: it walks the event queryset with
+.iterator() and yields the feed a few events at a time, so memory stays
+flat however many events a student has. Every node is an all-day VEVENT
+whose UID is stable across downloads, so calendar apps update events in
+place instead of duplicating them.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .renderers import PlainTextErrorRenderer
+
+PRODID = '-//Rakutan Checker//Events//JA'
+CHUNK_EVENTS = 100
+ITERATOR_CHUNK_SIZE = 500
+
+
+class ICalendarRenderer(PlainTextErrorRenderer):
+    """Lets text/calendar clients through content negotiation; only error bodies are rendered here."""
+    media_type = 'text/calendar'
+    format = 'ics'
+
+
+def escape_text(value):
+    return (
+        str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """Folds a content line into 75-octet pieces without splitting a UTF-8 character."""
+    if len(line.encode('utf-8')) <= 75:
+        return line + '\r\n'
+    pieces = []
+    current, size, limit = [], 0, 75
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            pieces.append(''.join(current))
+            # Continuation lines start with a space, which counts towards the limit
+            current, size, limit = [], 0, 74
+        current.append(char)
+        size += width
+    pieces.append(''.join(current))
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def _event(node, dtstamp, host):
+    category = 'ATTENDANCE' if node.input_type == 'attendance' else 'ASSIGNMENT'
+    return ''.join(fold(line) for line in (
+        'BEGIN:VEVENT',
+        f'UID:evalnode-{node.pk}@{host}',
+        f'DTSTAMP:{dtstamp}',
+        f'DTSTART;VALUE=DATE:{node.due_date:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{node.due_date + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{escape_text(f"{node.course.name}: {node.name}")}',
+        f'DESCRIPTION:{escape_text(f"{node.course.name} / {node.name} ({node.weight}%)")}',
+        f'CATEGORIES:{category}',
+        'TRANSP:TRANSPARENT',
+        'END:VEVENT',
+    ))
+
+
+def iter_calendar(events, name, host):
+    """Yields the feed for an EvalNode queryset (with course selected) in chunks."""
+    dtstamp = timezone.now().strftime('%Y%m%dT%H%M%SZ')
+    yield ''.join(fold(line) for line in (
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(name)}',
+    ))
+    chunk = []
+    for node in events.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        chunk.append(_event(node, dtstamp, host))
+        if len(chunk) >= CHUNK_EVENTS:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append('END:VCALENDAR\r\n')
+    yield ''.join(chunk)
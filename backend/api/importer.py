@@ -0,0 +1,461 @@
+"""
+Bulk import of courses with their evaluation trees, enrollments and entries.
+
+Input is JSON with nested trees, or the CSV files written by exports.py:
+courses.csv, optionally entries.csv, and summaries.csv for attendance masks.
+course_id / node_id in those files are only references between them.
+
+Everything is parsed and validated in memory first, and usernames are
+resolved with one query. Each course is then written in its own transaction:
+- the course and its threshold;
+- the tree level by level, one bulk INSERT per depth, with the new parent
+  ids mapped onto the children;
+- enrollments and entries in bulk.
+bulk_create sends no signals, and a replaced tree is deleted with the
+per-node invalidation suppressed, so a replaced tree's version is bumped
+once and the course's summaries are rebuilt explicitly.
+"""
+import csv
+import io
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+
+from . import summaries
+from .course_tree import bump_tree_version
+from .models import Course, CourseEnrollment, EvalEntry, EvalNode, Threshold
+from .signals import suppress_tree_invalidation
+
+MODES = ('create', 'skip', 'replace')
+BATCH_SIZE = 2000
+MAX_ERRORS_PER_COURSE = 20
+
+TERMS = {choice for choice, _ in Course.Term.choices}
+INPUT_TYPES = {choice for choice, _ in EvalNode.InputType.choices}
+STATUSES = {choice for choice, _ in EvalEntry.Status.choices}
+ENTRY_NUMBERS = (('earned', float), ('max', float), ('rate', float), ('attended', int), ('total', int), ('adjustment', float))
+
+
+class ImportFormatError(ValueError):
+    """The input cannot be read at all (as opposed to invalid courses in it)."""
+
+
+# Parsing: JSON and CSV both become "specs", one dict per course with raw
+# values and a flat node list of {'ref', 'parent', ...}.
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _read_csv(text, name):
+    if isinstance(text, bytes):
+        try:
+            text = text.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ImportFormatError(f'{name}: not UTF-8')
+    return list(csv.DictReader(io.StringIO(text.lstrip('\ufeff'))))
+
+
+def parse_csv(courses_csv, entries_csv=None, summaries_csv=None):
+    """Specs from export_csv files (text or bytes). Returns (specs, errors)."""
+    specs = {}
+    errors = []
+    for line, row in enumerate(_read_csv(courses_csv, 'courses.csv'), start=2):
+        key = row.get('course_id') or (row.get('course_name'), row.get('year'), row.get('term'), row.get('target_enrollment_year'))
+        spec = specs.get(key)
+        if spec is None:
+            spec = specs[key] = {
+                'label': f"courses.csv line {line} ({row.get('course_name')})",
+                'name': row.get('course_name'),
+                **{field: row.get(field) for field in ('year', 'term', 'is_required', 'total_classes', 'target_enrollment_year', 'threshold')},
+                'nodes': [], 'entries': [], 'enrollments': [],
+            }
+        if _blank(row.get('node_id')) and _blank(row.get('node_name')):
+            continue
+        spec['nodes'].append({
+            'ref': row.get('node_id') or f'line {line}',
+            'parent': row.get('parent_id') or None,
+            'name': row.get('node_name'),
+            **{field: row.get(field) for field in ('weight', 'input_type', 'is_leaf', 'order', 'due_date')},
+        })
+
+    for name, text, target in (('entries.csv', entries_csv, 'entries'), ('summaries.csv', summaries_csv, 'enrollments')):
+        if text is None:
+            continue
+        for line, row in enumerate(_read_csv(text, name), start=2):
+            spec = specs.get(row.get('course_id'))
+            if spec is None:
+                errors.append(f"{name} line {line}: course_id {row.get('course_id')!r} is not in courses.csv")
+                continue
+            if target == 'entries':
+                spec['entries'].append({'node': row.get('node_id'), **row})
+            else:
+                spec['enrollments'].append({'username': row.get('username'), 'attendance_mask': row.get('attendance_mask')})
+    return list(specs.values()), errors
+
+
+def parse_json(data):
+    """
+    Specs from {"courses": [...]} (or a bare list). Each course has the Course
+    fields, "threshold", nested "nodes" (with "children"), and optionally
+    "enrollments" ({username, attendance_mask}) and "entries" ({username,
+    node: a node "id" or node_path: "Root/Child/Leaf", values...}).
+    Returns (specs, errors).
+    """
+    courses = data.get('courses') if isinstance(data, dict) else data
+    if not isinstance(courses, list):
+        raise ImportFormatError('expected a list of courses or {"courses": [...]}')
+    specs = []
+    errors = []
+    for n, course in enumerate(courses):
+        if not isinstance(course, dict):
+            errors.append(f'course #{n}: expected an object')
+            continue
+        nodes = []
+        paths = {}
+        stack = [(item, None, None, order) for order, item in reversed(list(enumerate(course.get('nodes') or [])))]
+        while stack:
+            item, parent, parent_path, order = stack.pop()
+            if not isinstance(item, dict):
+                errors.append(f'course #{n} ({course.get("name")}): every node must be an object')
+                continue
+            ref = f'#{len(nodes)}'
+            path = f"{parent_path}/{item.get('name')}" if parent_path else str(item.get('name'))
+            if item.get('id') is not None:
+                paths[str(item['id'])] = ref
+            paths.setdefault(path, ref)
+            nodes.append({
+                'ref': ref, 'parent': parent, 'name': item.get('name'),
+                'order': item.get('order', order),
+                'is_leaf': item.get('is_leaf', not item.get('children')),
+                **{field: item.get(field) for field in ('weight', 'input_type', 'due_date')},
+            })
+            children = item.get('children') or []
+            stack.extend((child, ref, path, k) for k, child in reversed(list(enumerate(children))))
+        entries = []
+        for entry in course.get('entries') or []:
+            if isinstance(entry, dict):
+                node = entry.get('node', entry.get('node_path'))
+                entries.append({**entry, 'node': paths.get(str(node), f'unknown node {node!r}')})
+        specs.append({
+            'label': f'course #{n} ({course.get("name")})',
+            **{field: course.get(field) for field in (
+                'name', 'year', 'term', 'is_required', 'total_classes', 'target_enrollment_year', 'threshold',
+            )},
+            'nodes': nodes,
+            'entries': entries,
+            'enrollments': [e for e in course.get('enrollments') or [] if isinstance(e, dict)],
+        })
+    return specs, errors
+
+
+# Validation
+
+def _int(value):
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError
+        return int(value)
+    return int(value)
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('true', '1', 'yes')
+
+
+def _date(value):
+    return value if isinstance(value, date) else date.fromisoformat(str(value).strip())
+
+
+class _Cleaner:
+    """Collects the errors of one course while converting its values."""
+
+    def __init__(self, label):
+        self.label = label
+        self.errors = []
+
+    def error(self, message):
+        if len(self.errors) < MAX_ERRORS_PER_COURSE:
+            self.errors.append(f'{self.label}: {message}')
+
+    def value(self, source, field, convert, default=None, required=False, where=''):
+        raw = source.get(field)
+        if _blank(raw):
+            if required:
+                self.error(f'{where}{field} is required')
+            return default
+        try:
+            return convert(raw)
+        except (TypeError, ValueError):
+            self.error(f'{where}{field} {raw!r} is invalid')
+            return default
+
+
+def _clean_nodes(cleaner, specs):
+    """Node specs -> (levels: [[node]], leaf refs). Each level lists nodes whose parents are in earlier levels."""
+    nodes = {}
+    for spec in specs:
+        ref = str(spec['ref'])
+        where = f'node {spec.get("name")!r}: '
+        if ref in nodes:
+            cleaner.error(f'{where}duplicate node_id {ref}')
+            continue
+        name = spec.get('name')
+        if _blank(name) or len(str(name)) > 255:
+            cleaner.error(f'{where}name must be 1-255 characters')
+        weight = cleaner.value(spec, 'weight', float, required=True, where=where)
+        if weight is not None and weight < 0:
+            cleaner.error(f'{where}weight must not be negative')
+        input_type = spec.get('input_type') or EvalNode.InputType.NONE
+        if input_type not in INPUT_TYPES:
+            cleaner.error(f'{where}input_type {input_type!r} is invalid')
+        nodes[ref] = {
+            'ref': ref,
+            'parent': None if _blank(spec.get('parent')) else str(spec['parent']),
+            'name': str(name or '').strip(),
+            'weight': weight,
+            'input_type': input_type,
+            'is_leaf': cleaner.value(spec, 'is_leaf', _bool),
+            'order': cleaner.value(spec, 'order', _int, default=0, where=where),
+            'due_date': cleaner.value(spec, 'due_date', _date, where=where),
+        }
+
+    has_children = set()
+    for node in nodes.values():
+        if node['parent'] is not None:
+            if node['parent'] not in nodes:
+                cleaner.error(f"node {node['name']!r}: parent {node['parent']} does not exist")
+                continue
+            has_children.add(node['parent'])
+    depth = {}
+    for ref in nodes:
+        chain = []
+        current = ref
+        while current is not None and current not in depth and current in nodes:
+            chain.append(current)
+            if len(chain) > len(nodes):
+                cleaner.error(f"node {nodes[ref]['name']!r}: parents form a cycle")
+                return [], set()
+            current = nodes[current]['parent']
+        base = depth.get(current, -1) if current is not None else -1
+        for k, item in enumerate(reversed(chain)):
+            depth[item] = base + 1 + k
+
+    for node in nodes.values():
+        if node['is_leaf'] is None:
+            node['is_leaf'] = node['ref'] not in has_children
+        elif node['is_leaf'] and node['ref'] in has_children:
+            cleaner.error(f"node {node['name']!r}: a leaf cannot have children")
+    levels = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+    for ref, node in nodes.items():
+        levels[depth[ref]].append(node)
+    return levels, {ref for ref, node in nodes.items() if node['is_leaf']}
+
+
+def clean_course(spec, user_ids):
+    """Validated course dict, or (None, errors)."""
+    cleaner = _Cleaner(spec.get('label', spec.get('name')))
+    name = spec.get('name')
+    if _blank(name) or len(str(name)) > 255:
+        cleaner.error('name must be 1-255 characters')
+    term = spec.get('term')
+    if term not in TERMS:
+        cleaner.error(f'term {term!r} is invalid (one of {", ".join(sorted(TERMS))})')
+    fields = {
+        'name': str(name or '').strip(),
+        'year': cleaner.value(spec, 'year', _int, required=True),
+        'term': term,
+        'target_enrollment_year': cleaner.value(spec, 'target_enrollment_year', _int, required=True),
+        'is_required': cleaner.value(spec, 'is_required', _bool, default=False),
+        'total_classes': cleaner.value(spec, 'total_classes', _int, default=15),
+    }
+    if fields['total_classes'] is not None and not 1 <= fields['total_classes'] <= 63:
+        cleaner.error('total_classes must be between 1 and 63 (the attendance bit mask)')
+    threshold = cleaner.value(spec, 'threshold', float, default=60.0)
+    if threshold is not None and not 0 <= threshold <= 100:
+        cleaner.error('threshold must be between 0 and 100')
+
+    levels, leaves = _clean_nodes(cleaner, spec.get('nodes', []))
+
+    entries = {}
+    for item in spec.get('entries', []):
+        username = item.get('username')
+        where = f'entry of {username!r}: '
+        if username not in user_ids:
+            cleaner.error(f'{where}unknown user')
+            continue
+        node = str(item.get('node'))
+        if node not in leaves:
+            cleaner.error(f'{where}node {node} is not a leaf of this course')
+            continue
+        values = {field: cleaner.value(item, field, convert, where=where) for field, convert in ENTRY_NUMBERS}
+        if values['adjustment'] is None:
+            values['adjustment'] = 0.0
+        status = item.get('status') or EvalEntry.Status.PENDING
+        if status not in STATUSES:
+            cleaner.error(f'{where}status {status!r} is invalid')
+        # A later row for the same (user, node) wins, like the bulk entry endpoint.
+        entries[(user_ids[username], node)] = {**values, 'status': status}
+
+    masks = {}
+    for item in spec.get('enrollments', []):
+        username = item.get('username')
+        if username not in user_ids:
+            cleaner.error(f'enrollment of {username!r}: unknown user')
+            continue
+        masks[user_ids[username]] = cleaner.value(item, 'attendance_mask', _int, default=0, where=f'enrollment of {username!r}: ')
+
+    if cleaner.errors:
+        return None, cleaner.errors
+    return {
+        'label': cleaner.label,
+        'fields': fields,
+        'threshold': threshold,
+        'levels': levels,
+        'entries': entries,
+        'masks': masks,
+    }, []
+
+
+# Writing
+
+def _write_course(course_data, mode):
+    """Writes one validated course in its own transaction. Returns (outcome, row counts)."""
+    fields = course_data['fields']
+    counts = {'nodes': 0, 'enrollments': 0, 'entries': 0}
+    with transaction.atomic():
+        course = Course.objects.filter(
+            name=fields['name'], year=fields['year'], term=fields['term'],
+            target_enrollment_year=fields['target_enrollment_year'],
+        ).select_for_update().first()
+        if course is None:
+            outcome = 'created'
+            course = Course.objects.create(**fields)
+            Threshold.objects.bulk_create([Threshold(course=course, value=course_data['threshold'])])
+        elif mode == 'skip':
+            return 'skipped', counts
+        elif mode == 'create':
+            return 'exists', counts
+        else:
+            outcome = 'replaced'
+            for field, value in fields.items():
+                setattr(course, field, value)
+            course.save()
+            with suppress_tree_invalidation():
+                course.nodes.all().delete()
+                Threshold.objects.update_or_create(course=course, defaults={'value': course_data['threshold']})
+
+        node_ids = {}
+        for level in course_data['levels']:
+            created = EvalNode.objects.bulk_create([
+                EvalNode(
+                    course=course, parent_id=node_ids.get(node['parent']), name=node['name'],
+                    weight=node['weight'], input_type=node['input_type'], is_leaf=node['is_leaf'],
+                    order=node['order'], due_date=node['due_date'],
+                )
+                for node in level
+            ], batch_size=BATCH_SIZE)
+            for node, obj in zip(level, created):
+                node_ids[node['ref']] = obj.pk
+            counts['nodes'] += len(created)
+
+        masks = course_data['masks']
+        if masks:
+            CourseEnrollment.objects.bulk_create(
+                [CourseEnrollment(user_id=user_id, course=course, attendance_mask=mask) for user_id, mask in masks.items()],
+                batch_size=BATCH_SIZE, update_conflicts=True, unique_fields=['user', 'course'], update_fields=['attendance_mask'],
+            )
+        entry_users = {user_id for user_id, _ in course_data['entries']} - set(masks)
+        if entry_users:
+            # Entries imply an enrollment; keep the attendance of existing ones.
+            CourseEnrollment.objects.bulk_create(
+                [CourseEnrollment(user_id=user_id, course=course) for user_id in entry_users],
+                batch_size=BATCH_SIZE, ignore_conflicts=True,
+            )
+        counts['enrollments'] = len(masks) + len(entry_users)
+
+        EvalEntry.objects.bulk_create([
+            EvalEntry(user_id=user_id, node_id=node_ids[ref], **values)
+            for (user_id, ref), values in course_data['entries'].items()
+        ], batch_size=BATCH_SIZE)
+        counts['entries'] = len(course_data['entries'])
+
+        if outcome == 'replaced':
+            bump_tree_version(course.pk)
+            course.refresh_from_db(fields=['tree_version'])
+        if outcome == 'replaced' or counts['enrollments']:
+            summaries.rebuild([course])
+    return outcome, counts
+
+
+def import_courses(specs, mode='create', dry_run=False, errors=()):
+    """
+    Validates every spec, then writes the valid ones course by course.
+    mode: what to do with a course whose (name, year, term,
+    target_enrollment_year) already exists: 'create' reports it as an error,
+    'skip' leaves it alone, 'replace' rebuilds its tree (existing entries of
+    the old nodes are deleted) and upserts the imported enrollments.
+    Returns a report dict with counts, errors and throughput.
+    """
+    if mode not in MODES:
+        raise ValueError(f'mode must be one of {", ".join(MODES)}')
+    start = time.perf_counter()
+    report = {
+        'created': 0, 'replaced': 0, 'skipped': 0, 'failed': 0,
+        'nodes': 0, 'enrollments': 0, 'entries': 0,
+        'errors': list(errors), 'dry_run': dry_run,
+    }
+    usernames = {
+        item.get('username') for spec in specs
+        for item in (*spec.get('entries', []), *spec.get('enrollments', []))
+    }
+    user_ids = dict(get_user_model().objects.filter(username__in=usernames).values_list('username', 'id'))
+
+    valid = []
+    seen = set()
+    for spec in specs:
+        course_data, course_errors = clean_course(spec, user_ids)
+        if course_data is not None:
+            fields = course_data['fields']
+            key = (fields['name'], fields['year'], fields['term'], fields['target_enrollment_year'])
+            if key in seen:
+                course_errors = [f"{course_data['label']}: the same course appears more than once"]
+                course_data = None
+            seen.add(key)
+        if course_data is None:
+            report['failed'] += 1
+            report['errors'].extend(course_errors)
+        else:
+            valid.append(course_data)
+
+    if not dry_run:
+        for course_data in valid:
+            try:
+                outcome, counts = _write_course(course_data, mode)
+            except IntegrityError as e:
+                outcome, counts = 'failed', {}
+                report['errors'].append(f"{course_data['label']}: {e}")
+            if outcome == 'exists':
+                report['failed'] += 1
+                report['errors'].append(f"{course_data['label']}: course already exists (use mode skip or replace)")
+                continue
+            if outcome == 'failed':
+                report['failed'] += 1
+                continue
+            report[outcome] += 1
+            for key, value in counts.items():
+                report[key] += value
+    else:
+        report['valid'] = len(valid)
+
+    seconds = time.perf_counter() - start
+    rows = report['created'] + report['replaced'] + report['nodes'] + report['enrollments'] + report['entries']
+    report['seconds'] = round(seconds, 3)
+    report['rows_per_second'] = round(rows / seconds) if seconds > 0 else None
+    return report
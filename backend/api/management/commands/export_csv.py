@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api import exports
+from api.models import Course
+from api.selectors import filter_courses
+
+
+class Command(BaseCommand):
+    help = '評価ツリー・入力値・成績サマリーをCSVで出力します（import_catalogで再読込可能）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=exports.KINDS, help='courses: 評価ツリー, entries: 入力値, summaries: 成績サマリー')
+        parser.add_argument('--course', type=int, help='対象の科目ID')
+        parser.add_argument('--year', type=int, help='開講年度で絞り込み')
+        parser.add_argument('--term', choices=[choice for choice, _ in Course.Term.choices], help='学期で絞り込み')
+        parser.add_argument('--enrollment-year', type=int, help='対象入学年で絞り込み')
+        parser.add_argument('-o', '--output', help='出力先ファイル（省略時は標準出力）')
+
+    def handle(self, *args, **options):
+        courses = filter_courses(Course.objects.all(), options)
+        stream = exports.iter_csv(options['kind'], courses)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                for block in stream:
+                    f.write(block)
+        else:
+            for block in stream:
+                self.stdout.write(block, ending='')
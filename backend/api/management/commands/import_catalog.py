@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import importer
+
+
+class Command(BaseCommand):
+    help = '科目・評価ツリー・履修登録・入力値をJSONまたはCSV（export_csvの出力）から一括登録します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='courses.csv または JSONファイル')
+        parser.add_argument('--entries', help='entries.csv（CSV入力時のみ）')
+        parser.add_argument('--summaries', help='summaries.csv（出席記録の読込元、CSV入力時のみ）')
+        parser.add_argument('--mode', choices=importer.MODES, default='create', help='既存科目の扱い: create=エラー, skip=スキップ, replace=ツリーを置換')
+        parser.add_argument('--dry-run', action='store_true', help='検証のみ行い書き込まない')
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError as e:
+            raise CommandError(str(e))
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'].endswith('.json'):
+                specs, errors = importer.parse_json(json.loads(self._read(options['path'])))
+            else:
+                specs, errors = importer.parse_csv(
+                    self._read(options['path']),
+                    self._read(options['entries']) if options['entries'] else None,
+                    self._read(options['summaries']) if options['summaries'] else None,
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = importer.import_courses(specs, mode=options['mode'], dry_run=options['dry_run'], errors=errors)
+        for error in report['errors']:
+            self.stderr.write(error)
+        if report['dry_run']:
+            self.stdout.write(f"{report['valid']} valid, {report['failed']} invalid courses (dry run)")
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"courses: {report['created']} created, {report['replaced']} replaced, {report['skipped']} skipped, "
+                f"{report['failed']} failed; {report['nodes']} nodes, {report['enrollments']} enrollments, "
+                f"{report['entries']} entries in {report['seconds']:.2f} s ({report['rows_per_second']} rows/s)"
+            ))
+        if report['failed']:
+            raise CommandError(f"{report['failed']} courses were not imported")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from api import summaries
+from api.models import Course, CourseEnrollment, EnrollmentSummary
+
+
+class Command(BaseCommand):
+    help = '成績サマリー（EnrollmentSummary）を一括で再計算します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', help='対象の科目ID（複数指定可）')
+        parser.add_argument('--enrollment-year', type=int, help='対象入学年で絞り込み')
+        parser.add_argument('--stale-only', action='store_true', help='古くなった行・未作成の行を持つ科目のみ再計算')
+
+    def handle(self, *args, **options):
+        courses = Course.objects.all()
+        if options['course']:
+            courses = courses.filter(pk__in=options['course'])
+        if options['enrollment_year'] is not None:
+            courses = courses.filter(target_enrollment_year=options['enrollment_year'])
+        if options['stale_only']:
+            # Rows that EnrollmentSummary.is_fresh_for rejects, and enrollments without a row
+            stale = EnrollmentSummary.objects.filter(Q(is_stale=True) | ~Q(tree_version=F('course__tree_version')))
+            missing = CourseEnrollment.objects.filter(summary__isnull=True)
+            courses = courses.filter(Q(pk__in=stale.values('course_id')) | Q(pk__in=missing.values('course_id')))
+
+        written = summaries.rebuild(courses.iterator(chunk_size=200))
+        self.stdout.write(self.style.SUCCESS(f'{written} summaries rebuilt'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Course
+from api.rollover import duplicate_courses
+from api.selectors import filter_courses
+
+
+class Command(BaseCommand):
+    help = '科目・閾値・評価ツリーを翌年度（以降）へ一括複製します（既に存在する科目はスキップ）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True, help='複製元の開講年度')
+        parser.add_argument('--course', type=int, help='対象の科目ID')
+        parser.add_argument('--term', choices=[choice for choice, _ in Course.Term.choices], help='学期で絞り込み')
+        parser.add_argument('--enrollment-year', type=int, help='対象入学年で絞り込み')
+        parser.add_argument('--years', type=int, default=1, help='何年後へ複製するか（開講年度・対象入学年・締切日をずらす）')
+        parser.add_argument('--keep-due-dates', action='store_true', help='締切日をずらさない')
+        parser.add_argument('--dry-run', action='store_true', help='件数の確認のみ行い書き込まない')
+
+    def handle(self, *args, **options):
+        courses = filter_courses(Course.objects.all(), options)
+        report = duplicate_courses(
+            courses, years=options['years'], shift_due_dates=not options['keep_due_dates'], dry_run=options['dry_run'],
+        )
+        suffix = ' (dry run)' if report['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['created']} courses ({report['nodes']} nodes) duplicated, "
+            f"{report['skipped']} already existed, in {report['seconds']:.2f} s{suffix}"
+        ))
@@ -0,0 +1,28 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema_status import get_schema_status
+
+
+class Command(BaseCommand):
+    help = 'データベースのスキーマとマイグレーションの状態を表示します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='JSON形式で出力')
+        parser.add_argument('--check', action='store_true', help='未適用のマイグレーションがあれば終了コード1で終了')
+
+    def handle(self, *args, **options):
+        status = get_schema_status()
+        if options['json']:
+            self.stdout.write(json.dumps(status, ensure_ascii=False, indent=2))
+        else:
+            self.stdout.write(f"database: {status['vendor']} {status['database']}")
+            self.stdout.write(f"api_course: {'ok' if status['api_course_exists'] else 'missing'} ({len(status['api_course_columns'])} columns)")
+            self.stdout.write(f"applied migrations: {len(status['applied'])}")
+            for name in status['pending']:
+                self.stdout.write(self.style.WARNING(f'pending: {name}'))
+            if status['ok']:
+                self.stdout.write(self.style.SUCCESS('schema is up to date'))
+        if options['check'] and not status['ok']:
+            raise CommandError('schema is not up to date')
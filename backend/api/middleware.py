@@ -0,0 +1,152 @@
+"""
+Per-request performance instrumentation.
+
+PerformanceMiddleware records, for every request, the number of queries,
+the DB time, the view time and the render (response serialization) time.
+They are sent back in a Server-Timing header and aggregated into
+process-local histograms per route name (e.g. course-summary), which staff
+can scrape from /api/metrics/ in Prometheus text format.
+
+When PERFORMANCE_METRICS_ENABLED is off the middleware raises
+MiddlewareNotUsed, so Django drops it from the chain entirely.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = (
+    # name, help, buckets
+    ('rakutan_request_duration_seconds', 'Total request time.', SECONDS_BUCKETS),
+    ('rakutan_request_db_seconds', 'Time spent in SQL queries.', SECONDS_BUCKETS),
+    ('rakutan_request_view_seconds', 'Time spent in the view, including serializer .data.', SECONDS_BUCKETS),
+    ('rakutan_request_render_seconds', 'Time spent rendering the response body.', SECONDS_BUCKETS),
+    ('rakutan_request_queries', 'SQL queries per request.', QUERY_BUCKETS),
+)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Thread-safe {(metric, route): Histogram} for one process."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, values):
+        """values: {metric name: observation}"""
+        with self._lock:
+            for name, _, buckets in HISTOGRAMS:
+                histogram = self._histograms.get((name, route))
+                if histogram is None:
+                    histogram = self._histograms[(name, route)] = Histogram(buckets)
+                histogram.observe(values[name])
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, help_text, _ in HISTOGRAMS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, route), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{route="{route}"}} {histogram.sum:.6f}')
+                    lines.append(f'{name}_count{{route="{route}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class _RequestTimings:
+    __slots__ = ('queries', 'db', 'view_start', 'view_end')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.view_start = None
+        self.view_end = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+
+class PerformanceMiddleware:
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFORMANCE_METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request._performance_timings = _RequestTimings()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timings):
+            response = self.get_response(request)
+        end = time.perf_counter()
+
+        view_end = timings.view_end or end
+        view = view_end - timings.view_start if timings.view_start else 0.0
+        # DRF responses are rendered after process_template_response; plain
+        # HttpResponses are already serialized when the view returns.
+        render = end - timings.view_end if timings.view_end else 0.0
+        total = end - start
+
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"',
+            f'view;dur={view * 1000:.1f}',
+            f'render;dur={render * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ))
+        match = request.resolver_match
+        route = (match.url_name or match.view_name) if match else 'unmatched'
+        registry.observe(route, {
+            'rakutan_request_duration_seconds': total,
+            'rakutan_request_db_seconds': timings.db,
+            'rakutan_request_view_seconds': view,
+            'rakutan_request_render_seconds': render,
+            'rakutan_request_queries': timings.queries,
+        })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._performance_timings.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._performance_timings.view_end = time.perf_counter()
+        return response
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_course_enrollment_and_target_year'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='course',
+            options={'ordering': ['-year', 'term', 'name']},
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='tree_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='評価ツリー・閾値の変更ごとに増加するバージョン'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='is_required',
+            field=models.BooleanField(default=False, verbose_name='必修科目'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='name',
+            field=models.CharField(max_length=255, verbose_name='科目名'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='term',
+            field=models.CharField(choices=[('early', '前期'), ('late', '後期'), ('full_year', '通年')], max_length=20, verbose_name='学期'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='total_classes',
+            field=models.IntegerField(default=15, verbose_name='総授業回数'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='year',
+            field=models.IntegerField(help_text='例: 2024', verbose_name='開講年度'),
+        ),
+    ]
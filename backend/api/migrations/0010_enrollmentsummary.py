@@ -0,0 +1,45 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_course_tree_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnrollmentSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('current_score', models.FloatField(default=0.0)),
+                ('predicted_score', models.FloatField(default=0.0)),
+                ('max_score', models.FloatField(default=0.0)),
+                ('deficit', models.FloatField(default=0.0)),
+                ('is_fail_predicted', models.BooleanField(default=False)),
+                ('is_certain_fail', models.BooleanField(default=False)),
+                ('attendance_rate', models.FloatField(default=0.0)),
+                ('current_attended', models.IntegerField(default=0)),
+                ('attendance_threshold', models.FloatField(default=66.67)),
+                ('is_attendance_fail', models.BooleanField(default=False)),
+                ('is_attendance_safe', models.BooleanField(default=False)),
+                ('threshold', models.FloatField(default=60.0)),
+                ('tree_version', models.PositiveIntegerField(default=0)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.course')),
+                ('enrollment', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='api.courseenrollment')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '成績サマリー',
+                'verbose_name_plural': '成績サマリー',
+                'indexes': [models.Index(fields=['course', '-deficit'], name='summary_course_deficit_idx'), models.Index(fields=['user', '-deficit'], name='summary_user_deficit_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.10 on 2026-10-18 08:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_enrollmentsummary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('current_sum', models.FloatField(default=0.0)),
+                ('current_weight', models.FloatField(default=0.0)),
+                ('current_count', models.IntegerField(default=0)),
+                ('predicted_sum', models.FloatField(default=0.0)),
+                ('predicted_weight', models.FloatField(default=0.0)),
+                ('max_sum', models.FloatField(default=0.0)),
+                ('max_weight', models.FloatField(default=0.0)),
+                ('tree_version', models.PositiveIntegerField(default=0)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aggregates', to='api.evalnode')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'node')},
+            },
+        ),
+    ]
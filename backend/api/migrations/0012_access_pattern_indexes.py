@@ -0,0 +1,25 @@
+# Generated by Django 5.2.10 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_nodeaggregate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['target_enrollment_year', '-year', 'term', 'name'], name='course_target_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evalnode',
+            index=models.Index(fields=['course', 'parent', 'order'], name='evalnode_course_parent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='evalnode',
+            index=models.Index(condition=models.Q(('due_date__isnull', False)), fields=['course', 'due_date'], name='evalnode_course_due_idx'),
+        ),
+    ]
@@ -22,12 +22,21 @@ class Course(models.Model):
         verbose_name=_('対象入学年'),
         help_text=_('この科目を履修する学生の入学年（例: 2024年入学生向け）')
     )
+    tree_version = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text=_('評価ツリー・閾値の変更ごとに増加するバージョン')
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['name', 'year', 'term', 'target_enrollment_year']
         ordering = ['-year', 'term', 'name']
+        indexes = [
+            # Course list of a student: filter by enrollment year in list order
+            models.Index(fields=['target_enrollment_year', '-year', 'term', 'name'], name='course_target_year_idx'),
+        ]
 
     def __str__(self):
         return f"{self.year} {self.get_term_display()} - {self.name} ({self.target_enrollment_year}年入学)"
@@ -84,6 +93,16 @@ class EvalNode(models.Model):
 
     class Meta:
         ordering = ['order']
+        indexes = [
+            # Tree loads (course) and children lookups (course, parent), in order
+            models.Index(fields=['course', 'parent', 'order'], name='evalnode_course_parent_idx'),
+            # Events: dated nodes of a course by due date
+            models.Index(
+                fields=['course', 'due_date'],
+                name='evalnode_course_due_idx',
+                condition=models.Q(due_date__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.course.name} - {self.name}"
@@ -132,3 +151,79 @@ class Threshold(models.Model):
 
     def __str__(self):
         return f"{self.course.name} Threshold: {self.value}"
+
+
+class EnrollmentSummary(models.Model):
+    """
+    Materialized CalculationService summary of one enrollment.
+    Refreshed on writes (see signals.py); stale rows are recomputed on read.
+    """
+    SUMMARY_FIELDS = (
+        'current_score', 'predicted_score', 'max_score', 'deficit',
+        'is_fail_predicted', 'is_certain_fail', 'attendance_rate', 'current_attended',
+        'attendance_threshold', 'is_attendance_fail', 'is_attendance_safe', 'threshold',
+    )
+
+    enrollment = models.OneToOneField(CourseEnrollment, on_delete=models.CASCADE, related_name='summary')
+    # Denormalized from enrollment for indexed ranking reads
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+
+    current_score = models.FloatField(default=0.0)
+    predicted_score = models.FloatField(default=0.0)
+    max_score = models.FloatField(default=0.0)
+    deficit = models.FloatField(default=0.0)
+    is_fail_predicted = models.BooleanField(default=False)
+    is_certain_fail = models.BooleanField(default=False)
+    attendance_rate = models.FloatField(default=0.0)
+    current_attended = models.IntegerField(default=0)
+    attendance_threshold = models.FloatField(default=66.67)
+    is_attendance_fail = models.BooleanField(default=False)
+    is_attendance_safe = models.BooleanField(default=False)
+    threshold = models.FloatField(default=60.0)
+
+    tree_version = models.PositiveIntegerField(default=0)
+    is_stale = models.BooleanField(default=False)
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = _('成績サマリー')
+        verbose_name_plural = _('成績サマリー')
+        indexes = [
+            models.Index(fields=['course', '-deficit'], name='summary_course_deficit_idx'),
+            models.Index(fields=['user', '-deficit'], name='summary_user_deficit_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.enrollment_id}: {self.predicted_score}"
+
+    def is_fresh_for(self, course):
+        return not self.is_stale and self.tree_version == course.tree_version
+
+    def as_summary(self):
+        return {field: getattr(self, field) for field in self.SUMMARY_FIELDS}
+
+
+class NodeAggregate(models.Model):
+    """
+    Cached weighted sums of a node's children, per user, for the three score modes.
+    A leaf is stored as one pseudo-child of weight 1 (see aggregates.py).
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    node = models.ForeignKey(EvalNode, on_delete=models.CASCADE, related_name='aggregates')
+
+    current_sum = models.FloatField(default=0.0)
+    current_weight = models.FloatField(default=0.0)
+    current_count = models.IntegerField(default=0)
+    predicted_sum = models.FloatField(default=0.0)
+    predicted_weight = models.FloatField(default=0.0)
+    max_sum = models.FloatField(default=0.0)
+    max_weight = models.FloatField(default=0.0)
+
+    tree_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'node')
+
+    def __str__(self):
+        return f"{self.user_id} - {self.node_id}"
@@ -0,0 +1,29 @@
+"""
+Cursor pagination for the list endpoints.
+
+Lists are always returned a page at a time as {next, previous, results}:
+page_size rows by default, up to max_page_size with ?page_size=, so no
+response grows with the catalog. Clients follow the next links (see
+getAll in frontend/src/api.ts). Cursors are taken on each model's stable
+ordering, so pages stay consistent while rows are added.
+"""
+from rest_framework.pagination import CursorPagination
+
+
+class ListCursorPagination(CursorPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+
+class CoursePagination(ListCursorPagination):
+    # Course.Meta.ordering with id as the tie-breaker
+    ordering = ('-year', 'term', 'name', 'id')
+
+
+class EventPagination(ListCursorPagination):
+    ordering = ('due_date', 'id')
@@ -0,0 +1,100 @@
+"""
+Risk ranking (危険度ランキング) over materialized enrollment summaries.
+
+Candidates are streamed as (is_certain_fail, deficit, enrollment_id) tuples
+and the top k = offset + limit are selected with a heap, so only the rows
+of the returned page are ever loaded as objects. Courses whose rows are
+stale or missing are evaluated in memory with the cohort engine instead.
+"""
+import heapq
+from itertools import chain
+
+from django.db.models import F, Q
+
+from .cohort import evaluate_cohort
+from .models import Course, CourseEnrollment, EnrollmentSummary
+
+
+def _rank_key(candidate):
+    is_certain_fail, deficit, enrollment_id = candidate
+    # Certain fails first, then the largest deficit; ties keep enrollment order.
+    return is_certain_fail, deficit, -enrollment_id
+
+
+class _Counter:
+    def __init__(self, iterable):
+        self.count = 0
+        self._iterable = iterable
+
+    def __iter__(self):
+        for item in self._iterable:
+            self.count += 1
+            yield item
+
+
+def rank(enrollment_filter, offset=0, limit=20):
+    """
+    Ranks the enrollments matching enrollment_filter by is_certain_fail, then
+    deficit. The filter may only use the user and course relations, which
+    CourseEnrollment and EnrollmentSummary share.
+
+    Returns (count, results) where results are dicts for ranks offset+1..offset+limit.
+    """
+    enrollments = CourseEnrollment.objects.filter(enrollment_filter)
+    rows = EnrollmentSummary.objects.filter(enrollment_filter)
+
+    live_course_ids = set(
+        rows.filter(Q(is_stale=True) | ~Q(tree_version=F('course__tree_version')))
+        .values_list('course_id', flat=True)
+        .distinct()
+    )
+    live_course_ids.update(
+        enrollments.filter(summary__isnull=True).values_list('course_id', flat=True).distinct()
+    )
+
+    live = {}
+
+    def live_candidates():
+        scoped = set(enrollments.filter(course_id__in=live_course_ids).values_list('id', flat=True))
+        for course in Course.objects.filter(pk__in=live_course_ids):
+            cohort = evaluate_cohort(course)
+            deficit = cohort.deficit
+            is_certain_fail = cohort.is_certain_fail
+            for i, enrollment_id in enumerate(cohort.enrollment_ids.tolist()):
+                if enrollment_id in scoped:
+                    live[enrollment_id] = (cohort, i)
+                    yield bool(is_certain_fail[i]), round(float(deficit[i]), 2), enrollment_id
+
+    fresh = (
+        rows.exclude(course_id__in=live_course_ids)
+        .values_list('is_certain_fail', 'deficit', 'enrollment_id')
+        .iterator(chunk_size=2000)
+    )
+    candidates = _Counter(chain(fresh, live_candidates()))
+    top = heapq.nlargest(offset + limit, candidates, key=_rank_key)[offset:]
+
+    page_ids = [enrollment_id for _, _, enrollment_id in top]
+    loaded = {
+        enrollment.id: enrollment
+        for enrollment in CourseEnrollment.objects.filter(pk__in=page_ids)
+        .select_related('user', 'course', 'summary')
+    }
+    results = []
+    for position, enrollment_id in enumerate(page_ids, start=offset + 1):
+        enrollment = loaded[enrollment_id]
+        if enrollment_id in live:
+            cohort, i = live[enrollment_id]
+            summary = cohort.summary(i)
+        else:
+            summary = enrollment.summary.as_summary()
+        results.append({
+            'rank': position,
+            'user_id': enrollment.user_id,
+            'username': enrollment.user.username,
+            'course_id': enrollment.course_id,
+            'course_name': enrollment.course.name,
+            'term': enrollment.course.term,
+            'is_required': enrollment.course.is_required,
+            'summary': summary,
+        })
+    return candidates.count, results
@@ -0,0 +1,18 @@
+"""
+Renderers for streamed, non-JSON downloads.
+
+The views stream their bodies themselves (StreamingHttpResponse); a
+renderer only has to let the media type through content negotiation and
+render the error responses DRF produces for it as plain text.
+"""
+from rest_framework import renderers
+
+
+class PlainTextErrorRenderer(renderers.BaseRenderer):
+    """Base class: subclasses set media_type and format."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data).encode(self.charset)
@@ -0,0 +1,125 @@
+"""
+Year rollover: duplicate courses with their thresholds and evaluation trees.
+
+duplicate_courses() reads the source courses, the copies that already
+exist, the thresholds and the nodes with one query each. It then writes,
+in one transaction, one bulk INSERT for the new courses, one for their
+thresholds and one per tree depth for the nodes, split only where
+BATCH_SIZE or the backend's parameter limit requires it. Each parent is
+remapped to the copy created one level up. The cost is O(depth)
+statements however many courses roll over. Enrollments, entries and
+summaries are not copied. bulk_create sends no signals, but new courses
+start at tree_version 0 with nothing cached or materialized, so there is
+nothing to invalidate.
+"""
+import time
+from datetime import date
+
+from django.db import transaction
+
+from .models import Course, EvalNode, Threshold
+
+BATCH_SIZE = 2000
+COURSE_FIELDS = ('name', 'term', 'is_required', 'total_classes')
+NODE_FIELDS = ('id', 'course_id', 'parent_id', 'name', 'weight', 'input_type', 'is_leaf', 'order', 'due_date')
+
+
+def _shift_date(value, years):
+    if value is None:
+        return None
+    try:
+        return value.replace(year=value.year + years)
+    except ValueError:
+        # 29 February in a non-leap target year
+        return date(value.year + years, 2, 28)
+
+
+def _levels(rows):
+    """Node rows grouped by depth: every parent is in an earlier level than its children."""
+    parent_of = {row[0]: row[2] for row in rows}
+    depth = {}
+    for node_id in parent_of:
+        chain = []
+        current = node_id
+        while current is not None and current not in depth:
+            chain.append(current)
+            current = parent_of.get(current)
+        base = depth[current] if current is not None else -1
+        for k, item in enumerate(reversed(chain)):
+            depth[item] = base + 1 + k
+    levels = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+    for row in rows:
+        levels[depth[row[0]]].append(row)
+    return levels
+
+
+def duplicate_courses(courses, years=1, shift_due_dates=True, dry_run=False):
+    """
+    Copies courses `years` years ahead: year and target_enrollment_year both
+    move by `years`, and so do due dates unless shift_due_dates=False.
+    Courses whose copy already exists (same name, year, term and
+    target_enrollment_year) are skipped, so a rollover can be re-run safely.
+
+    Returns {'created', 'skipped', 'nodes', 'course_ids': {source id: copy id}, 'seconds'}.
+    """
+    start = time.perf_counter()
+    sources = list(courses.order_by('pk'))
+    report = {'created': 0, 'skipped': 0, 'nodes': 0, 'course_ids': {}, 'dry_run': dry_run}
+    if not sources:
+        report['seconds'] = 0.0
+        return report
+
+    def target_key(course):
+        return (course.name, course.year + years, course.term, course.target_enrollment_year + years)
+
+    targets = [target_key(course) for course in sources]
+    with transaction.atomic():
+        # Narrowed with IN lists and matched here: one OR term per course
+        # would hit SQLite's expression depth limit for large rollovers.
+        existing = set(
+            Course.objects.filter(
+                name__in={key[0] for key in targets}, year__in={key[1] for key in targets},
+                target_enrollment_year__in={key[3] for key in targets},
+            ).values_list('name', 'year', 'term', 'target_enrollment_year')
+        )
+        todo = [course for course, key in zip(sources, targets) if key not in existing]
+        report['skipped'] = len(sources) - len(todo)
+        source_ids = [course.pk for course in todo]
+        rows = list(EvalNode.objects.filter(course_id__in=source_ids).order_by('order', 'id').values_list(*NODE_FIELDS))
+        report['created'] = len(todo)
+        report['nodes'] = len(rows)
+        if dry_run or not todo:
+            report['seconds'] = round(time.perf_counter() - start, 3)
+            return report
+
+        thresholds = Threshold.objects.filter(course_id__in=source_ids).values_list('course_id', 'type', 'value')
+        copies = Course.objects.bulk_create([
+            Course(
+                year=course.year + years, target_enrollment_year=course.target_enrollment_year + years,
+                **{field: getattr(course, field) for field in COURSE_FIELDS},
+            )
+            for course in todo
+        ], batch_size=BATCH_SIZE)
+        course_ids = {course.pk: copy.pk for course, copy in zip(todo, copies)}
+        Threshold.objects.bulk_create([
+            Threshold(course_id=course_ids[course_id], type=threshold_type, value=value)
+            for course_id, threshold_type, value in thresholds
+        ], batch_size=BATCH_SIZE)
+
+        node_ids = {}
+        for level in _levels(rows):
+            created = EvalNode.objects.bulk_create([
+                EvalNode(
+                    course_id=course_ids[course_id],
+                    parent_id=node_ids[parent_id] if parent_id is not None else None,
+                    name=name, weight=weight, input_type=input_type, is_leaf=is_leaf, order=order,
+                    due_date=_shift_date(due_date, years) if shift_due_dates else due_date,
+                )
+                for _, course_id, parent_id, name, weight, input_type, is_leaf, order, due_date in level
+            ], batch_size=BATCH_SIZE)
+            for row, copy in zip(level, created):
+                node_ids[row[0]] = copy.pk
+
+    report['course_ids'] = course_ids
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
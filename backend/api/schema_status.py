@@ -0,0 +1,36 @@
+"""
+Schema and migration diagnostics, run on demand (schema_status command,
+/api/health/schema/) instead of on every process start.
+"""
+from django.db import connection as default_connection
+from django.db.migrations.executor import MigrationExecutor
+
+
+def get_schema_status(connection=None):
+    """
+    Returns the database, the api_course columns and the applied / pending
+    migrations. Uses Django's introspection, so it works on SQLite and PostgreSQL.
+    """
+    connection = connection or default_connection
+    status = {
+        'vendor': connection.vendor,
+        'database': str(connection.settings_dict.get('NAME', '')),
+    }
+    with connection.cursor() as cursor:
+        tables = set(connection.introspection.table_names(cursor))
+        columns = []
+        if 'api_course' in tables:
+            columns = [column.name for column in connection.introspection.get_table_description(cursor, 'api_course')]
+    status.update(
+        api_course_exists='api_course' in tables,
+        api_course_columns=columns,
+    )
+
+    executor = MigrationExecutor(connection)
+    plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    status.update(
+        applied=sorted(f'{app}.{name}' for app, name in executor.loader.applied_migrations),
+        pending=[f'{migration.app_label}.{migration.name}' for migration, _ in plan],
+    )
+    status['ok'] = status['api_course_exists'] and not status['pending']
+    return status
@@ -0,0 +1,20 @@
+"""
+Course selection shared by the CSV export (view and command) and the rollover command.
+"""
+
+
+def filter_courses(courses, params):
+    """
+    Applies the course filters: course (id), year, term and enrollment_year
+    (the cohort, Course.target_enrollment_year). params is a query dict or
+    command options. ValueError on non-integer ids or years.
+    """
+    if params.get('course'):
+        courses = courses.filter(pk=int(params['course']))
+    if params.get('year'):
+        courses = courses.filter(year=int(params['year']))
+    if params.get('term'):
+        courses = courses.filter(term=params['term'])
+    if params.get('enrollment_year'):
+        courses = courses.filter(target_enrollment_year=int(params['enrollment_year']))
+    return courses
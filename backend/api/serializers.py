@@ -1,31 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import models
 
 from .models import Course, CourseEnrollment, EvalNode, EvalEntry, Threshold, UserProfile
 
 User = get_user_model()
-from .services import CalculationService
-import json
-import os
-
-# #region agent log
-LOG_PATH = '/Users/suzukiakiramuki/playground/rakutanchecker/.cursor/debug.log'
-def _log_debug(location, message, data, hypothesis_id=None):
-    try:
-        with open(LOG_PATH, 'a') as f:
-            log_entry = {
-                'sessionId': 'debug-session',
-                'runId': 'run1',
-                'hypothesisId': hypothesis_id,
-                'location': location,
-                'message': message,
-                'data': data,
-                'timestamp': int(__import__('time').time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + '\n')
-    except Exception:
-        pass
-# #endregion
+from . import debug_log, summaries
 
 
 class CourseEnrollmentSerializer(serializers.ModelSerializer):
@@ -36,7 +16,37 @@ class CourseEnrollmentSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'enrolled_at', 'updated_at']
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    ?fields=a,b keeps only the named fields; ?omit=a,b drops them.
+    Fields that are not rendered are never computed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        params = request.query_params
+        if params.get('fields'):
+            keep = {name.strip() for name in params['fields'].split(',')}
+            for name in set(self.fields) - keep:
+                self.fields.pop(name)
+        if params.get('omit'):
+            for name in params['omit'].split(','):
+                self.fields.pop(name.strip(), None)
+
+
+class CourseListSerializer(serializers.ListSerializer):
+    """Loads enrollments and summaries for every course of the list at once"""
+
+    def to_representation(self, data):
+        courses = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.child.load_user_data(courses)
+        return super().to_representation(courses)
+
+
+class CourseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """Serializer for course template"""
     summary = serializers.SerializerMethodField()
     attendance_mask = serializers.SerializerMethodField()
@@ -47,28 +57,49 @@ class CourseSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'year', 'term', 'is_required', 'total_classes', 'target_enrollment_year', 
                   'attendance_mask', 'enrollment_id', 'created_at', 'updated_at', 'summary']
         read_only_fields = ['created_at', 'updated_at']
+        list_serializer_class = CourseListSerializer
+
+    USER_DATA_FIELDS = {'summary', 'attendance_mask', 'enrollment_id'}
+
+    def load_user_data(self, courses):
+        """
+        Fetches the current user's enrollments and summaries for all courses in
+        a fixed number of queries and stores them in the serializer context.
+        Never writes: enrollments are created on the first entry or attendance write.
+        Skipped entirely when none of the per-user fields are requested.
+        """
+        request = self.context.get('request')
+        if not (request and request.user.is_authenticated) or not self.USER_DATA_FIELDS & set(self.fields):
+            return
+        user = request.user
+        # Read-only: courses without an enrollment are shown with the defaults
+        enrollments = {
+            enrollment.course_id: enrollment
+            for enrollment in CourseEnrollment.objects.select_related('summary').filter(user=user, course__in=courses)
+        }
+        self.context.setdefault('enrollments', {}).update(enrollments)
+        if 'summary' in self.fields:
+            self.context.setdefault('summaries', {}).update(summaries.get_summaries(courses, user, enrollments))
+        self.context.setdefault('user_data_loaded', set()).update(course.id for course in courses)
+
+    def _user_data(self, obj):
+        if obj.id not in self.context.get('user_data_loaded', ()):
+            self.load_user_data([obj])
+        return self.context.get('enrollments', {}).get(obj.id), self.context.get('summaries', {}).get(obj.id)
 
     def get_enrollment_id(self, obj):
         """Get the enrollment ID for the current user"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            enrollment = CourseEnrollment.objects.filter(user=request.user, course=obj).first()
-            return enrollment.id if enrollment else None
-        return None
+        enrollment, _ = self._user_data(obj)
+        return enrollment.id if enrollment else None
 
     def get_attendance_mask(self, obj):
         """Get attendance mask from user's enrollment"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            enrollment = CourseEnrollment.objects.filter(user=request.user, course=obj).first()
-            return enrollment.attendance_mask if enrollment else 0
-        return 0
+        enrollment, _ = self._user_data(obj)
+        return enrollment.attendance_mask if enrollment else 0
 
     def get_summary(self, obj):
-        user = self.context['request'].user
-        # Get or create enrollment for this user
-        enrollment, _ = CourseEnrollment.objects.get_or_create(user=user, course=obj)
-        return CalculationService.get_course_summary(obj, user, enrollment)
+        _, summary = self._user_data(obj)
+        return summary
 
 class EvalNodeSerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
@@ -82,13 +113,40 @@ class EvalNodeSerializer(serializers.ModelSerializer):
         children = obj.children.all().order_by('order')
         return EvalNodeSerializer(children, many=True).data
 
+def serialize_node_tree(tree):
+    """
+    Same output as EvalNodeSerializer(roots, many=True).data for a whole
+    CompiledTree, assembled iteratively from its flat arrays without queries.
+    """
+    date_field = serializers.DateField()
+    nodes = []
+    for i, node_id in enumerate(tree.node_ids):
+        parent = tree.parent_index[i]
+        due_date = tree.due_date[i]
+        nodes.append({
+            'id': node_id,
+            'course': tree.course_id,
+            'parent': tree.node_ids[parent] if parent >= 0 else None,
+            'name': tree.name[i],
+            'weight': float(tree.weight[i]),
+            'input_type': tree.input_type[i],
+            'is_leaf': bool(tree.is_leaf[i]),
+            'order': tree.order[i],
+            'children': [],
+            'due_date': date_field.to_representation(due_date) if due_date is not None else None,
+        })
+    for i, children in enumerate(tree.children):
+        nodes[i]['children'] = [nodes[child] for child in children]
+    return [nodes[i] for i in tree.roots]
+
+
 class EvalNodeFlatSerializer(serializers.ModelSerializer):
     """Serializer for flat list operations if needed"""
     class Meta:
         model = EvalNode
         fields = '__all__'
 
-class EvalEntrySerializer(serializers.ModelSerializer):
+class EvalEntrySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = EvalEntry
         fields = ['id', 'user', 'node', 'earned', 'max', 'rate', 'attended', 'total', 'adjustment', 'status', 'updated_at']
@@ -104,6 +162,17 @@ class EvalEntrySerializer(serializers.ModelSerializer):
              raise serializers.ValidationError("Entries can only be created for leaf nodes.")
         return data
 
+class EvalEntryBulkSerializer(serializers.ModelSerializer):
+    """
+    One item of a bulk entry upsert. node is a plain id; the view checks all
+    of them against the course's leaves at once instead of one lookup per item.
+    """
+    node = serializers.IntegerField()
+
+    class Meta:
+        model = EvalEntry
+        fields = ['node', 'earned', 'max', 'rate', 'attended', 'total', 'adjustment', 'status']
+
 class CourseSummarySerializer(serializers.Serializer):
     current_score = serializers.FloatField()
     predicted_score = serializers.FloatField()
@@ -140,7 +209,7 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         # #region agent log
-        _log_debug('serializers.py:RegisterSerializer.create', 'ユーザー登録開始', {
+        debug_log.log_debug('serializers.py:RegisterSerializer.create', 'ユーザー登録開始', {
             'username': validated_data.get('username'),
             'has_full_name': 'full_name' in validated_data,
             'has_student_id': 'student_id' in validated_data,
@@ -156,7 +225,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         enrollment_year = validated_data.pop('enrollment_year')
         
         # #region agent log
-        _log_debug('serializers.py:RegisterSerializer.create', 'プロファイルデータ抽出完了', {
+        debug_log.log_debug('serializers.py:RegisterSerializer.create', 'プロファイルデータ抽出完了', {
             'full_name': full_name,
             'student_id': student_id,
             'date_of_birth': str(date_of_birth) if date_of_birth else None,
@@ -166,7 +235,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         
         # Create user
         # #region agent log
-        _log_debug('serializers.py:RegisterSerializer.create', 'ユーザー作成開始', {
+        debug_log.log_debug('serializers.py:RegisterSerializer.create', 'ユーザー作成開始', {
             'username': validated_data['username'],
             'email': validated_data.get('email', '')
         }, 'H1')
@@ -179,14 +248,14 @@ class RegisterSerializer(serializers.ModelSerializer):
                 password=validated_data['password']
             )
             # #region agent log
-            _log_debug('serializers.py:RegisterSerializer.create', 'ユーザー作成完了', {
+            debug_log.log_debug('serializers.py:RegisterSerializer.create', 'ユーザー作成完了', {
                 'user_id': user.id,
                 'username': user.username
             }, 'H1')
             # #endregion
         except Exception as e:
             # #region agent log
-            _log_debug('serializers.py:RegisterSerializer.create', 'ユーザー作成エラー', {
+            debug_log.log_debug('serializers.py:RegisterSerializer.create', 'ユーザー作成エラー', {
                 'error': str(e),
                 'error_type': type(e).__name__
             }, 'H1')
@@ -195,7 +264,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         
         # Create profile
         # #region agent log
-        _log_debug('serializers.py:RegisterSerializer.create', 'プロファイル作成開始', {
+        debug_log.log_debug('serializers.py:RegisterSerializer.create', 'プロファイル作成開始', {
             'user_id': user.id,
             'full_name': full_name,
             'student_id': student_id,
@@ -213,14 +282,14 @@ class RegisterSerializer(serializers.ModelSerializer):
                 enrollment_year=enrollment_year
             )
             # #region agent log
-            _log_debug('serializers.py:RegisterSerializer.create', 'プロファイル作成完了', {
+            debug_log.log_debug('serializers.py:RegisterSerializer.create', 'プロファイル作成完了', {
                 'profile_id': profile.id,
                 'user_id': profile.user.id
             }, 'H1')
             # #endregion
         except Exception as e:
             # #region agent log
-            _log_debug('serializers.py:RegisterSerializer.create', 'プロファイル作成エラー', {
+            debug_log.log_debug('serializers.py:RegisterSerializer.create', 'プロファイル作成エラー', {
                 'error': str(e),
                 'error_type': type(e).__name__,
                 'user_id': user.id
@@ -230,11 +299,11 @@ class RegisterSerializer(serializers.ModelSerializer):
             try:
                 user.delete()
                 # #region agent log
-                _log_debug('serializers.py:RegisterSerializer.create', 'ユーザー削除完了（ロールバック）', {'user_id': user.id}, 'H1')
+                debug_log.log_debug('serializers.py:RegisterSerializer.create', 'ユーザー削除完了（ロールバック）', {'user_id': user.id}, 'H1')
                 # #endregion
             except Exception as delete_error:
                 # #region agent log
-                _log_debug('serializers.py:RegisterSerializer.create', 'ユーザー削除エラー', {
+                debug_log.log_debug('serializers.py:RegisterSerializer.create', 'ユーザー削除エラー', {
                     'error': str(delete_error),
                     'user_id': user.id
                 }, 'H1')
@@ -242,7 +311,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             raise
         
         # #region agent log
-        _log_debug('serializers.py:RegisterSerializer.create', 'ユーザー登録完了', {
+        debug_log.log_debug('serializers.py:RegisterSerializer.create', 'ユーザー登録完了', {
             'user_id': user.id,
             'username': user.username
         }, 'H1')
@@ -252,7 +321,7 @@ class RegisterSerializer(serializers.ModelSerializer):
     
     def to_representation(self, instance):
         # #region agent log
-        _log_debug('serializers.py:RegisterSerializer.to_representation', 'レスポンス生成開始', {
+        debug_log.log_debug('serializers.py:RegisterSerializer.to_representation', 'レスポンス生成開始', {
             'user_id': instance.id,
             'username': instance.username
         }, 'H1')
@@ -267,7 +336,7 @@ class RegisterSerializer(serializers.ModelSerializer):
                 'email': instance.email
             }
             # #region agent log
-            _log_debug('serializers.py:RegisterSerializer.to_representation', 'レスポンス生成完了', {
+            debug_log.log_debug('serializers.py:RegisterSerializer.to_representation', 'レスポンス生成完了', {
                 'user_id': instance.id,
                 'result': result
             }, 'H1')
@@ -275,7 +344,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             return result
         except Exception as e:
             # #region agent log
-            _log_debug('serializers.py:RegisterSerializer.to_representation', 'レスポンス生成エラー', {
+            debug_log.log_debug('serializers.py:RegisterSerializer.to_representation', 'レスポンス生成エラー', {
                 'error': str(e),
                 'error_type': type(e).__name__,
                 'user_id': instance.id if hasattr(instance, 'id') else None
@@ -283,7 +352,7 @@ class RegisterSerializer(serializers.ModelSerializer):
             # #endregion
             raise
 
-class EventSerializer(serializers.ModelSerializer):
+class EventSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     course_name = serializers.CharField(source='course.name', read_only=True)
     
     class Meta:
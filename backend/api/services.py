@@ -1,17 +1,20 @@
 from django.db.models import Sum
-from .models import EvalNode, EvalEntry, Threshold
+from .models import CourseEnrollment, EvalNode, EvalEntry
+from .course_tree import get_compiled_tree, get_compiled_trees
 
 class CalculationService:
     @staticmethod
-    def calculate_leaf_score(entry: EvalEntry) -> float:
+    def calculate_leaf_score(entry: EvalEntry, input_type=None) -> float:
         """
         Calculates the score (0.0 to 1.0) for a leaf node based on the entry.
+        input_type can be passed by callers that already hold the node, to avoid loading entry.node.
         """
         if not entry:
             return 0.0
 
         base_score = 0.0
-        input_type = entry.node.input_type
+        if input_type is None:
+            input_type = entry.node.input_type
 
         # Calculate base score
         if input_type == EvalNode.InputType.SCORE or input_type == EvalNode.InputType.NONE:
@@ -93,6 +96,78 @@ class CalculationService:
         # Normalize
         return weighted_score_sum / total_weight
 
+    @staticmethod
+    def leaf_scores(entry, input_type=None):
+        """
+        Returns the (current, predicted, max) scores of a leaf for its entry.
+        Unattempted leaves are excluded / 0.0 / 1.0 respectively.
+        """
+        if entry and entry.status == EvalEntry.Status.COMPLETED:
+            score = CalculationService.calculate_leaf_score(entry, input_type)
+            return score, score, score
+        return None, 0.0, 1.0
+
+    @staticmethod
+    def get_entry_map(course, user):
+        """
+        Fetches all of the user's entries for a course in one query, keyed by node_id.
+        """
+        return {
+            entry.node_id: entry
+            for entry in EvalEntry.objects.filter(user=user, node__course=course)
+        }
+
+    @staticmethod
+    def evaluate_tree(tree, entries):
+        """
+        Scores every node of a compiled course tree for all three modes in a single
+        bottom-up pass. Same semantics as calculate_node_score, but iterative (no
+        recursion limit on deep trees) and without any queries.
+
+        Args:
+            tree: CompiledTree of the course
+            entries: {node_id: EvalEntry} for the scored user (see get_entry_map)
+
+        Returns:
+            list of (current, predicted, max), indexed like the tree's arrays
+            (None for nodes not reachable from a root)
+        """
+        scores = [None] * len(tree)
+        weight = tree.weight
+        for i in tree.post_order:
+            if tree.is_leaf[i]:
+                scores[i] = CalculationService.leaf_scores(entries.get(tree.node_ids[i]), tree.input_type[i])
+                continue
+
+            node_children = tree.children[i]
+            if not node_children:
+                scores[i] = (None, 0.0, 0.0)
+                continue
+
+            current_sum = current_weight = 0.0
+            predicted_sum = max_sum = total_weight = 0.0
+            current_found = False
+            for child in node_children:
+                s_current, s_predicted, s_max = scores[child]
+                w = weight[child]
+                if s_current is not None:
+                    current_found = True
+                    current_sum += w * s_current
+                    current_weight += w
+                predicted_sum += w * s_predicted
+                max_sum += w * s_max
+                total_weight += w
+
+            if current_found:
+                s_current = current_sum / current_weight if current_weight != 0 else 0.0
+            else:
+                s_current = None
+            if total_weight == 0:
+                scores[i] = (s_current, 0.0, 0.0)
+            else:
+                scores[i] = (s_current, predicted_sum / total_weight, max_sum / total_weight)
+        return scores
+
     @staticmethod
     def get_course_summary(course, user, enrollment=None):
         """
@@ -104,15 +179,111 @@ class CalculationService:
             user: User instance
             enrollment: CourseEnrollment instance (optional, will be fetched if not provided)
         """
-        # Attendance Calculation is needed even if there are no evaluation nodes.
         if enrollment is None:
-            from .models import CourseEnrollment
             enrollment = CourseEnrollment.objects.filter(user=user, course=course).first()
 
+        # The compiled tree is shared across requests until the course's tree_version changes.
+        tree = get_compiled_tree(course)
+        entries = CalculationService.get_entry_map(course, user) if tree.roots else {}
+        return CalculationService.summarize(course, tree, entries, enrollment)
+
+    @staticmethod
+    def get_course_summaries(courses, user, enrollments=None):
+        """
+        Returns {course_id: summary} for many courses with a fixed number of queries:
+        one each for enrollments, nodes, thresholds and entries (nodes and thresholds
+        only for courses whose compiled tree is not cached).
+
+        Args:
+            courses: list of Course instances
+            user: User instance
+            enrollments: {course_id: CourseEnrollment} (optional, will be fetched if not provided)
+        """
+        if enrollments is None:
+            enrollments = {
+                enrollment.course_id: enrollment
+                for enrollment in CourseEnrollment.objects.filter(user=user, course__in=courses)
+            }
+        trees = get_compiled_trees(courses)
+        with_nodes = [course_id for course_id, tree in trees.items() if tree.roots]
+        entries = {}
+        if with_nodes:
+            entries = {
+                entry.node_id: entry
+                for entry in EvalEntry.objects.filter(user=user, node__course__in=with_nodes)
+            }
+        return {
+            course.id: CalculationService.summarize(course, trees[course.id], entries, enrollments.get(course.id))
+            for course in courses
+        }
+
+    @staticmethod
+    def summarize(course, tree, entries, enrollment, scores=None):
+        """
+        Builds the summary dictionary from already-loaded data; runs no queries.
+
+        Args:
+            course: Course instance
+            tree: CompiledTree of the course
+            entries: {node_id: EvalEntry} of the user (may contain other courses' entries)
+            enrollment: CourseEnrollment instance or None
+            scores: precomputed node scores indexed by tree position (at least for
+                tree.top_level); evaluated from entries when omitted
+        """
         mask = enrollment.attendance_mask if enrollment else 0
+        if not tree.roots:
+            return CalculationService.build_summary(course, mask)
+
+        # Top-level nodes (see CompiledTree.top_level) carry percentages of the course, so they are not normalized.
+        if scores is None:
+            scores = CalculationService.evaluate_tree(tree, entries)
+        defined_weight_sum = 0.0
+        weighted_score_sum_current = 0.0
+        weighted_score_sum_predicted = 0.0
+        weighted_score_sum_max = 0.0
+        for i in tree.top_level:
+            w = tree.weight[i]
+            defined_weight_sum += w
+            s_current, s_predicted, s_max = scores[i]
+            if s_current is not None:
+                weighted_score_sum_current += s_current * w
+            weighted_score_sum_predicted += s_predicted * w
+            weighted_score_sum_max += s_max * w
+
+        # Secured: e.g. 30 * 1.0 + 30 * 1.0 = 60.0
+        current_score = weighted_score_sum_current
+
+        # Predicted: performance in the defined weight, scaled to 100
+        if defined_weight_sum > 0:
+            predicted_score = (weighted_score_sum_predicted / defined_weight_sum) * 100.0
+        else:
+            predicted_score = 0.0
+
+        # Max: unattempted leaves already count as 1.0; weight not yet defined is added in full
+        undefined_weight = max(0.0, 100.0 - defined_weight_sum)
+        max_score = weighted_score_sum_max + undefined_weight
+
+        # Threshold (compiled with the tree; defaults to 60.0)
+        return CalculationService.build_summary(
+            course, mask, (current_score, predicted_score, max_score), tree.threshold
+        )
+
+    @staticmethod
+    def build_summary(course, attendance_mask, totals=None, threshold_val=60.0):
+        """
+        Formats the summary dictionary from unrounded course totals.
+
+        Args:
+            course: Course instance (for total_classes)
+            attendance_mask: the enrollment's attendance bitmask (0 when not enrolled)
+            totals: (current_score, predicted_score, max_score) on a 0-100 scale,
+                or None when the course has no evaluation nodes
+            threshold_val: passing threshold
+        """
+        # Attendance Calculation is needed even if there are no evaluation nodes.
         # sqlite BigIntegerField may return int; ensure int for bin()
         try:
-            mask_int = int(mask)
+            mask_int = int(attendance_mask)
         except Exception:
             mask_int = 0
         current_attended = bin(mask_int).count('1')
@@ -122,8 +293,7 @@ class CalculationService:
         is_attendance_fail = attendance_rate < attendance_threshold
         is_attendance_safe = attendance_rate >= attendance_threshold
 
-        roots = course.nodes.filter(parent__isnull=True)
-        if not roots.exists():
+        if totals is None:
             # No evaluation nodes yet: return zero scores, but include attendance fields to avoid NaN in UI
             return {
                 'current_score': 0.0,
@@ -140,129 +310,7 @@ class CalculationService:
                 'threshold': 60.0
             }
 
-        # Instead of calling calculate_node_score on root (which normalizes),
-        # we iterate through root's children and sum their weighted scores relative to the course (assumed 100%).
-        # If there are multiple roots, we treat them as top-level components.
-        
-        # We need to flatten the top level structure effectively. 
-        # But actually, usually there is one root "Overview" with weight 100?
-        # If the user created "b (30%)", "c (30%)" as roots, then we iterate roots.
-        # If the user created "Root (100%)" -> "b (30%)", "c (30%)", then root is normalized.
-        
-        # Let's handle both. If there is a single root with children, and root weight is 100 (or ignored as it is root),
-        # we should look at its children.
-        
-        # Case 1: Multiple roots (e.g. user added b and c directly as roots).
-        # We sum them up. Sum of weights might be < 100.
-        
-        # Case 2: One root "Total". Its children sum < 100.
-        # calculate_node_score(root) normalizes children sum to 1.0. This is what we want to AVOID for "current_score".
-        
-        # So we need a helper that does NOT normalize at the top level call.
-        
-        # Determine strict "Secured" score.
-        # This is sum(child_score * child_weight) for all effective leaves, but easier to traverse top-down.
-        
-        total_current_weighted_sum = 0.0
-        total_predicted_weighted_sum = 0.0
-        total_max_weighted_sum = 0.0
-        
-        # We treat all roots as direct contributors to the course (weight is percentage).
-        # But if there is a single root that acts as a container (weight 100?), we might need to dive in.
-        # However, typically "Root" has weight 100? Or 0? 
-        # If the user made "Overall (100%)", then we calculate it.
-        # If its children are 30% and 30%, calculate_node_score returns 1.0 (if perfect).
-        # Then 1.0 * 100 = 100.
-        
-        # The issue is that calculate_node_score normalizes at EACH step.
-        # If I have Root -> A(30), B(30).
-        # Root score = (A_score*30 + B_score*30) / 60.
-        # If I want "absolute score", I want (A_score*30 + B_score*30) / 100.
-        
-        # So, we should interpret "root weight" generally.
-        # If roots are multiple, we sum them.
-        # If root is single, we check if it has children. If so, we essentially want the sum of children's absolute contribution.
-        
-        # Let's enforce that we want the raw weighted sum of the top-most meaningful nodes, normalized to 100.
-        
-        # Let's modify calculate_node_score logic slightly or re-implement for summary.
-        # Let's walk the tree and accumulate "secured points".
-        
-        current_secured = 0.0
-        current_predicted = 0.0
-        current_max = 0.0 # secured + potential in undefined
-        
-        # If we assume standard normalization is "Propriety" (Performance rate in defined area).
-        
-        # Let's define:
-        # Secured = Raw weighted sum of all completed leaf contributions.
-        # Defined Weight = Sum of weights of all leaves (or branches).
-        
-        def calculate_stats_recursive(node, user):
-            # Returns (secured_val, predicted_val, max_val, node_weight)
-            # node_weight is the weight of this node in PARENT.
-            # But values returned are 0.0-1.0 (score).
-            pass
-            
-        # Actually easier: use calculate_node_score but pay attention to weights.
-        
-        # Re-calc for roots
-        defined_weight_sum = 0.0
-        weighted_score_sum_current = 0.0
-        weighted_score_sum_predicted = 0.0 # treated as if undefined is 0
-        weighted_score_sum_max = 0.0 # treated as if undefined is 100 (in max mode calculation)
-        
-        target_nodes = list(roots)
-        
-        # Special check: if single root and it acts as container (100% and has children), use its children
-        # This fixes the "Root(100) -> A(30),B(30)" case where Root normalizes to 1.0.
-        if len(target_nodes) == 1 and target_nodes[0].children.exists():
-             # Use children of the root instead
-             target_nodes = list(target_nodes[0].children.all())
-        
-        for node in target_nodes:
-            w = node.weight
-            defined_weight_sum += w
-            
-            s_current = CalculationService.calculate_node_score(node, user, 'current')
-            if s_current is not None:
-                weighted_score_sum_current += s_current * w
-                
-            s_predicted = CalculationService.calculate_node_score(node, user, 'predicted')
-            if s_predicted is not None:
-                weighted_score_sum_predicted += s_predicted * w
-                
-            s_max = CalculationService.calculate_node_score(node, user, 'max')
-            if s_max is not None:
-                weighted_score_sum_max += s_max * w
-        
-        # Secured Score: This is simply weighted_score_sum_current.
-        # e.g. 30 * 1.0 + 30 * 1.0 = 60.0.
-        current_score = weighted_score_sum_current
-        
-        # Predicted Score:
-        # Logic: (Secured / Defined) * 100
-        # If defined is 60, and secured is 60 -> (60/60)*100 = 100.
-        if defined_weight_sum > 0:
-            predicted_score = (weighted_score_sum_predicted / defined_weight_sum) * 100.0
-        else:
-            predicted_score = 0.0
-            
-        # Max Score:
-        # Logic: Secured + (Max achievable in remaining)
-        # However, calculate_node_score('max') returns 1.0 for unattempted leaves.
-        # So "weighted_score_sum_max" accounts for "Defined but unattempted".
-        # We need to add "Undefined" (100 - defined_weight_sum) as well.
-        
-        undefined_weight = max(0.0, 100.0 - defined_weight_sum)
-        max_score = weighted_score_sum_max + undefined_weight
-        
-        # Threshold
-        try:
-            threshold_val = course.threshold.value
-        except Threshold.DoesNotExist:
-            threshold_val = 60.0
-            
+        current_score, predicted_score, max_score = totals
         is_fail_predicted = predicted_score < threshold_val
         is_certain_fail = max_score < threshold_val
 
@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from django.contrib.auth import get_user_model
+from rest_framework.authtoken.models import Token
+
+from . import summaries
+from .authentication import identity_cache
+from .course_tree import bump_tree_version
+from .models import Course, CourseEnrollment, EvalEntry, EvalNode, Threshold, UserProfile
+
+
+def _origin_model(kwargs):
+    """Model whose instance or queryset started a delete (None for saves)."""
+    origin = kwargs.get('origin')
+    if origin is None:
+        return None
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
+
+
+def _cascading_from_course(kwargs):
+    # Rows deleted because their course is being deleted need no bookkeeping.
+    return _origin_model(kwargs) is Course
+
+
+_tree_invalidation_suppressed = ContextVar('tree_invalidation_suppressed', default=False)
+_enrollment_refresh_suppressed = ContextVar('enrollment_refresh_suppressed', default=False)
+
+
+@contextmanager
+def _enabled(flag):
+    token = flag.set(True)
+    try:
+        yield
+    finally:
+        flag.reset(token)
+
+
+def suppress_tree_invalidation():
+    """
+    Skips invalidate_course_tree for node and threshold writes inside the
+    block. For bulk rewrites of a tree: the caller bumps tree_version once
+    afterwards instead of once per row.
+    """
+    return _enabled(_tree_invalidation_suppressed)
+
+
+def suppress_enrollment_refresh():
+    """
+    Skips refresh_enrollment_summary for enrollment saves inside the block,
+    for callers that refresh the summary themselves right afterwards.
+    """
+    return _enabled(_enrollment_refresh_suppressed)
+
+
+@receiver(post_save, sender=EvalNode)
+@receiver(post_delete, sender=EvalNode)
+@receiver(post_save, sender=Threshold)
+@receiver(post_delete, sender=Threshold)
+def invalidate_course_tree(sender, instance, **kwargs):
+    """Bump the course's tree_version whenever its nodes or threshold change."""
+    if _cascading_from_course(kwargs) or _tree_invalidation_suppressed.get():
+        return
+    bump_tree_version(instance.course_id)
+    # Keep a Course instance held by the caller in step with the database.
+    if sender.course.is_cached(instance):
+        instance.course.tree_version += 1
+    summaries.mark_course_stale(instance.course_id)
+
+
+@receiver(post_save, sender=Course)
+def invalidate_course_summaries(sender, instance, created, **kwargs):
+    """total_classes feeds the attendance rate of every enrollment."""
+    if not created:
+        summaries.mark_course_stale(instance.pk)
+
+
+@receiver(post_save, sender=EvalEntry)
+def refresh_entry_summary(sender, instance, **kwargs):
+    summaries.refresh_for_entry(instance)
+
+
+@receiver(post_delete, sender=EvalEntry)
+def invalidate_entry_summary(sender, instance, **kwargs):
+    # Cascades from a node/course/user are covered by their own invalidation.
+    if _origin_model(kwargs) is EvalEntry:
+        summaries.refresh_for_entry(instance, deleted=True)
+
+
+@receiver(post_save, sender=CourseEnrollment)
+def refresh_enrollment_summary(sender, instance, created, **kwargs):
+    if _enrollment_refresh_suppressed.get():
+        return
+    # A new enrollment has no aggregates yet; later saves only change attendance.
+    if created:
+        summaries.refresh_enrollment(instance)
+    else:
+        summaries.refresh_attendance(instance)
+
+
+@receiver(post_delete, sender=Token)
+def evict_token_identity(sender, instance, **kwargs):
+    identity_cache.evict(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_user_identity(sender, instance, **kwargs):
+    identity_cache.evict_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def evict_profile_identity(sender, instance, **kwargs):
+    identity_cache.evict_user(instance.user_id)
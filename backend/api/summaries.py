@@ -0,0 +1,165 @@
+"""
+Materialized per-enrollment summaries (EnrollmentSummary).
+
+Rows are refreshed when entries or attendance are written (see signals.py)
+and marked stale when the course, its tree or its threshold change. Reads
+use a row only while it is fresh and fall back to live computation
+otherwise; they never write.
+"""
+from django.db import transaction
+
+from . import aggregates
+from .course_tree import get_compiled_tree
+from .models import CourseEnrollment, EnrollmentSummary
+from .services import CalculationService
+
+
+def _row_values(user_id, course_id, summary, tree_version):
+    values = {field: summary[field] for field in EnrollmentSummary.SUMMARY_FIELDS}
+    values.update(
+        user_id=user_id,
+        course_id=course_id,
+        tree_version=tree_version,
+        is_stale=False,
+    )
+    return values
+
+
+def _cached_row(enrollment):
+    """Returns enrollment.summary, or None when the row does not exist."""
+    if enrollment is None:
+        return None
+    try:
+        return enrollment.summary
+    except EnrollmentSummary.DoesNotExist:
+        return None
+
+
+def _store(enrollment, summary, tree_version):
+    EnrollmentSummary.objects.update_or_create(
+        enrollment=enrollment,
+        defaults=_row_values(enrollment.user_id, enrollment.course_id, summary, tree_version),
+    )
+
+
+def refresh_enrollment(enrollment):
+    """Recomputes the node aggregates and the summary row of one enrollment."""
+    course = enrollment.course
+    tree = get_compiled_tree(course)
+    entries = CalculationService.get_entry_map(course, enrollment.user_id) if tree.roots else {}
+    scores = aggregates.rebuild(tree, enrollment.user_id, entries)
+    summary = CalculationService.summarize(course, tree, entries, enrollment, scores=scores)
+    _store(enrollment, summary, tree.version)
+    return summary
+
+
+def refresh_attendance(enrollment):
+    """
+    Refreshes the row after the enrollment itself was saved. Node scores do
+    not depend on it, so the summary is rebuilt from the stored top-level
+    aggregates; refresh_enrollment runs only when they are missing or outdated.
+    """
+    course = enrollment.course
+    tree = get_compiled_tree(course)
+    scores = aggregates.top_level_scores(tree, enrollment.user_id) if tree.roots else {}
+    if scores is None:
+        return refresh_enrollment(enrollment)
+    summary = CalculationService.summarize(course, tree, None, enrollment, scores=scores)
+    _store(enrollment, summary, tree.version)
+    return summary
+
+
+def refresh_for_entry(entry, deleted=False):
+    """
+    Refreshes the owner's row after one entry was saved or deleted, by applying
+    the change along the leaf-to-root path of the node aggregates.
+
+    The enrollment row is locked first and the summary is stored in the same
+    transaction, so concurrent writes for one enrollment are applied one at
+    a time and the last summary stored is computed from the latest entries.
+    """
+    with transaction.atomic():
+        enrollment = (
+            CourseEnrollment.objects.select_related('course').select_for_update(of=('self',))
+            .filter(user_id=entry.user_id, course_id=entry.node.course_id)
+            .first()
+        )
+        if enrollment is None:
+            return None
+        course = enrollment.course
+        tree = get_compiled_tree(course)
+        scores = aggregates.apply_entry(tree, entry.user_id, entry.node_id, None if deleted else entry)
+        if scores is None:
+            return refresh_enrollment(enrollment)
+        summary = CalculationService.summarize(course, tree, None, enrollment, scores=scores)
+        _store(enrollment, summary, tree.version)
+    return summary
+
+
+def mark_course_stale(course_id):
+    EnrollmentSummary.objects.filter(course_id=course_id).update(is_stale=True)
+
+
+def get_summary(course, user, enrollment=None):
+    """
+    Summary for one course: the materialized row when fresh, live computation otherwise.
+    Pass an enrollment loaded with select_related('summary') to avoid an extra query.
+    """
+    if enrollment is None:
+        enrollment = CourseEnrollment.objects.select_related('summary').filter(user=user, course=course).first()
+    row = _cached_row(enrollment)
+    if row is not None and row.is_fresh_for(course):
+        return row.as_summary()
+    return CalculationService.get_course_summary(course, user, enrollment)
+
+
+def get_summaries(courses, user, enrollments):
+    """
+    {course_id: summary} for many courses. Fresh rows are used as-is; the
+    remaining courses are evaluated together with get_course_summaries.
+
+    Args:
+        enrollments: {course_id: CourseEnrollment}, loaded with select_related('summary')
+    """
+    summaries = {}
+    live = []
+    for course in courses:
+        row = _cached_row(enrollments.get(course.id))
+        if row is not None and row.is_fresh_for(course):
+            summaries[course.id] = row.as_summary()
+        else:
+            live.append(course)
+    if live:
+        summaries.update(CalculationService.get_course_summaries(live, user, enrollments))
+    return summaries
+
+
+def rebuild(courses):
+    """
+    Recomputes the rows of every enrollment of the given courses with the
+    vectorized cohort engine. Per course: one query for enrollments, one for
+    entries and one upsert. Returns the number of rows written.
+    """
+    # Imported here: numpy would otherwise load with the signals in ApiConfig.ready()
+    from .cohort import evaluate_cohort
+
+    written = 0
+    for course in courses:
+        cohort = evaluate_cohort(course)
+        if not len(cohort):
+            continue
+        rows = [
+            EnrollmentSummary(
+                enrollment_id=int(cohort.enrollment_ids[i]),
+                **_row_values(int(cohort.user_ids[i]), course.id, cohort.summary(i), cohort.tree.version),
+            )
+            for i in range(len(cohort))
+        ]
+        EnrollmentSummary.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['enrollment'],
+            update_fields=list(EnrollmentSummary.SUMMARY_FIELDS) + ['tree_version', 'is_stale', 'computed_at'],
+        )
+        written += len(rows)
+    return written
@@ -1,14 +1,36 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from io import StringIO
+import csv
+import json
+import os
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from .models import Course, EvalNode, EvalEntry, Threshold
+from django.db import connection
+from django.db.models import F
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from .models import Course, CourseEnrollment, EnrollmentSummary, EvalNode, EvalEntry, NodeAggregate, Threshold, UserProfile
+from . import aggregates, debug_log, exports, importer, summaries
+from .rollover import duplicate_courses
+from .cohort import evaluate_cohort
+from .serializers import EvalNodeSerializer
 from .services import CalculationService
+from .course_tree import CompiledTree, get_compiled_tree, tree_cache
+from .ical import fold
+from .views import EventViewSet
 
 User = get_user_model()
 
 class CalculationServiceTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='password')
-        self.course = Course.objects.create(name='Math 101', year=2025, term='early', user=self.user)
+        self.course = Course.objects.create(name='Math 101', year=2025, term='early', target_enrollment_year=2025)
         self.root = EvalNode.objects.create(course=self.course, name='Total', weight=100)
 
     def test_leaf_score_basic(self):
@@ -100,3 +122,1563 @@ class CalculationServiceTests(TestCase):
         
         # Predicted: P1(1.0), P2(0), P3(0). Avg (1+0+0)/3 = 0.333
         self.assertAlmostEqual(CalculationService.calculate_node_score(self.root, self.user, 'predicted'), 1/3)
+
+
+    def test_evaluate_tree_matches_node_score(self):
+        # Root -> A(40) -> A1(50), A2(50)
+        #      -> B(60) -> B1(100) -> B1a(1)
+        a = EvalNode.objects.create(course=self.course, parent=self.root, name='A', weight=40)
+        a1 = EvalNode.objects.create(course=self.course, parent=a, name='A1', weight=50, input_type='score', is_leaf=True)
+        EvalNode.objects.create(course=self.course, parent=a, name='A2', weight=50, input_type='rate', is_leaf=True)
+        b = EvalNode.objects.create(course=self.course, parent=self.root, name='B', weight=60)
+        b1 = EvalNode.objects.create(course=self.course, parent=b, name='B1', weight=100)
+        b1a = EvalNode.objects.create(course=self.course, parent=b1, name='B1a', weight=1, input_type='attendance', is_leaf=True)
+
+        EvalEntry.objects.create(user=self.user, node=a1, earned=7, max=10, status='completed')
+        EvalEntry.objects.create(user=self.user, node=b1a, attended=12, total=15, adjustment=-3, status='completed')
+
+        tree = get_compiled_tree(self.course)
+        scores = CalculationService.evaluate_tree(tree, CalculationService.get_entry_map(self.course, self.user))
+        for node in self.course.nodes.all():
+            for index, mode in enumerate(('current', 'predicted', 'max')):
+                expected = CalculationService.calculate_node_score(node, self.user, mode)
+                if expected is None:
+                    self.assertIsNone(scores[tree.index[node.id]][index])
+                else:
+                    self.assertAlmostEqual(scores[tree.index[node.id]][index], expected)
+
+    def test_summary_deep_tree(self):
+        # Deeper than the recursion limit would allow for a recursive walk.
+        parent = self.root
+        for depth in range(1200):
+            parent = EvalNode.objects.create(course=self.course, parent=parent, name=f'D{depth}', weight=100)
+        leaf = EvalNode.objects.create(course=self.course, parent=parent, name='Leaf', weight=100, input_type='score', is_leaf=True)
+        EvalEntry.objects.create(user=self.user, node=leaf, earned=70, max=100, status='completed')
+
+        summary = CalculationService.get_course_summary(self.course, self.user)
+        self.assertEqual(summary['current_score'], 70.0)
+        self.assertEqual(summary['predicted_score'], 70.0)
+        self.assertEqual(summary['max_score'], 70.0)
+        self.assertFalse(summary['is_fail_predicted'])
+
+    def test_summary_query_count_independent_of_leaves(self):
+        for i in range(40):
+            leaf = EvalNode.objects.create(course=self.course, parent=self.root, name=f'Q{i}', weight=2.5, input_type='score', is_leaf=True)
+            if i % 2:
+                EvalEntry.objects.create(user=self.user, node=leaf, earned=8, max=10, status='completed')
+
+        # enrollment, nodes, entries, threshold
+        with self.assertNumQueries(4):
+            summary = CalculationService.get_course_summary(self.course, self.user)
+        self.assertEqual(summary['current_score'], 40.0)
+        self.assertEqual(summary['predicted_score'], 40.0)
+        self.assertEqual(summary['max_score'], 90.0)
+
+
+class CompiledTreeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='treeuser', password='password')
+        self.course = Course.objects.create(name='Physics', year=2025, term='late', target_enrollment_year=2025)
+        self.root = EvalNode.objects.create(course=self.course, name='Total', weight=100)
+        self.a = EvalNode.objects.create(course=self.course, parent=self.root, name='A', weight=30, input_type='score', is_leaf=True, order=1)
+        self.b = EvalNode.objects.create(course=self.course, parent=self.root, name='B', weight=10, input_type='rate', is_leaf=True, order=0)
+
+    def test_flat_arrays(self):
+        tree = get_compiled_tree(self.course)
+        self.assertEqual(tree.node_ids, (self.root.id, self.b.id, self.a.id))
+        self.assertEqual(tree.parent_index, (-1, 0, 0))
+        self.assertEqual(tree.normalized_weight, (1.0, 0.25, 0.75))
+        self.assertEqual(tree.is_leaf, (False, True, True))
+        self.assertEqual(tree.top_level, (1, 2))
+        self.assertEqual(tree.threshold, 60.0)
+
+    def test_cached_until_version_changes(self):
+        tree = get_compiled_tree(self.course)
+        with self.assertNumQueries(0):
+            self.assertIs(get_compiled_tree(self.course), tree)
+
+        version = Course.objects.get(pk=self.course.pk).tree_version
+        Threshold.objects.create(course=self.course, value=50)
+        self.assertEqual(Course.objects.get(pk=self.course.pk).tree_version, version + 1)
+
+        course = Course.objects.get(pk=self.course.pk)
+        tree = get_compiled_tree(course)
+        self.assertEqual(tree.threshold, 50)
+        self.assertEqual(tree.version, course.tree_version)
+
+    def test_node_change_invalidates(self):
+        get_compiled_tree(self.course)
+        self.a.delete()
+        tree = get_compiled_tree(Course.objects.get(pk=self.course.pk))
+        self.assertEqual(tree.node_ids, (self.root.id, self.b.id))
+
+    def test_lru_bound(self):
+        tree_cache.clear()
+        maxsize = tree_cache.maxsize
+        for course_id in range(maxsize + 5):
+            tree_cache.put(CompiledTree(-course_id - 1, 0, []))
+        self.assertEqual(len(tree_cache), maxsize)
+        self.assertIsNone(tree_cache.get(-1, 0))
+        tree_cache.clear()
+
+    def test_summary_skips_tree_queries_when_cached(self):
+        CalculationService.get_course_summary(self.course, self.user)
+        # enrollment, entries
+        with self.assertNumQueries(2):
+            CalculationService.get_course_summary(self.course, self.user)
+
+
+class CourseListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _add_courses(self, count):
+        for _ in range(count):
+            course = Course.objects.create(
+                name=f'Course {Course.objects.count()}', year=2025, term='early', target_enrollment_year=2025
+            )
+            root = EvalNode.objects.create(course=course, name='Total', weight=100)
+            leaf = EvalNode.objects.create(course=course, parent=root, name='Exam', weight=60, input_type='score', is_leaf=True)
+            EvalEntry.objects.create(user=self.user, node=leaf, earned=50, max=100, status='completed')
+            Threshold.objects.create(course=course)
+
+    def _list_queries(self):
+        tree_cache.clear()
+        self.client.get('/api/courses/')
+        tree_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/courses/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()['results']
+
+    def test_query_count_constant(self):
+        self._add_courses(3)
+        small, data = self._list_queries()
+        self._add_courses(10)
+        large, data = self._list_queries()
+        self.assertEqual(small, large)
+        # courses, enrollments, nodes, thresholds, entries
+        self.assertEqual(large, 5)
+        self.assertEqual(len(data), 13)
+
+    def test_summary_matches_single_course(self):
+        self._add_courses(2)
+        _, data = self._list_queries()
+        for item in data:
+            course = Course.objects.get(pk=item['id'])
+            self.assertEqual(item['summary'], CalculationService.get_course_summary(course, self.user))
+            # Listing never enrolls the user
+            self.assertIsNone(item['enrollment_id'])
+            self.assertEqual(item['attendance_mask'], 0)
+
+
+class ReadOnlyGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.course = Course.objects.create(name='Physics', year=2025, term='late', target_enrollment_year=2025)
+        self.leaf = EvalNode.objects.create(course=self.course, name='Exam', weight=100, is_leaf=True, input_type='score', due_date=date(2025, 12, 1))
+
+    def test_reads_do_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            for url in ('/api/courses/', f'/api/courses/{self.course.pk}/', f'/api/courses/{self.course.pk}/summary/',
+                        f'/api/courses/{self.course.pk}/threshold/', '/api/events/'):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        writes = [q['sql'] for q in queries if not q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertFalse(CourseEnrollment.objects.exists())
+        self.assertFalse(Threshold.objects.exists())
+
+    def test_defaults_without_rows(self):
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/threshold/').data, {'value': 60.0})
+        summary = self.client.get(f'/api/courses/{self.course.pk}/summary/').data
+        self.assertEqual(summary['threshold'], 60.0)
+        self.assertEqual(summary['current_attended'], 0)
+        events = self.client.get('/api/events/').json()['results']
+        self.assertEqual([event['id'] for event in events], [self.leaf.pk])
+
+    def test_first_write_creates_rows(self):
+        self.client.post(f'/api/courses/{self.course.pk}/entries/', {'node': self.leaf.pk, 'earned': 80, 'max': 100, 'status': 'completed'}, format='json')
+        enrollment = CourseEnrollment.objects.get(user=self.user, course=self.course)
+        self.assertEqual(enrollment.summary.current_score, 80.0)
+
+        admin = User.objects.create_user(username='teacher', password='password', is_staff=True)
+        self.client.force_authenticate(admin)
+        self.client.put(f'/api/courses/{self.course.pk}/threshold/', {'value': 55}, format='json')
+        self.assertEqual(Threshold.objects.get(course=self.course).value, 55.0)
+        self.assertEqual(self.client.get(f'/api/courses/{self.course.pk}/threshold/').data, {'value': 55.0})
+
+
+class EnrollmentSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='summaryuser', password='password')
+        self.course = Course.objects.create(name='Chemistry', year=2025, term='early', target_enrollment_year=2025)
+        self.root = EvalNode.objects.create(course=self.course, name='Total', weight=100)
+        self.exam = EvalNode.objects.create(course=self.course, parent=self.root, name='Exam', weight=70, input_type='score', is_leaf=True)
+        self.report = EvalNode.objects.create(course=self.course, parent=self.root, name='Report', weight=30, input_type='rate', is_leaf=True)
+        self.enrollment = CourseEnrollment.objects.create(user=self.user, course=self.course)
+
+    def _row(self):
+        return EnrollmentSummary.objects.get(enrollment=self.enrollment)
+
+    def _course(self):
+        return Course.objects.get(pk=self.course.pk)
+
+    def test_entry_write_refreshes_row(self):
+        EvalEntry.objects.create(user=self.user, node=self.exam, earned=80, max=100, status='completed')
+        row = self._row()
+        self.assertTrue(row.is_fresh_for(self._course()))
+        self.assertEqual(row.as_summary(), CalculationService.get_course_summary(self._course(), self.user))
+        self.assertEqual(row.current_score, 56.0)
+
+    def test_fresh_row_is_read_without_evaluation(self):
+        EvalEntry.objects.create(user=self.user, node=self.exam, earned=80, max=100, status='completed')
+        course = self._course()
+        enrollment = CourseEnrollment.objects.select_related('summary').get(pk=self.enrollment.pk)
+        with self.assertNumQueries(0):
+            summary = summaries.get_summary(course, self.user, enrollment)
+        self.assertEqual(summary['predicted_score'], 56.0)
+
+    def test_tree_change_falls_back_to_live(self):
+        EvalEntry.objects.create(user=self.user, node=self.exam, earned=80, max=100, status='completed')
+        self.report.delete()
+        self.assertTrue(self._row().is_stale)
+        summary = summaries.get_summary(self._course(), self.user)
+        self.assertEqual(summary['predicted_score'], 80.0)
+
+    def test_total_classes_change_marks_stale(self):
+        course = self._course()
+        course.total_classes = 10
+        course.save()
+        self.assertTrue(self._row().is_stale)
+
+    def test_rebuild_command(self):
+        EvalEntry.objects.create(user=self.user, node=self.report, rate=50, status='completed')
+        EnrollmentSummary.objects.all().delete()
+        call_command('rebuild_summaries', stdout=StringIO())
+        row = self._row()
+        self.assertEqual(row.current_score, 15.0)
+        self.assertEqual(row.max_score, 85.0)
+
+
+    def test_rebuild_stale_only_includes_missing_rows(self):
+        other = Course.objects.create(name='Fresh', year=2025, term='early', target_enrollment_year=2025)
+        CourseEnrollment.objects.create(user=self.user, course=other)
+        EnrollmentSummary.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_summaries', '--stale-only', stdout=out)
+        self.assertIn('2 summaries rebuilt', out.getvalue())
+        self.assertTrue(self._row().is_fresh_for(self._course()))
+
+        out = StringIO()
+        call_command('rebuild_summaries', '--stale-only', stdout=out)
+        self.assertIn('0 summaries rebuilt', out.getvalue())
+        Course.objects.filter(pk=other.pk).update(tree_version=F('tree_version') + 1)
+        out = StringIO()
+        call_command('rebuild_summaries', '--stale-only', stdout=out)
+        self.assertIn('1 summaries rebuilt', out.getvalue())
+
+class NodeAggregateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='deltauser', password='password')
+        self.course = Course.objects.create(name='Biology', year=2025, term='early', target_enrollment_year=2025)
+        root = EvalNode.objects.create(course=self.course, name='Total', weight=100)
+        self.leaves = []
+        for g in range(3):
+            group = EvalNode.objects.create(course=self.course, parent=root, name=f'G{g}', weight=10 * (g + 1), order=g)
+            sub = EvalNode.objects.create(course=self.course, parent=group, name=f'S{g}', weight=50, order=1)
+            self.leaves.append(EvalNode.objects.create(course=self.course, parent=group, name=f'L{g}', weight=50, input_type='score', is_leaf=True))
+            for k in range(3):
+                self.leaves.append(EvalNode.objects.create(course=self.course, parent=sub, name=f'L{g}{k}', weight=k + 1, input_type='rate', is_leaf=True))
+        CourseEnrollment.objects.create(user=self.user, course=self.course)
+
+    def _assert_consistent(self):
+        course = Course.objects.get(pk=self.course.pk)
+        tree = get_compiled_tree(course)
+        expected = CalculationService.evaluate_tree(tree, CalculationService.get_entry_map(course, self.user))
+        rows = {row.node_id: row for row in NodeAggregate.objects.filter(user=self.user)}
+        for i, node_id in enumerate(tree.node_ids):
+            actual = aggregates.node_scores(rows[node_id])
+            for a, e in zip(actual, expected[i]):
+                if e is None:
+                    self.assertIsNone(a)
+                else:
+                    self.assertAlmostEqual(a, e)
+        row = EnrollmentSummary.objects.get(user=self.user, course=self.course)
+        self.assertEqual(row.as_summary(), CalculationService.get_course_summary(course, self.user))
+
+    def test_delta_updates_match_full_evaluation(self):
+        entries = []
+        for n, leaf in enumerate(self.leaves):
+            if leaf.input_type == 'score':
+                entries.append(EvalEntry.objects.create(user=self.user, node=leaf, earned=n, max=12, status='completed'))
+            else:
+                entries.append(EvalEntry.objects.create(user=self.user, node=leaf, rate=n * 7, status='pending'))
+            self._assert_consistent()
+
+        for entry in entries[::2]:
+            entry.status = 'completed'
+            entry.adjustment = 5
+            entry.save()
+        self._assert_consistent()
+
+        entries[1].delete()
+        self._assert_consistent()
+
+    def test_tree_change_triggers_rebuild(self):
+        entry = EvalEntry.objects.create(user=self.user, node=self.leaves[0], earned=6, max=10, status='completed')
+        EvalNode.objects.create(course=self.course, parent=self.leaves[0].parent, name='New', weight=20, input_type='score', is_leaf=True)
+        entry.earned = 9
+        entry.save()
+        self._assert_consistent()
+
+    def test_entry_write_touches_only_path(self):
+        entry = EvalEntry.objects.create(user=self.user, node=self.leaves[1], rate=40, status='completed')
+        with CaptureQueriesContext(connection) as queries:
+            entry.rate = 90
+            entry.save()
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE "api_nodeaggregate"')]
+        self.assertEqual(len(updates), 1)
+        # leaf, sub-group, group, root
+        self.assertEqual(updates[0].count('WHEN'), 4 * len(aggregates.SUM_FIELDS))
+        self._assert_consistent()
+
+
+    def test_attendance_save_reuses_aggregates(self):
+        EvalEntry.objects.create(user=self.user, node=self.leaves[0], earned=6, max=10, status='completed')
+        enrollment = CourseEnrollment.objects.get(user=self.user, course=self.course)
+        enrollment.attendance_mask = 0b111
+        with CaptureQueriesContext(connection) as queries:
+            enrollment.save()
+        writes = [q['sql'] for q in queries if 'api_nodeaggregate' in q['sql'] and not q['sql'].startswith('SELECT')]
+        self.assertEqual(writes, [])
+        self.assertEqual(EnrollmentSummary.objects.get(enrollment=enrollment).current_attended, 3)
+        self._assert_consistent()
+
+    def test_new_entry_post_saves_once(self):
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(
+                f'/api/courses/{self.course.pk}/entries/',
+                {'node': self.leaves[1].pk, 'rate': 70, 'status': 'completed'}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        statements = [q['sql'].split(' (')[0].split(' SET')[0] for q in queries]
+        self.assertEqual(statements.count('INSERT INTO "api_evalentry"'), 1)
+        self.assertEqual(statements.count('UPDATE "api_evalentry"'), 0)
+        # one leaf-to-root propagation and one summary upsert
+        self.assertEqual(statements.count('UPDATE "api_nodeaggregate"'), 1)
+        self.assertEqual(statements.count('UPDATE "api_enrollmentsummary"'), 1)
+        self._assert_consistent()
+
+    def test_summary_stored_under_the_path_locks(self):
+        from unittest import mock
+
+        entry = EvalEntry.objects.create(user=self.user, node=self.leaves[1], rate=40, status='completed')
+        seen = []
+
+        def recorder(function):
+            def wrapper(*args, **kwargs):
+                seen.append((function.__name__, list(connection.savepoint_ids)))
+                return function(*args, **kwargs)
+            return wrapper
+
+        outer = list(connection.savepoint_ids)
+        with mock.patch.object(aggregates, 'apply_entry', recorder(aggregates.apply_entry)), \
+                mock.patch.object(summaries, '_store', recorder(summaries._store)):
+            entry.rate = 90
+            entry.save()
+        # Both run in the one transaction opened by refresh_for_entry
+        self.assertEqual([name for name, _ in seen], ['apply_entry', '_store'])
+        self.assertEqual(len(seen[0][1]), len(outer) + 1)
+        self.assertEqual(seen[0][1], seen[1][1])
+        self._assert_consistent()
+
+    def test_repeated_updates_do_not_drift(self):
+        entry = EvalEntry.objects.create(user=self.user, node=self.leaves[2], rate=0, status='completed')
+        EvalEntry.objects.create(user=self.user, node=self.leaves[0], earned=7, max=9, status='completed')
+        for n in range(60):
+            entry.rate = (n * 37.3) % 100
+            entry.adjustment = n % 3 * 0.1
+            entry.save()
+        stored = {row.node_id: [getattr(row, field) for field in aggregates.SUM_FIELDS]
+                  for row in NodeAggregate.objects.filter(user=self.user)}
+        summaries.refresh_enrollment(CourseEnrollment.objects.get(user=self.user, course=self.course))
+        rebuilt = {row.node_id: [getattr(row, field) for field in aggregates.SUM_FIELDS]
+                   for row in NodeAggregate.objects.filter(user=self.user)}
+        self.assertEqual(stored, rebuilt)
+
+
+class ConcurrentRefreshTests(TransactionTestCase):
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_interleaved_entry_refreshes_store_latest_summary(self):
+        import threading
+        import time
+        from unittest import mock
+
+        user = User.objects.create_user(username='racer', password='password')
+        course = Course.objects.create(name='Race', year=2025, term='early', target_enrollment_year=2025)
+        root = EvalNode.objects.create(course=course, name='Total', weight=100)
+        leaf = EvalNode.objects.create(course=course, parent=root, name='Quiz', weight=100, input_type='rate', is_leaf=True)
+        CourseEnrollment.objects.create(user=user, course=course)
+        entry_id = EvalEntry.objects.create(user=user, node=leaf, rate=10, status='completed').pk
+        store = summaries._store
+        first_locked = threading.Event()
+
+        def slow_store(*args, **kwargs):
+            # The first refresh holds its locks while the second write starts
+            if threading.current_thread().name == 'first':
+                first_locked.set()
+                time.sleep(0.5)
+            return store(*args, **kwargs)
+
+        def write(rate):
+            try:
+                entry = EvalEntry.objects.get(pk=entry_id)
+                entry.rate = rate
+                entry.save()
+            finally:
+                connection.close()
+
+        with mock.patch.object(summaries, '_store', slow_store):
+            first = threading.Thread(target=write, args=(40,), name='first')
+            first.start()
+            first_locked.wait(5)
+            second = threading.Thread(target=write, args=(90,), name='second')
+            second.start()
+            first.join()
+            second.join()
+        row = EnrollmentSummary.objects.get(user=user, course=course)
+        self.assertEqual(row.current_score, 90.0)
+        self.assertEqual(row.as_summary(), CalculationService.get_course_summary(course, user))
+
+class CohortTests(TestCase):
+    def setUp(self):
+        self.course = Course.objects.create(name='Statistics', year=2025, term='full_year', target_enrollment_year=2025)
+        self.root = EvalNode.objects.create(course=self.course, name='Total', weight=100)
+        mid = EvalNode.objects.create(course=self.course, parent=self.root, name='Mid', weight=50)
+        self.leaves = [
+            EvalNode.objects.create(course=self.course, parent=mid, name='L1', weight=100, input_type='score', is_leaf=True),
+            EvalNode.objects.create(course=self.course, parent=self.root, name='L2', weight=20, input_type='rate', is_leaf=True),
+            EvalNode.objects.create(course=self.course, parent=self.root, name='L3', weight=10, input_type='attendance', is_leaf=True),
+        ]
+        Threshold.objects.create(course=self.course, value=55)
+        self.users = [User.objects.create_user(username=f'cohort{i}', password='password') for i in range(6)]
+        for n, user in enumerate(self.users):
+            CourseEnrollment.objects.create(user=user, course=self.course, attendance_mask=(1 << n) - 1)
+        values = [
+            dict(earned=80, max=100),
+            dict(rate=64.5, adjustment=-3),
+            dict(attended=12, total=15, adjustment=10),
+        ]
+        for n, user in enumerate(self.users):
+            for k, leaf in enumerate(self.leaves):
+                if (n + k) % 3 == 0:
+                    continue
+                status = 'completed' if (n * k) % 2 == 0 else 'pending'
+                EvalEntry.objects.create(user=user, node=leaf, status=status, **values[k])
+
+    def test_matches_calculation_service(self):
+        course = Course.objects.get(pk=self.course.pk)
+        cohort = evaluate_cohort(course)
+        self.assertEqual(len(cohort), len(self.users))
+        for i, user_id in enumerate(cohort.user_ids):
+            user = User.objects.get(pk=user_id)
+            self.assertEqual(cohort.summary(i), CalculationService.get_course_summary(course, user))
+
+    def test_random_trees_match_calculation_service(self):
+        import random
+        from unittest import mock
+
+        rng = random.Random(7)
+        weights = [17.3, 33.3, 33.4, 12.5, 0.1, 49.9, 100]
+        for t in range(8):
+            course = Course.objects.create(name=f'Random {t}', year=2025, term='early', target_enrollment_year=2025)
+            parents = [None]
+            if t % 2:
+                parents = [EvalNode.objects.create(course=course, name='全体評価', weight=100)]
+            leaves = []
+            for k in range(rng.randint(4, 12)):
+                parent = rng.choice(parents)
+                name = f'N{k}'
+                if len(parents) < 5 and rng.random() < 0.4:
+                    parents.append(EvalNode.objects.create(course=course, parent=parent, name=name, weight=rng.choice(weights)))
+                    continue
+                input_type = rng.choice(['score', 'rate', 'attendance'])
+                leaves.append(EvalNode.objects.create(
+                    course=course, parent=parent, name=name, weight=rng.choice(weights), input_type=input_type, is_leaf=True,
+                ))
+            for user in self.users:
+                CourseEnrollment.objects.create(user=user, course=course)
+                for leaf in leaves:
+                    if rng.random() < 0.25:
+                        continue
+                    EvalEntry.objects.create(
+                        user=user, node=leaf, status=rng.choice(['completed', 'completed', 'pending']),
+                        earned=rng.randint(0, 37), max=37, rate=round(rng.uniform(0, 100), 1),
+                        attended=rng.randint(0, 13), total=13, adjustment=rng.choice([0, 3.3, -7.7]),
+                    )
+            course = Course.objects.get(pk=course.pk)
+            cohort = evaluate_cohort(course)
+            for i, user_id in enumerate(cohort.user_ids):
+                user = User.objects.get(pk=user_id)
+                # Unrounded totals must be bit-identical, not just equal after rounding
+                with mock.patch.object(CalculationService, 'build_summary', wraps=CalculationService.build_summary) as build:
+                    expected = CalculationService.get_course_summary(course, user)
+                totals = (float(cohort.current[i]), float(cohort.predicted[i]), float(cohort.maximum[i]))
+                self.assertEqual(totals, build.call_args.args[2], (t, user.username))
+                self.assertEqual(cohort.summary(i), expected)
+
+    def test_course_without_nodes(self):
+        course = Course.objects.create(name='Empty', year=2025, term='early', target_enrollment_year=2025)
+        CourseEnrollment.objects.create(user=self.users[0], course=course)
+        cohort = evaluate_cohort(course)
+        self.assertEqual(cohort.summary(0), CalculationService.get_course_summary(course, self.users[0]))
+
+    def test_endpoint_is_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        self.assertEqual(client.get(f'/api/courses/{self.course.pk}/cohort/').status_code, 403)
+
+        staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+        client.force_authenticate(staff)
+        response = client.get(f'/api/courses/{self.course.pk}/cohort/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['username'] for row in response.json()], [u.username for u in self.users])
+
+
+class RiskRankingTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='ranker', password='password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.courses = []
+        for c, term in enumerate(['early', 'late']):
+            course = Course.objects.create(name=f'Risk {c}', year=2025, term=term, is_required=c == 0, target_enrollment_year=2025)
+            root = EvalNode.objects.create(course=course, name='Total', weight=100)
+            EvalNode.objects.create(course=course, parent=root, name='Exam', weight=100, input_type='score', is_leaf=True)
+            self.courses.append(course)
+        self.students = [User.objects.create_user(username=f'risk{i}', password='password') for i in range(5)]
+        for n, student in enumerate(self.students):
+            for course in self.courses:
+                CourseEnrollment.objects.create(user=student, course=course)
+                leaf = course.nodes.get(is_leaf=True)
+                # risk0 scores 0 (certain fail) ... risk4 scores 80
+                EvalEntry.objects.create(user=student, node=leaf, earned=20 * n, max=100, status='completed')
+
+    def _get(self, **params):
+        response = self.client.get('/api/ranking/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_course_ranking_order_and_pagination(self):
+        data = self._get(course=self.courses[0].pk, limit=2)
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['next_offset'], 2)
+        self.assertEqual([r['username'] for r in data['results']], ['risk0', 'risk1'])
+        self.assertTrue(data['results'][0]['summary']['is_certain_fail'])
+
+        data = self._get(course=self.courses[0].pk, offset=4, limit=2)
+        self.assertEqual([r['rank'] for r in data['results']], [5])
+        self.assertIsNone(data['next_offset'])
+
+    def test_year_ranking_with_filters(self):
+        data = self._get(enrollment_year=2025, limit=100)
+        self.assertEqual(data['count'], 10)
+        data = self._get(enrollment_year=2025, term='late', limit=100)
+        self.assertEqual({r['course_id'] for r in data['results']}, {self.courses[1].pk})
+        data = self._get(enrollment_year=2025, is_required='true', limit=100)
+        self.assertEqual({r['course_id'] for r in data['results']}, {self.courses[0].pk})
+
+    def test_stale_rows_are_evaluated_live(self):
+        # Lower the threshold: every row becomes stale, ranking must use the new value.
+        Threshold.objects.create(course=self.courses[1], value=10)
+        data = self._get(user=self.students[1].pk)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['results'][0]['course_id'], self.courses[0].pk)
+        self.assertEqual(data['results'][1]['summary']['deficit'], 0.0)
+
+    def test_requires_single_scope_and_staff(self):
+        self.assertEqual(self.client.get('/api/ranking/').status_code, 400)
+        self.client.force_authenticate(self.students[0])
+        self.assertEqual(self.client.get('/api/ranking/', {'course': self.courses[0].pk}).status_code, 403)
+
+
+class NodeTreeEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='treeviewer', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.course = Course.objects.create(name='History', year=2025, term='early', target_enrollment_year=2025)
+
+    def _build(self, width, depth):
+        def add(parent, level):
+            for k in range(width):
+                is_leaf = level == depth
+                node = EvalNode.objects.create(
+                    course=self.course, parent=parent, name=f'N{level}-{k}', weight=12.5 * (k + 1),
+                    input_type='score' if is_leaf else 'none', is_leaf=is_leaf, order=width - k,
+                    due_date=date(2025, 7, k + 1) if is_leaf else None,
+                )
+                if not is_leaf:
+                    add(node, level + 1)
+        add(None, 1)
+
+    def test_matches_recursive_serializer(self):
+        self._build(width=3, depth=3)
+        roots = self.course.nodes.filter(parent__isnull=True).order_by('order')
+        expected = JSONRenderer().render(EvalNodeSerializer(roots, many=True).data)
+        response = self.client.get(f'/api/courses/{self.course.pk}/nodes/')
+        self.assertEqual(response.content, expected)
+
+    def test_query_count_independent_of_shape(self):
+        self._build(width=4, depth=3)
+        tree_cache.clear()
+        # course, nodes, threshold
+        with self.assertNumQueries(3):
+            self.client.get(f'/api/courses/{self.course.pk}/nodes/')
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='etagger', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.course = Course.objects.create(name='Biology', year=2025, term='early', target_enrollment_year=2025)
+        self.leaf = EvalNode.objects.create(course=self.course, name='Exam', weight=100, is_leaf=True, input_type='score')
+        CourseEnrollment.objects.create(user=self.user, course=self.course)
+        EvalEntry.objects.create(user=self.user, node=self.leaf, earned=70, max=100, status=EvalEntry.Status.COMPLETED)
+
+    def _url(self, suffix):
+        return f'/api/courses/{self.course.pk}/{suffix}'
+
+    def test_not_modified_before_evaluation(self):
+        # course + version stamps only; nothing is evaluated or serialized
+        budgets = {'': 3, 'nodes/': 1, 'entries/': 2, 'summary/': 3}
+        for suffix, budget in budgets.items():
+            first = self.client.get(self._url(suffix))
+            self.assertEqual(first.status_code, 200)
+            self.assertEqual(first['Cache-Control'], 'private, no-cache')
+            with self.assertNumQueries(budget):
+                second = self.client.get(self._url(suffix), HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(second.status_code, 304)
+            self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_etag_changes_with_entries_and_tree(self):
+        summary_etag = self.client.get(self._url('summary/'))['ETag']
+        nodes_etag = self.client.get(self._url('nodes/'))['ETag']
+
+        self.client.post(self._url('entries/'), {'node': self.leaf.pk, 'earned': 40}, format='json')
+        response = self.client.get(self._url('summary/'), HTTP_IF_NONE_MATCH=summary_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['current_score'], 40.0)
+        self.assertEqual(self.client.get(self._url('nodes/'), HTTP_IF_NONE_MATCH=nodes_etag).status_code, 304)
+
+        Threshold.objects.create(course=self.course, value=50)
+        self.assertEqual(self.client.get(self._url('nodes/'), HTTP_IF_NONE_MATCH=nodes_etag).status_code, 200)
+
+    def test_etags_are_per_user(self):
+        etag = self.client.get(self._url('entries/'))['ETag']
+        other = User.objects.create_user(username='other', password='password')
+        UserProfile.objects.create(user=other, enrollment_year=2025)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self._url('entries/'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etags_are_per_representation(self):
+        entries_etag = self.client.get(self._url('entries/'))['ETag']
+        for query in ('?page_size=1', '?fields=id', '?omit=status'):
+            response = self.client.get(self._url(f'entries/{query}'), HTTP_IF_NONE_MATCH=entries_etag)
+            self.assertEqual(response.status_code, 200, query)
+        detail_etag = self.client.get(self._url(''))['ETag']
+        response = self.client.get(self._url('?omit=summary'), HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('summary', response.data)
+        # Field lists are compared as sets
+        fields_etag = self.client.get(self._url('?fields=id,name'))['ETag']
+        self.assertEqual(self.client.get(self._url('?fields=name, id'), HTTP_IF_NONE_MATCH=fields_etag).status_code, 304)
+
+
+class BulkEntryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulker', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.course = Course.objects.create(name='Chemistry', year=2025, term='early', target_enrollment_year=2025)
+        root = EvalNode.objects.create(course=self.course, name='Total', weight=100)
+        self.leaves = [
+            EvalNode.objects.create(course=self.course, parent=root, name=f'Quiz {k}', weight=10, input_type='score', is_leaf=True)
+            for k in range(10)
+        ]
+        self.url = f'/api/courses/{self.course.pk}/entries/bulk/'
+
+    def _items(self, earned):
+        return [{'node': leaf.pk, 'earned': earned, 'max': 100, 'status': 'completed'} for leaf in self.leaves]
+
+    def test_upsert_and_summary(self):
+        response = self.client.post(self.url, self._items(50), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 10)
+        self.assertEqual(response.data['summary']['current_score'], 50.0)
+
+        # Update a subset; omitted fields keep their stored values
+        response = self.client.post(self.url, [{'node': self.leaves[0].pk, 'earned': 100}], format='json')
+        self.assertEqual(response.data['summary']['current_score'], 55.0)
+        entry = EvalEntry.objects.get(user=self.user, node=self.leaves[0])
+        self.assertEqual((entry.earned, entry.max, entry.status), (100, 100, 'completed'))
+        self.assertEqual(EvalEntry.objects.filter(user=self.user).count(), 10)
+        self.assertEqual(
+            response.data['summary'],
+            CalculationService.get_course_summary(self.course, self.user),
+        )
+        self.assertEqual(summaries.get_summary(self.course, self.user), response.data['summary'])
+
+    def test_query_count_independent_of_batch_size(self):
+        self.client.post(self.url, self._items(10)[:2], format='json')
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, self._items(20)[:2], format='json')
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.url, self._items(30), format='json')
+        self.assertEqual(len(small), len(large))
+
+    def test_first_enrollment_rebuilds_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self._items(50), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(CourseEnrollment.objects.filter(user=self.user, course=self.course).exists())
+        statements = [q['sql'].split(' (')[0].split(' SET')[0] for q in queries]
+        # One rebuild: one aggregate upsert and one summary write, not one more for the new enrollment
+        self.assertEqual(statements.count('INSERT INTO "api_nodeaggregate"'), 1)
+        summary_writes = [sql for sql in statements if sql.startswith(('INSERT INTO "api_enrollmentsummary"', 'UPDATE "api_enrollmentsummary"'))]
+        self.assertEqual(len(summary_writes), 1)
+        self.assertEqual(len(queries), 19)
+        self.assertEqual(response.data['summary']['current_score'], 50.0)
+
+    def test_rejects_foreign_and_inner_nodes(self):
+        other = Course.objects.create(name='Other', year=2025, term='early', target_enrollment_year=2025)
+        foreign = EvalNode.objects.create(course=other, name='Exam', weight=100, input_type='score', is_leaf=True)
+        inner = self.leaves[0].parent
+        response = self.client.post(self.url, self._items(50) + [{'node': foreign.pk}, {'node': inner.pk}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['node']), 2)
+        self.assertFalse(EvalEntry.objects.exists())
+        self.assertEqual(self.client.post(self.url, [{'earned': 1}], format='json').status_code, 400)
+
+
+class DebugLogTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = os.path.join(self.dir.name, 'logs', 'debug.log')
+
+    def test_batched_writes_and_rotation(self):
+        writer = debug_log.DebugLogWriter(self.path, max_bytes=1000, backup_count=2, queue_size=1000)
+        for i in range(100):
+            writer.put({'location': 'test', 'i': i})
+            if i % 20 == 19:
+                writer.flush()
+        files = sorted(os.listdir(os.path.dirname(self.path)))
+        self.assertEqual(files, ['debug.log', 'debug.log.1', 'debug.log.2'])
+        with open(self.path) as f:
+            last = [json.loads(line) for line in f]
+        self.assertEqual(last[-1]['i'], 99)
+        self.assertLessEqual(os.path.getsize(self.path), 1000)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        writer = debug_log.DebugLogWriter(self.path, max_bytes=0, backup_count=0, queue_size=1)
+        writer._thread = object()  # no consumer
+        writer.put({'i': 1})
+        writer.put({'i': 2})
+        self.assertEqual(writer.dropped, 1)
+
+    def test_sampling(self):
+        with override_settings(DEBUG_LOG_PATH=self.path, DEBUG_LOG_SAMPLING={'ATT': 0}):
+            self.assertFalse(debug_log.enabled('ATT'))
+            self.assertTrue(debug_log.enabled('H1'))
+        with override_settings(DEBUG_LOG_PATH=''):
+            self.assertFalse(debug_log.enabled('H1'))
+
+
+class HealthTests(TestCase):
+    def test_health_is_public(self):
+        response = APIClient().get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'status': 'ok'})
+
+    def test_schema_status(self):
+        client = APIClient()
+        student = User.objects.create_user(username='student', password='password')
+        client.force_authenticate(student)
+        self.assertEqual(client.get('/api/health/schema/').status_code, 403)
+
+        client.force_authenticate(User.objects.create_user(username='admin', password='password', is_staff=True))
+        response = client.get('/api/health/schema/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['ok'])
+        self.assertIn('target_enrollment_year', response.data['api_course_columns'])
+
+        out = StringIO()
+        call_command('schema_status', '--json', '--check', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['pending'], [])
+
+
+@override_settings(PERFORMANCE_METRICS_ENABLED=True)
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        from . import middleware
+        self.registry = middleware.registry
+        self.registry.clear()
+        self.admin = User.objects.create_user(username='ops', password='password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.course = Course.objects.create(name='Art', year=2025, term='early', target_enrollment_year=2025)
+        EvalNode.objects.create(course=self.course, name='Work', weight=100, input_type='score', is_leaf=True)
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(f'/api/courses/{self.course.pk}/summary/')
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertRegex(timing, r'desc="\d+ queries"')
+
+        metrics = self.client.get('/api/metrics/')
+        self.assertTrue(metrics['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = metrics.content.decode()
+        self.assertIn('rakutan_request_duration_seconds_count{route="course-summary"} 1', body)
+        self.assertIn('rakutan_request_queries_bucket{route="course-summary",le="+Inf"} 1', body)
+
+    def test_metrics_are_staff_only(self):
+        student = User.objects.create_user(username='pupil', password='password')
+        self.client.force_authenticate(student)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+    @override_settings(PERFORMANCE_METRICS_ENABLED=False)
+    def test_disabled_middleware_is_not_loaded(self):
+        response = APIClient().get('/api/health/')
+        self.assertNotIn('Server-Timing', response)
+
+
+class BenchmarkDataTests(TestCase):
+    def test_generated_dataset(self):
+        from benchmarks.datagen import Params, generate
+
+        params = Params(years=1, courses_per_year=2, depth=2, fanout=2, students_per_year=3, density=0.5)
+        counts, students_by_year = generate(params)
+        self.assertEqual(counts['courses'], 2)
+        self.assertEqual(counts['enrollments'], 6)
+        # root + 2 + 4 nodes per course
+        self.assertEqual(counts['nodes'], 14)
+        student = students_by_year[params.first_year][0]
+        for course in Course.objects.all():
+            self.assertEqual(summaries.get_summary(course, student), CalculationService.get_course_summary(course, student))
+
+        # Same seed, same data
+        entries = list(EvalEntry.objects.order_by('id').values_list('earned', 'rate', 'attended'))
+        EvalEntry.objects.all().delete()
+        User.objects.all().delete()
+        Course.objects.all().delete()
+        generate(params)
+        self.assertEqual(list(EvalEntry.objects.order_by('id').values_list('earned', 'rate', 'attended')), entries)
+
+
+@override_settings(DEBUG_LOG_PATH='')
+class QueryBudgetTests(TestCase):
+    """
+    Exact SQL query count per endpoint, with token authentication, for a small
+    and a large fixture. Budgets must not grow with courses, nodes or entries.
+    The token's identity is cached, so authenticated requests need no
+    token, user or profile queries.
+    """
+    BUDGETS = {
+        'course_list': 2,     # courses, enrollments with summary rows
+        'course_detail': 4,   # course, 2 ETag stamps, enrollment with summary row
+        'nodes': 3,           # course, nodes, threshold
+        'entries': 3,         # course, ETag stamp, entries
+        'summary': 4,         # course, 2 ETag stamps, enrollment with summary row
+        'events': 1,          # nodes joined with courses
+        'entry_post': 17,     # upsert, then the locked leaf-to-root aggregate refresh
+        'attendance': 10,     # enrollment save, then a summary from the top-level aggregates
+        'register': 3,
+        'me': 0,              # user and profile rebuilt from the cached identity
+    }
+
+    def setUp(self):
+        from rest_framework.authtoken.models import Token
+
+        self.user = User.objects.create_user(username='budget', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.courses = []
+
+    def _add_courses(self, count, leaves):
+        for _ in range(count):
+            course = Course.objects.create(
+                name=f'Course {len(self.courses)}', year=2025, term='early', target_enrollment_year=2025
+            )
+            root = EvalNode.objects.create(course=course, name='全体評価', weight=100)
+            group = EvalNode.objects.create(course=course, parent=root, name='Tests', weight=100)
+            for k in range(leaves):
+                leaf = EvalNode.objects.create(
+                    course=course, parent=group, name=f'Test {k}', weight=10, input_type='score',
+                    is_leaf=True, due_date=date(2025, 6, k % 28 + 1),
+                )
+                EvalEntry.objects.create(user=self.user, node=leaf, earned=70, max=100, status='completed')
+            CourseEnrollment.objects.get_or_create(user=self.user, course=course)
+            self.courses.append(course)
+
+    def _count(self, method, url, data=None, client=None):
+        tree_cache.clear()
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, (url, response.status_code))
+        return len(queries)
+
+    def _measure(self):
+        self.client.get('/api/me/')  # caches the token's identity
+        course = self.courses[0]
+        leaf = EvalNode.objects.filter(course=course, is_leaf=True).first()
+        base = f'/api/courses/{course.pk}/'
+        return {
+            'me': self._count('get', '/api/me/'),
+            'course_list': self._count('get', '/api/courses/'),
+            'course_detail': self._count('get', base),
+            'nodes': self._count('get', f'{base}nodes/'),
+            'entries': self._count('get', f'{base}entries/'),
+            'summary': self._count('get', f'{base}summary/'),
+            'events': self._count('get', '/api/events/'),
+            'entry_post': self._count('post', f'{base}entries/', {'node': leaf.pk, 'earned': 80, 'max': 100, 'status': 'completed'}),
+            'attendance': self._count('patch', f'{base}attendance/', {'attendance_mask': 7}),
+            'register': self._count('post', '/api/register/', {
+                'username': f'new{len(self.courses)}', 'password': 'password', 'full_name': 'New Student',
+                'student_id': f'S{len(self.courses)}', 'date_of_birth': '2006-04-01', 'enrollment_year': 2025,
+            }, client=APIClient()),
+        }
+
+    def test_budgets_constant_in_fixture_size(self):
+        self._add_courses(2, leaves=3)
+        small = self._measure()
+        self._add_courses(12, leaves=15)
+        large = self._measure()
+        self.assertEqual(small, large)
+        self.assertEqual(large, self.BUDGETS)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        from rest_framework.authtoken.models import Token
+        from .authentication import identity_cache
+
+        self.identity_cache = identity_cache
+        self.user = User.objects.create_user(username='tokenuser', password='password')
+        self.profile = UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        Course.objects.create(name='Math', year=2025, term='early', target_enrollment_year=2025)
+        Course.objects.create(name='Old Math', year=2024, term='early', target_enrollment_year=2024)
+
+    def test_cached_identity_needs_no_queries(self):
+        self.client.get('/api/events/')
+        # events: one query for the nodes; no token, user or profile lookups
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/events/').status_code, 200)
+        self.assertEqual([c['name'] for c in self.client.get('/api/courses/').json()['results']], ['Math'])
+
+    def test_cached_user_fields(self):
+        from .authentication import CachedTokenAuthentication
+
+        self.user.email = 'token@example.com'
+        self.user.save()
+        self.profile.full_name = 'Token User'
+        self.profile.save()
+        authentication = CachedTokenAuthentication()
+        authentication.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate_credentials(self.token.key)
+            self.assertEqual(user.username, 'tokenuser')
+            self.assertIs(user.is_active, True)
+            self.assertIs(user.is_superuser, False)
+            self.assertIs(user.is_staff, False)
+            self.assertEqual(user.profile.full_name, 'Token User')
+        with self.assertNumQueries(0):
+            data = self.client.get('/api/me/').json()
+        self.assertEqual(data['username'], 'tokenuser')
+        self.assertEqual(data['email'], 'token@example.com')
+        self.assertEqual(data['full_name'], 'Token User')
+        self.assertEqual(data['enrollment_year'], 2025)
+
+    def test_profile_change_is_seen(self):
+        self.client.get('/api/courses/')
+        self.profile.enrollment_year = 2024
+        self.profile.save()
+        self.assertEqual([c['name'] for c in self.client.get('/api/courses/').json()['results']], ['Old Math'])
+
+    def test_logout_revokes_token(self):
+        self.client.get('/api/me/')
+        self.assertEqual(self.client.post('/api/logout/').status_code, 204)
+        response = self.client.get('/api/me/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['detail'], 'Invalid token.')
+
+    def test_expired_token(self):
+        from rest_framework.authtoken.models import Token
+
+        with override_settings(TOKEN_EXPIRE_SECONDS=3600):
+            Token.objects.filter(pk=self.token.pk).update(created=self.token.created - timedelta(hours=2))
+            response = self.client.get('/api/me/')
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.data['detail'], 'Token has expired.')
+            self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+            response = APIClient().post('/api/login/', {'username': 'tokenuser', 'password': 'password'}, format='json')
+            self.assertNotEqual(response.data['token'], self.token.key)
+            self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+            self.assertEqual(self.client.get('/api/me/').data['enrollment_year'], 2025)
+
+
+class DatabaseSettingsTests(TestCase):
+    def _apply(self, db, **env):
+        from unittest import mock
+        from config.settings import _apply_connection_settings
+
+        with mock.patch.dict(os.environ, env):
+            return _apply_connection_settings(db)
+
+    def test_sqlite_tuning(self):
+        db = self._apply({'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'db.sqlite3'})
+        self.assertEqual(db['CONN_MAX_AGE'], 60)
+        self.assertTrue(db['CONN_HEALTH_CHECKS'])
+        self.assertEqual(db['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+        pragmas = db['OPTIONS']['init_command'].split(';')
+        self.assertEqual(pragmas[0], 'PRAGMA journal_mode=WAL')
+        self.assertIn('PRAGMA synchronous=NORMAL', pragmas)
+        self.assertIn('PRAGMA busy_timeout=5000', pragmas)
+
+    def test_postgres_pool_disables_persistent_connections(self):
+        db = self._apply({'ENGINE': 'django.db.backends.postgresql', 'NAME': 'rakutan'}, DB_CONN_MAX_AGE='120')
+        self.assertEqual(db['CONN_MAX_AGE'], 120)
+        self.assertNotIn('pool', db['OPTIONS'])
+
+        db = self._apply({'ENGINE': 'django.db.backends.postgresql', 'NAME': 'rakutan'}, DB_POOL='true', DB_POOL_MAX_SIZE='4')
+        self.assertEqual(db['CONN_MAX_AGE'], 0)
+        self.assertEqual(db['OPTIONS']['pool']['max_size'], 4)
+
+
+class IndexUsageTests(TestCase):
+    """EXPLAIN the hot queries and check they are answered from an index."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='planner', password='password')
+        self.course = Course.objects.create(name='Logic', year=2025, term='early', target_enrollment_year=2025)
+        root = EvalNode.objects.create(course=self.course, name='Total', weight=100)
+        self.leaf = EvalNode.objects.create(course=self.course, parent=root, name='Exam', weight=100, is_leaf=True, due_date=date(2025, 7, 1))
+        CourseEnrollment.objects.create(user=self.user, course=self.course)
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be scanned sequentially.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+            self.assertRegex(plan, r'Index (Only )?Scan|Bitmap Index Scan', plan)
+            self.assertIn(index_name, plan)
+        elif connection.vendor == 'sqlite':
+            plan = queryset.explain()
+            self.assertRegex(plan, rf'USING (COVERING )?INDEX {index_name}', plan)
+        else:
+            self.skipTest(f'no EXPLAIN check for {connection.vendor}')
+
+    def test_tree_load(self):
+        self.assertUsesIndex(
+            EvalNode.objects.filter(course_id__in=[self.course.pk]).order_by('order', 'id').values_list('id', 'parent_id'),
+            'evalnode_course_parent_idx',
+        )
+
+    def test_children(self):
+        self.assertUsesIndex(
+            EvalNode.objects.filter(course=self.course, parent=self.leaf.parent_id).order_by('order'),
+            'evalnode_course_parent_idx',
+        )
+
+    def test_course_events(self):
+        self.assertUsesIndex(
+            EvalNode.objects.filter(course=self.course, due_date__isnull=False).order_by('due_date'),
+            'evalnode_course_due_idx',
+        )
+
+    def test_event_window(self):
+        request = APIRequestFactory().get('/api/events/')
+        request.user = self.user
+        view = EventViewSet(request=request)
+        self.assertUsesIndex(view.visible_events(date(2025, 6, 1), date(2025, 7, 31)), 'evalnode_course_due_idx')
+
+    def test_courses_of_enrollment_year(self):
+        self.assertUsesIndex(Course.objects.filter(target_enrollment_year=2025), 'course_target_year_idx')
+
+    def test_enrollments_of_user(self):
+        self.assertUsesIndex(CourseEnrollment.objects.filter(user=self.user), 'api_courseenrollment_user_id')
+
+    def test_entries_of_user_in_course(self):
+        self.assertUsesIndex(EvalEntry.objects.filter(user=self.user, node__course=self.course), 'api_evalentry_user_id')
+
+
+class PaginationAndFieldsetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='pager', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for k in range(5):
+            course = Course.objects.create(name=f'Course {k}', year=2025, term='early', target_enrollment_year=2025)
+            leaf = EvalNode.objects.create(course=course, name='Exam', weight=100, is_leaf=True, input_type='score', due_date=date(2025, 7, k + 1))
+            EvalEntry.objects.create(user=self.user, node=leaf, earned=50, max=100, status='completed')
+
+    def test_paginated_by_default(self):
+        from unittest import mock
+        from .pagination import ListCursorPagination
+
+        for url in ('/api/courses/', '/api/events/', f'/api/courses/{Course.objects.first().pk}/entries/'):
+            page = self.client.get(url).json()
+            self.assertEqual(set(page), {'next', 'previous', 'results'})
+        with mock.patch.object(ListCursorPagination, 'page_size', 2):
+            page = self.client.get('/api/courses/').json()
+        self.assertEqual(len(page['results']), 2)
+        self.assertIsNotNone(page['next'])
+        # page_size is capped at max_page_size
+        self.assertEqual(len(self.client.get('/api/courses/', {'page_size': 10 ** 6}).json()['results']), 5)
+
+    def test_cursor_pages(self):
+        for url in ('/api/courses/', '/api/events/'):
+            names = []
+            page = self.client.get(url, {'page_size': 2}).json()
+            while True:
+                self.assertLessEqual(len(page['results']), 2)
+                names.extend(item['name'] for item in page['results'])
+                if not page['next']:
+                    break
+                page = self.client.get(page['next']).json()
+            self.assertEqual(len(names), 5)
+            self.assertEqual([item['name'] for item in self.client.get(url).json()['results']], names)
+
+    def test_entries_cursor(self):
+        course = Course.objects.get(name='Course 0')
+        page = self.client.get(f'/api/courses/{course.pk}/entries/', {'page_size': 10}).json()
+        self.assertEqual(len(page['results']), 1)
+        self.assertIsNone(page['next'])
+
+    def test_omit_summary_skips_evaluation(self):
+        tree_cache.clear()
+        # courses only: no enrollment, node, threshold or entry queries
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/courses/', {'omit': 'summary,attendance_mask,enrollment_id'}).json()['results']
+        self.assertNotIn('summary', data[0])
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/courses/', {'omit': 'summary'}).json()['results']
+        self.assertEqual(data[0]['attendance_mask'], 0)
+
+    def test_fields(self):
+        data = self.client.get('/api/events/', {'fields': 'id,due_date'}).json()['results']
+        self.assertEqual(set(data[0]), {'id', 'due_date'})
+
+
+class EventWindowAndFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='subscriber', password='password')
+        UserProfile.objects.create(user=self.user, enrollment_year=2025)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        course = Course.objects.create(name='線形代数, 第一', year=2025, term='early', target_enrollment_year=2025)
+        for month in (4, 5, 6, 7):
+            EvalNode.objects.create(course=course, name=f'課題 {month}', weight=25, is_leaf=True, input_type='score', due_date=date(2025, month, 10))
+        other = Course.objects.create(name='Other', year=2025, term='early', target_enrollment_year=2024)
+        EvalNode.objects.create(course=other, name='Hidden', weight=100, is_leaf=True, due_date=date(2025, 5, 1))
+
+    def test_window(self):
+        data = self.client.get('/api/events/', {'from': '2025-05-10', 'to': '2025-06-10'}).json()['results']
+        self.assertEqual([event['name'] for event in data], ['課題 5', '課題 6'])
+        self.assertEqual(data[0]['course_name'], '線形代数, 第一')
+        self.assertEqual(len(self.client.get('/api/events/', {'from': '2025-06-01'}).json()['results']), 2)
+
+    def test_invalid_window(self):
+        self.assertEqual(self.client.get('/api/events/', {'from': 'June'}).status_code, 400)
+
+    def test_list_is_one_query_per_window(self):
+        with self.assertNumQueries(1):
+            self.client.get('/api/events/', {'from': '2025-04-01', 'to': '2025-12-31'})
+
+    def _feed(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_feed(self):
+        body = self._feed(self.client.get('/api/events/feed.ics/', {'from': '2025-05-01'}))
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 3)
+        self.assertIn('DTSTART;VALUE=DATE:20250510\r\n', body)
+        self.assertIn('DTEND;VALUE=DATE:20250511\r\n', body)
+        self.assertIn('SUMMARY:線形代数\\, 第一: 課題 5\r\n', body)
+        self.assertNotIn('Hidden', body)
+        for line in body.split('\r\n'):
+            self.assertLessEqual(len(line.encode('utf-8')), 75)
+
+    def test_feed_key(self):
+        url = self.client.get('/api/events/feed-url/').json()['url']
+        self.assertIn('/api/events/feed.ics/?key=', url)
+        anonymous = APIClient()
+        body = self._feed(anonymous.get(url, HTTP_ACCEPT='text/calendar'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 4)
+
+        self.assertIn(anonymous.get('/api/events/feed.ics/', {'key': 'forged'}).status_code, (401, 403))
+        self.user.set_password('changed')
+        self.user.save()
+        self.assertIn(anonymous.get(url).status_code, (401, 403))
+
+    def test_fold(self):
+        line = 'SUMMARY:' + 'あ' * 40
+        folded = fold(line)
+        self.assertTrue(folded.endswith('\r\n'))
+        self.assertEqual(folded.replace('\r\n ', '').rstrip('\r\n'), line)
+        for piece in folded.rstrip('\r\n').split('\r\n'):
+            self.assertLessEqual(len(piece.encode('utf-8')), 75)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='exporter', password='password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.students = []
+        for i in range(2):
+            student = User.objects.create_user(username=f'export{i}', password='password')
+            UserProfile.objects.create(user=student, enrollment_year=2025)
+            self.students.append(student)
+        self.courses = []
+        for c in range(3):
+            course = Course.objects.create(name=f'Export {c}', year=2025, term='early', target_enrollment_year=2025)
+            Threshold.objects.create(course=course, value=50.0)
+            root = EvalNode.objects.create(course=course, name='Total', weight=100)
+            group = EvalNode.objects.create(course=course, parent=root, name='Reports', weight=40)
+            exam = EvalNode.objects.create(course=course, parent=root, name='Exam', weight=60, input_type='score', is_leaf=True, order=1, due_date=date(2025, 7, 1))
+            report = EvalNode.objects.create(course=course, parent=group, name='Report, 1', weight=100, input_type='rate', is_leaf=True)
+            for n, student in enumerate(self.students):
+                CourseEnrollment.objects.create(user=student, course=course, attendance_mask=0b111)
+                EvalEntry.objects.create(user=student, node=exam, earned=40 + 40 * n, max=100, status='completed')
+                EvalEntry.objects.create(user=student, node=report, rate=90, status='completed')
+            self.courses.append(course)
+        Course.objects.create(name='Empty', year=2024, term='late', target_enrollment_year=2024)
+
+    def _rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        body = b''.join(response.streaming_content).decode('utf-8-sig')
+        return list(csv.DictReader(StringIO(body)))
+
+    def test_courses_csv(self):
+        rows = self._rows(self.client.get('/api/export/courses.csv'))
+        self.assertEqual(len(rows), 3 * 4 + 1)
+        course_rows = [row for row in rows if row['course_name'] == 'Export 0']
+        self.assertEqual([row['node_path'] for row in course_rows], ['Total', 'Total/Reports', 'Total/Reports/Report, 1', 'Total/Exam'])
+        seen = set()
+        for row in course_rows:
+            self.assertTrue(not row['parent_id'] or row['parent_id'] in seen)
+            seen.add(row['node_id'])
+        self.assertEqual(course_rows[0]['threshold'], '50.0')
+        self.assertEqual(course_rows[-1]['due_date'], '2025-07-01')
+        empty = [row for row in rows if row['course_name'] == 'Empty']
+        self.assertEqual(empty[0]['node_id'], '')
+
+    def test_filters(self):
+        self.assertEqual(len(self._rows(self.client.get('/api/export/courses.csv', {'enrollment_year': 2024}))), 1)
+        self.assertEqual(len(self._rows(self.client.get('/api/export/courses.csv', {'course': self.courses[1].pk}))), 4)
+        self.assertEqual(len(self._rows(self.client.get('/api/export/entries.csv', {'term': 'late'}))), 0)
+        self.assertEqual(self.client.get('/api/export/courses.csv', {'year': 'last'}).status_code, 400)
+
+    def test_entries_csv(self):
+        rows = self._rows(self.client.get('/api/export/entries.csv'))
+        self.assertEqual(len(rows), 3 * 2 * 2)
+        row = next(r for r in rows if r['username'] == 'export1' and r['node_path'] == 'Total/Exam')
+        self.assertEqual((row['earned'], row['max'], row['status']), ('80.0', '100.0', 'completed'))
+        self.assertTrue(row['updated_at'])
+
+    def test_summaries_csv_matches_service(self):
+        rows = self._rows(self.client.get('/api/export/summaries.csv'))
+        self.assertEqual(len(rows), 3 * 2)
+        for row in rows:
+            course = Course.objects.get(pk=row['course_id'])
+            expected = CalculationService.get_course_summary(course, User.objects.get(username=row['username']))
+            self.assertAlmostEqual(float(row['predicted_score']), expected['predicted_score'])
+            self.assertEqual(row['is_fail_predicted'], str(expected['is_fail_predicted']))
+            self.assertEqual(row['attendance_mask'], '7')
+
+    def test_students_export_their_own_rows(self):
+        client = APIClient()
+        client.force_authenticate(self.students[0])
+        self.assertEqual({row['username'] for row in self._rows(client.get('/api/export/entries.csv'))}, {'export0'})
+        summaries_rows = self._rows(client.get('/api/export/summaries.csv'))
+        self.assertEqual(len(summaries_rows), 3)
+        self.assertEqual({row['username'] for row in summaries_rows}, {'export0'})
+        # only the courses of their enrollment year
+        self.assertNotIn('Empty', {row['course_name'] for row in self._rows(client.get('/api/export/courses.csv'))})
+
+    def test_queries_do_not_grow_with_courses(self):
+        def count(kind):
+            with CaptureQueriesContext(connection) as queries:
+                self._rows(self.client.get(f'/api/export/{kind}.csv'))
+            return len(queries)
+
+        before = {kind: count(kind) for kind in ('courses', 'entries')}
+        for c in range(3, 8):
+            course = Course.objects.create(name=f'Export {c}', year=2025, term='early', target_enrollment_year=2025)
+            leaf = EvalNode.objects.create(course=course, name='Exam', weight=100, input_type='score', is_leaf=True)
+            EvalEntry.objects.create(user=self.students[0], node=leaf, earned=50, max=100, status='completed')
+        self.assertEqual({kind: count(kind) for kind in ('courses', 'entries')}, before)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'courses.csv')
+            call_command('export_csv', 'courses', '--enrollment-year', '2025', '-o', path)
+            with open(path, encoding='utf-8-sig') as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 12)
+        out = StringIO()
+        call_command('export_csv', 'entries', '--course', str(self.courses[0].pk), stdout=out)
+        self.assertEqual(len(list(csv.DictReader(StringIO(out.getvalue().lstrip('\ufeff'))))), 4)
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='importer', password='password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.students = [User.objects.create_user(username=f'import{i}', password='password') for i in range(2)]
+
+    def _catalog(self, leaves=2, name='Imported'):
+        return {'courses': [{
+            'name': name, 'year': 2026, 'term': 'early', 'target_enrollment_year': 2026, 'threshold': 55,
+            'nodes': [{'name': 'Total', 'weight': 100, 'children': [
+                {'name': 'Exams', 'weight': 60, 'children': [
+                    {'id': f'exam{k}', 'name': f'Exam {k}', 'weight': 10, 'input_type': 'score', 'due_date': '2026-07-01'}
+                    for k in range(leaves)
+                ]},
+                {'name': 'Attendance', 'weight': 40, 'input_type': 'attendance'},
+            ]}],
+            'enrollments': [{'username': 'import0', 'attendance_mask': 5}],
+            'entries': [
+                {'username': 'import0', 'node': 'exam0', 'earned': 70, 'max': 100, 'status': 'completed'},
+                {'username': 'import1', 'node_path': 'Total/Attendance', 'attended': 9, 'total': 10, 'status': 'completed'},
+            ],
+        }]}
+
+    def test_json_import(self):
+        response = self.client.post('/api/import/', self._catalog(), format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        report = response.json()
+        self.assertEqual((report['created'], report['nodes'], report['entries'], report['enrollments']), (1, 5, 2, 2))
+        self.assertIsNotNone(report['rows_per_second'])
+
+        course = Course.objects.get(name='Imported')
+        self.assertEqual(course.threshold.value, 55)
+        exams = EvalNode.objects.get(course=course, name='Exams')
+        self.assertEqual(list(exams.children.order_by('order').values_list('name', 'is_leaf')), [('Exam 0', True), ('Exam 1', True)])
+        self.assertFalse(exams.is_leaf)
+        self.assertEqual(CourseEnrollment.objects.get(user=self.students[0], course=course).attendance_mask, 5)
+        for student in self.students:
+            row = EnrollmentSummary.objects.get(user=student, course=course)
+            self.assertTrue(row.is_fresh_for(course))
+            self.assertAlmostEqual(row.predicted_score, CalculationService.get_course_summary(course, student)['predicted_score'])
+
+    def test_queries_per_level_not_per_node(self):
+        def count(leaves, name):
+            specs, _ = importer.parse_json(self._catalog(leaves, name))
+            tree_cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                report = importer.import_courses(specs)
+            self.assertEqual(report['created'], 1)
+            return len(queries)
+
+        self.assertEqual(count(2, 'Small'), count(40, 'Large'))
+
+    def test_replace_queries_not_per_old_node(self):
+        def count(leaves, name):
+            self.client.post('/api/import/', self._catalog(leaves, name), format='json')
+            course = Course.objects.get(name=name)
+            summaries.refresh_enrollment(CourseEnrollment.objects.get(user=self.students[0], course=course))
+            self.assertTrue(NodeAggregate.objects.filter(node__course=course).exists())
+            specs, _ = importer.parse_json(self._catalog(2, name))
+            tree_cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                report = importer.import_courses(specs, mode='replace')
+            self.assertEqual(report['replaced'], 1)
+            self.assertEqual(EvalNode.objects.filter(course=course).count(), 5)
+            self.assertEqual(EvalEntry.objects.filter(node__course=course).count(), 2)
+            self.assertFalse(NodeAggregate.objects.filter(node__course=course).exists())
+            bumps = [q for q in queries if q['sql'].startswith('UPDATE "api_course" SET "tree_version"')]
+            self.assertEqual(len(bumps), 1)
+            return len(queries)
+
+        # delete() removes the old nodes in batches of 100 rows; nothing runs per node
+        small, large = count(2, 'Small'), count(200, 'Large')
+        self.assertLessEqual(large - small, 2)
+
+    def test_validation(self):
+        catalog = self._catalog()
+        course = catalog['courses'][0]
+        course['term'] = 'spring'
+        course['nodes'][0]['children'][1]['children'] = [{'name': 'Week 1', 'weight': 1}]
+        course['nodes'][0]['children'][1]['is_leaf'] = True
+        course['entries'].append({'username': 'nobody', 'node': 'exam1'})
+        response = self.client.post('/api/import/', catalog, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = '\n'.join(response.json()['errors'])
+        self.assertIn("term 'spring' is invalid", errors)
+        self.assertIn('a leaf cannot have children', errors)
+        self.assertIn("entry of 'nobody': unknown user", errors)
+        self.assertFalse(Course.objects.filter(name='Imported').exists())
+
+    def test_modes(self):
+        self.client.post('/api/import/', self._catalog(), format='json')
+        course = Course.objects.get(name='Imported')
+        version = course.tree_version
+        self.assertEqual(self.client.post('/api/import/', self._catalog(), format='json').status_code, 400)
+        skipped = self.client.post('/api/import/?mode=skip', self._catalog(), format='json').json()
+        self.assertEqual(skipped['skipped'], 1)
+
+        replaced = self.client.post('/api/import/?mode=replace', self._catalog(leaves=3), format='json').json()
+        self.assertEqual(replaced['replaced'], 1)
+        course.refresh_from_db()
+        self.assertGreater(course.tree_version, version)
+        self.assertEqual(EvalNode.objects.filter(course=course, name__startswith='Exam ').count(), 3)
+        self.assertEqual(get_compiled_tree(course).version, course.tree_version)
+        self.assertTrue(EnrollmentSummary.objects.get(user=self.students[0], course=course).is_fresh_for(course))
+
+    def test_dry_run(self):
+        report = self.client.post('/api/import/?dry_run=1', self._catalog(), format='json').json()
+        self.assertEqual((report['valid'], report['created']), (1, 0))
+        self.assertFalse(Course.objects.filter(name='Imported').exists())
+
+    def _export(self, kind):
+        return ''.join(exports.iter_csv(kind, Course.objects.all()))
+
+    def test_csv_round_trip(self):
+        self.client.post('/api/import/', self._catalog(), format='json')
+        files = {kind: self._export(kind) for kind in exports.KINDS}
+        Course.objects.all().delete()
+
+        response = self.client.post('/api/import/', {
+            kind: SimpleUploadedFile(f'{kind}.csv', files[kind].encode('utf-8'), content_type='text/csv')
+            for kind in exports.KINDS
+        }, format='multipart')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['created'], 1)
+
+        def without_ids(text):
+            rows = list(csv.DictReader(StringIO(text.lstrip('\ufeff'))))
+            for row in rows:
+                for column in ('course_id', 'node_id', 'parent_id', 'updated_at'):
+                    row.pop(column, None)
+            return rows
+
+        for kind in exports.KINDS:
+            self.assertEqual(without_ids(self._export(kind)), without_ids(files[kind]), kind)
+
+    def test_command(self):
+        self.client.post('/api/import/', self._catalog(), format='json')
+        with tempfile.TemporaryDirectory() as workdir:
+            paths = {}
+            for kind in ('courses', 'entries'):
+                paths[kind] = os.path.join(workdir, f'{kind}.csv')
+                call_command('export_csv', kind, '-o', paths[kind])
+            out = StringIO()
+            call_command('import_catalog', paths['courses'], '--entries', paths['entries'], '--mode', 'skip', stdout=out, stderr=StringIO())
+            self.assertIn('1 skipped', out.getvalue())
+            with self.assertRaises(CommandError):
+                call_command('import_catalog', paths['courses'], stdout=StringIO(), stderr=StringIO())
+
+
+class RolloverTests(TestCase):
+    def _course(self, name, due_date=date(2025, 7, 1)):
+        course = Course.objects.create(name=name, year=2025, term='early', is_required=True, total_classes=14, target_enrollment_year=2025)
+        Threshold.objects.create(course=course, value=55.0)
+        root = EvalNode.objects.create(course=course, name='Total', weight=100)
+        reports = EvalNode.objects.create(course=course, parent=root, name='Reports', weight=40, order=1)
+        EvalNode.objects.create(course=course, parent=root, name='Exam', weight=60, input_type='score', is_leaf=True, due_date=due_date)
+        for k in range(3):
+            EvalNode.objects.create(course=course, parent=reports, name=f'Report {k}', weight=1, input_type='rate', is_leaf=True, order=k)
+        return course
+
+    def _shape(self, course):
+        nodes = {node.pk: node for node in EvalNode.objects.filter(course=course)}
+        return sorted(
+            (node.name, nodes[node.parent_id].name if node.parent_id else None, node.weight, node.input_type, node.is_leaf, node.order)
+            for node in nodes.values()
+        )
+
+    def test_duplicates_course_threshold_and_tree(self):
+        source = self._course('Logic', due_date=date(2024, 2, 29))
+        source.year = 2024
+        source.target_enrollment_year = 2024
+        source.save()
+        report = duplicate_courses(Course.objects.filter(pk=source.pk))
+        self.assertEqual((report['created'], report['nodes']), (1, 6))
+
+        copy = Course.objects.get(pk=report['course_ids'][source.pk])
+        self.assertEqual((copy.name, copy.year, copy.target_enrollment_year, copy.term), ('Logic', 2025, 2025, 'early'))
+        self.assertEqual((copy.is_required, copy.total_classes), (True, 14))
+        self.assertEqual(copy.threshold.value, 55.0)
+        self.assertEqual(self._shape(copy), self._shape(source))
+        self.assertEqual(EvalNode.objects.get(course=copy, name='Exam').due_date, date(2025, 2, 28))
+        self.assertEqual(EvalNode.objects.filter(course=source).count(), 6)
+        self.assertEqual(get_compiled_tree(copy).threshold, 55.0)
+
+    def test_rerun_skips_existing_copies(self):
+        self._course('Logic')
+        duplicate_courses(Course.objects.filter(year=2025))
+        report = duplicate_courses(Course.objects.filter(year=2025))
+        self.assertEqual((report['created'], report['skipped']), (0, 1))
+        self.assertEqual(Course.objects.filter(year=2026).count(), 1)
+
+    def test_queries_per_level_not_per_course(self):
+        def count(n, year):
+            for k in range(n):
+                course = self._course(f'Course {year}-{k}')
+                Course.objects.filter(pk=course.pk).update(year=year)
+            with CaptureQueriesContext(connection) as queries:
+                report = duplicate_courses(Course.objects.filter(year=year))
+            self.assertEqual(report['created'], n)
+            return len(queries)
+
+        self.assertEqual(count(2, 2030), count(12, 2040))
+
+    def test_admin_action(self):
+        admin_user = User.objects.create_superuser(username='root', password='password')
+        self.client.force_login(admin_user)
+        source = self._course('Logic')
+        response = self.client.post('/admin/api/course/', {
+            'action': 'duplicate_to_next_year', '_selected_action': [source.pk],
+        }, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Course.objects.filter(name='Logic', year=2026, target_enrollment_year=2026).exists())
+
+    def test_command(self):
+        self._course('Logic')
+        out = StringIO()
+        call_command('rollover_courses', '--year', '2025', '--dry-run', stdout=out)
+        self.assertIn('1 courses (6 nodes) duplicated', out.getvalue())
+        self.assertFalse(Course.objects.filter(year=2026).exists())
+        call_command('rollover_courses', '--year', '2025', '--years', '2', '--keep-due-dates', stdout=StringIO())
+        copy = Course.objects.get(year=2027)
+        self.assertEqual(EvalNode.objects.get(course=copy, name='Exam').due_date, date(2025, 7, 1))
@@ -1,7 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework.authtoken.views import obtain_auth_token
-from .views import CourseViewSet, RegisterView, EventViewSet, CurrentUserView
+from .views import CourseViewSet, RegisterView, EventViewSet, CurrentUserView, LoginView, LogoutView, RiskRankingView, ExportView, ImportView, HealthView, SchemaStatusView, MetricsView
 
 router = DefaultRouter()
 router.register(r'courses', CourseViewSet, basename='course')
@@ -9,8 +8,17 @@ router.register(r'events', EventViewSet, basename='event')
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
-    path('token/', obtain_auth_token, name='api_token_auth'),
-    path('login/', obtain_auth_token, name='api_token_auth_login'),
+    path('token/', LoginView.as_view(), name='api_token_auth'),
+    path('login/', LoginView.as_view(), name='api_token_auth_login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
     path('me/', CurrentUserView.as_view(), name='current_user'),
+    path('health/', HealthView.as_view(), name='health'),
+    path('health/schema/', SchemaStatusView.as_view(), name='schema_status'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('ranking/', RiskRankingView.as_view(), name='risk_ranking'),
+    path('export/courses.csv', ExportView.as_view(kind='courses'), name='export_courses'),
+    path('export/entries.csv', ExportView.as_view(kind='entries'), name='export_entries'),
+    path('export/summaries.csv', ExportView.as_view(kind='summaries'), name='export_summaries'),
+    path('import/', ImportView.as_view(), name='import'),
     path('', include(router.urls)),
 ]
@@ -1,41 +1,31 @@
+from datetime import date
+import json
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
 from rest_framework import viewsets, permissions, status, generics
 
+from rest_framework.authtoken.models import Token
+from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from .models import Course, EvalNode, EvalEntry, Threshold
-from .serializers import CourseSerializer, EvalNodeSerializer, EvalEntrySerializer, CourseSummarySerializer, EvalNodeFlatSerializer, RegisterSerializer, UserSerializer
+from .serializers import CourseSerializer, EvalEntrySerializer, EvalEntryBulkSerializer, CourseSummarySerializer, EvalNodeFlatSerializer, RegisterSerializer, UserSerializer, serialize_node_tree
+
+from . import debug_log, etags, exports, ical, importer, middleware, ranking, summaries
+from .authentication import CalendarFeedAuthentication, feed_key, token_expired
+from .cohort import evaluate_cohort
+from .course_tree import get_compiled_tree
+from .pagination import CoursePagination, EventPagination, ListCursorPagination
+from .schema_status import get_schema_status
+from .selectors import filter_courses
+from .signals import suppress_enrollment_refresh
 
-from .services import CalculationService
-import json
-import os
-
-# #region agent log
-LOG_PATH = os.environ.get('DEBUG_LOG_PATH', '/var/log/rakutan-backend/debug.log')
-def _log_debug(location, message, data, hypothesis_id=None):
-    try:
-        # Create log directory if it doesn't exist
-        log_dir = os.path.dirname(LOG_PATH)
-        if log_dir and not os.path.exists(log_dir):
-            try:
-                os.makedirs(log_dir, exist_ok=True)
-            except (OSError, PermissionError):
-                # If we can't create the log directory, silently skip logging
-                return
-        with open(LOG_PATH, 'a') as f:
-            log_entry = {
-                'sessionId': 'debug-session',
-                'runId': 'run1',
-                'hypothesisId': hypothesis_id,
-                'location': location,
-                'message': message,
-                'data': data,
-                'timestamp': int(__import__('time').time() * 1000)
-            }
-            f.write(json.dumps(log_entry) + '\n')
-    except Exception:
-        pass
-# #endregion
 
 class RegisterView(generics.CreateAPIView):
     queryset = UserSerializer.Meta.model.objects.all()
@@ -45,7 +35,7 @@ class RegisterView(generics.CreateAPIView):
     
     def create(self, request, *args, **kwargs):
         # #region agent log
-        _log_debug('views.py:RegisterView.create', '登録リクエスト受信', {
+        debug_log.log_debug('views.py:RegisterView.create', '登録リクエスト受信', {
             'username': request.data.get('username'),
             'email': request.data.get('email'),
             'has_full_name': 'full_name' in request.data,
@@ -58,7 +48,7 @@ class RegisterView(generics.CreateAPIView):
         try:
             response = super().create(request, *args, **kwargs)
             # #region agent log
-            _log_debug('views.py:RegisterView.create', '登録成功', {
+            debug_log.log_debug('views.py:RegisterView.create', '登録成功', {
                 'status_code': response.status_code,
                 'user_id': response.data.get('id') if hasattr(response, 'data') else None
             }, 'H1')
@@ -66,7 +56,7 @@ class RegisterView(generics.CreateAPIView):
             return response
         except Exception as e:
             # #region agent log
-            _log_debug('views.py:RegisterView.create', '登録エラー', {
+            debug_log.log_debug('views.py:RegisterView.create', '登録エラー', {
                 'error': str(e),
                 'error_type': type(e).__name__,
                 'request_data': {k: str(v)[:100] for k, v in request.data.items()}
@@ -75,6 +65,31 @@ class RegisterView(generics.CreateAPIView):
             raise
 
 
+class LoginView(ObtainAuthToken):
+    """obtain_auth_token, but an expired token is replaced instead of returned"""
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+        token, created = Token.objects.get_or_create(user=user)
+        if not created and token_expired(token.created):
+            token.delete()
+            token = Token.objects.create(user=user)
+        return Response({'token': token.key})
+
+
+class LogoutView(generics.GenericAPIView):
+    """Deletes the request's token (and its cached identity)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        key = getattr(request.auth, 'key', request.auth)
+        if key:
+            Token.objects.filter(key=key).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class CurrentUserView(generics.RetrieveAPIView):
     """Return current authenticated user information"""
     permission_classes = [permissions.IsAuthenticated]
@@ -122,9 +137,10 @@ class IsAdminOrReadOnly(permissions.BasePermission):
 class CourseViewSet(viewsets.ModelViewSet):
     serializer_class = CourseSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdminOrReadOnly]
+    pagination_class = CoursePagination
 
     def get_permissions(self):
-        if self.action in {'entries', 'summary', 'attendance', 'update_attendance'}:
+        if self.action in {'entries', 'bulk_entries', 'summary', 'attendance', 'update_attendance'}:
             return [permissions.IsAuthenticated()]
         return [permission() for permission in self.permission_classes]
 
@@ -165,15 +181,19 @@ class CourseViewSet(viewsets.ModelViewSet):
             order=0
         )
 
+    def retrieve(self, request, *args, **kwargs):
+        course = self.get_object()
+        etag = etags.course_etag('detail', course, request, entries=True, enrollment=True)
+        return etags.conditional(request, etag, lambda: Response(self.get_serializer(course).data))
+
     @action(detail=True, methods=['get', 'post'], permission_classes=[permissions.IsAuthenticated])
     def nodes(self, request, pk=None):
         course = self.get_object()
         
         if request.method == 'GET':
-            # Return tree
-            roots = course.nodes.filter(parent__isnull=True).order_by('order')
-            serializer = EvalNodeSerializer(roots, many=True)
-            return Response(serializer.data)
+            # Return tree, assembled from the compiled tree (no per-node queries)
+            etag = etags.course_etag('nodes', course, request)
+            return etags.conditional(request, etag, lambda: Response(serialize_node_tree(get_compiled_tree(course))))
         
         elif request.method == 'POST':
             # Add node to this course
@@ -188,21 +208,26 @@ class CourseViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def summary(self, request, pk=None):
         course = self.get_object()
-        # Get or create enrollment
+        etag = etags.course_etag('summary', course, request, entries=True, enrollment=True)
+        return etags.conditional(request, etag, lambda: self._summary_response(request, course))
+
+    def _summary_response(self, request, course):
+        # Read-only: a missing enrollment is summarized with the defaults
         from .models import CourseEnrollment
-        enrollment, _ = CourseEnrollment.objects.get_or_create(user=request.user, course=course)
+        enrollment = CourseEnrollment.objects.select_related('summary').filter(user=request.user, course=course).first()
         # #region agent log
-        _log_debug('views.py:CourseViewSet.summary', 'summary計算開始', {
-            'course_id': course.id,
-            'user_id': request.user.id,
-            'total_classes': getattr(course, 'total_classes', None),
-            'enrollment_attendance_mask': getattr(enrollment, 'attendance_mask', None),
-            'has_roots': course.nodes.filter(parent__isnull=True).exists()
-        }, 'ATT')
+        if debug_log.enabled('ATT'):
+            debug_log.log_debug('views.py:CourseViewSet.summary', 'summary計算開始', {
+                'course_id': course.id,
+                'user_id': request.user.id,
+                'total_classes': getattr(course, 'total_classes', None),
+                'enrollment_attendance_mask': getattr(enrollment, 'attendance_mask', None),
+                'has_roots': bool(get_compiled_tree(course).roots)
+            }, 'ATT')
         # #endregion
-        summary = CalculationService.get_course_summary(course, request.user, enrollment)
+        summary = summaries.get_summary(course, request.user, enrollment)
         # #region agent log
-        _log_debug('views.py:CourseViewSet.summary', 'summary計算完了', {
+        debug_log.log_debug('views.py:CourseViewSet.summary', 'summary計算完了', {
             'course_id': course.id,
             'keys': list(summary.keys()),
             'attendance_rate': summary.get('attendance_rate'),
@@ -211,6 +236,16 @@ class CourseViewSet(viewsets.ModelViewSet):
         # #endregion
         return Response(summary)
 
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAdminUser])
+    def cohort(self, request, pk=None):
+        """Summaries of every enrolled student, computed together (staff only)"""
+        course = self.get_object()
+        cohort = evaluate_cohort(course)
+        return Response([
+            {'user_id': int(cohort.user_ids[i]), 'username': cohort.usernames[i], **cohort.summary(i)}
+            for i in range(len(cohort))
+        ])
+
     @action(detail=True, methods=['get', 'post'])
     def entries(self, request, pk=None):
         course = self.get_object()
@@ -218,20 +253,24 @@ class CourseViewSet(viewsets.ModelViewSet):
             # return all entries for this course's nodes
             nodes = course.nodes.all() # flat
             entries = EvalEntry.objects.filter(user=request.user, node__in=nodes)
-            serializer = EvalEntrySerializer(entries, many=True)
-            return Response(serializer.data)
+            etag = etags.course_etag('entries', course, request, entries=True)
+            return etags.conditional(request, etag, lambda: self._entries_response(request, entries))
         
         elif request.method == 'POST':
             # Create or update entry
             # Expect: node_id, values...
             node_id = request.data.get('node')
             node = get_object_or_404(EvalNode, pk=node_id, course=course)
+
+            # The first write enrolls the user; reads never create enrollments
+            from .models import CourseEnrollment
+            CourseEnrollment.objects.get_or_create(user=request.user, course=course)
             
-            # Check if entry exists
-            entry, created = EvalEntry.objects.get_or_create(
-                user=request.user,
-                node=node
-            )
+            # Existing entry, or a new one built in memory: the single save
+            # below then runs the leaf-to-root refresh exactly once
+            entry = EvalEntry.objects.filter(user=request.user, node=node).first()
+            if entry is None:
+                entry = EvalEntry(user=request.user, node=node)
             
             serializer = EvalEntrySerializer(entry, data=request.data, partial=True)
             if serializer.is_valid():
@@ -239,18 +278,72 @@ class CourseViewSet(viewsets.ModelViewSet):
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def _entries_response(self, request, entries):
+        context = {'request': request}
+        paginator = ListCursorPagination(ordering=('id',))
+        page = paginator.paginate_queryset(entries, request, self)
+        return paginator.get_paginated_response(EvalEntrySerializer(page, many=True, context=context).data)
+
+    @action(detail=True, methods=['post'], url_path='entries/bulk')
+    def bulk_entries(self, request, pk=None):
+        """
+        Upsert many leaf entries at once (後から一括入力).
+        Expect: [{node, earned, max, ...}, ...]; omitted fields keep their stored values.
+        Returns the number of entries written and the recomputed summary.
+        """
+        course = self.get_object()
+        serializer = EvalEntryBulkSerializer(data=request.data, many=True, allow_empty=False)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Later items for the same node win
+        items = {item['node']: item for item in serializer.validated_data}
+        tree = get_compiled_tree(course)
+        leaf_ids = {tree.node_ids[i] for i in tree.leaves}
+        invalid = sorted(set(items) - leaf_ids)
+        if invalid:
+            return Response({'node': [f'Not a leaf node of this course: {node_id}' for node_id in invalid]},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        from .models import CourseEnrollment
+        fields = ['earned', 'max', 'rate', 'attended', 'total', 'adjustment', 'status']
+        with transaction.atomic():
+            existing = {
+                row['node_id']: row
+                for row in EvalEntry.objects.filter(user=request.user, node_id__in=items).values('node_id', *fields)
+            }
+            rows = []
+            for node_id, item in items.items():
+                values = {field: value for field, value in existing.get(node_id, {}).items() if field in fields}
+                values.update((field, item[field]) for field in fields if field in item)
+                rows.append(EvalEntry(user=request.user, node_id=node_id, **values))
+            # One INSERT .. ON CONFLICT DO UPDATE; skips EvalEntry.save() and its
+            # signals, so the summary is recomputed once below.
+            EvalEntry.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['user', 'node'],
+                update_fields=fields + ['updated_at'],
+            )
+            # A new enrollment would be refreshed by its post_save as well
+            with suppress_enrollment_refresh():
+                enrollment, _ = CourseEnrollment.objects.get_or_create(user=request.user, course=course)
+            enrollment.course = course
+            summary = summaries.refresh_enrollment(enrollment)
+        return Response({'updated': len(rows), 'summary': summary})
+
     @action(detail=True, methods=['get', 'put'], url_path='threshold')
     def threshold(self, request, pk=None):
         course = self.get_object()
-        threshold, created = Threshold.objects.get_or_create(course=course)
         
         if request.method == 'PUT':
             value = request.data.get('value')
             if value is not None:
-                threshold.value = float(value)
-                threshold.save()
+                threshold, _ = Threshold.objects.update_or_create(course=course, defaults={'value': float(value)})
+                return Response({'value': threshold.value})
         
-        return Response({'value': threshold.value})
+        # A course without a Threshold row uses the default (60.0)
+        return Response({'value': get_compiled_tree(course).threshold})
 
     @action(detail=True, methods=['patch'], url_path='attendance', permission_classes=[permissions.IsAuthenticated])
     def update_attendance(self, request, pk=None):
@@ -260,6 +353,7 @@ class CourseViewSet(viewsets.ModelViewSet):
         
         # Get or create enrollment
         enrollment, _ = CourseEnrollment.objects.get_or_create(user=request.user, course=course)
+        enrollment.course = course  # spares the summary refresh a course query
         
         # Update attendance mask
         attendance_mask = request.data.get('attendance_mask')
@@ -270,14 +364,215 @@ class CourseViewSet(viewsets.ModelViewSet):
         
         return Response({'error': 'attendance_mask is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+class HealthView(generics.GenericAPIView):
+    """Liveness and database connectivity; cheap enough for load balancer probes"""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError as e:
+            return Response({'status': 'error', 'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return Response({'status': 'ok'})
+
+
+class SchemaStatusView(generics.GenericAPIView):
+    """Schema and migration diagnostics (staff only); 503 while migrations are pending"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        schema = get_schema_status()
+        return Response(schema, status=status.HTTP_200_OK if schema['ok'] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class MetricsView(generics.GenericAPIView):
+    """Per-route request histograms in Prometheus text format (staff only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(middleware.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ExportView(generics.GenericAPIView):
+    """
+    Streaming CSV export (export/courses.csv, entries.csv, summaries.csv).
+    Filters: course, year, term, enrollment_year. Staff export every student;
+    students get the courses of their enrollment year and only their own rows.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, exports.CSVRenderer]
+    kind = None
+
+    def get(self, request):
+        user = request.user
+        if user.is_staff:
+            courses, owner = Course.objects.all(), None
+        else:
+            enrollment_year = getattr(getattr(user, 'profile', None), 'enrollment_year', None)
+            courses = Course.objects.filter(target_enrollment_year=enrollment_year) if enrollment_year else Course.objects.none()
+            owner = user
+        try:
+            courses = filter_courses(courses, request.query_params)
+        except ValueError:
+            return Response({'error': 'course, year and enrollment_year must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            exports.iter_csv(self.kind, courses, owner), content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{self.kind}.csv"'
+        return response
+
+
+class ImportView(generics.GenericAPIView):
+    """
+    Bulk import of courses, trees, enrollments and entries (staff only).
+    Body: JSON {"courses": [...]} (see importer.parse_json), or multipart files
+    courses (.csv or .json), entries and summaries (.csv) as written by export/.
+    Query: mode=create|skip|replace (for courses that already exist), dry_run=true.
+    Large catalogs should be uploaded as files; JSON bodies are capped by
+    DATA_UPLOAD_MAX_MEMORY_SIZE.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    parser_classes = [JSONParser, MultiPartParser]
+
+    def post(self, request):
+        mode = request.query_params.get('mode', 'create')
+        if mode not in importer.MODES:
+            return Response({'error': f'mode must be one of {", ".join(importer.MODES)}'}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.query_params.get('dry_run', '').lower() in ('true', '1', 'yes')
+        try:
+            if request.FILES:
+                upload = request.FILES.get('courses')
+                if upload is None:
+                    return Response({'error': 'courses file is required'}, status=status.HTTP_400_BAD_REQUEST)
+                if upload.name.endswith('.json'):
+                    specs, errors = importer.parse_json(json.load(upload))
+                else:
+                    specs, errors = importer.parse_csv(upload.read(), *(
+                        request.FILES[name].read() if name in request.FILES else None for name in ('entries', 'summaries')
+                    ))
+            else:
+                specs, errors = importer.parse_json(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        report = importer.import_courses(specs, mode=mode, dry_run=dry_run, errors=errors)
+        written = report['created'] + report['replaced']
+        failed = report['errors'] and not written and not dry_run
+        return Response(report, status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_200_OK)
+
+
+class RiskRankingView(generics.GenericAPIView):
+    """
+    危険度ランキング (staff only).
+    Exactly one scope: ?course=<id>, ?enrollment_year=<year> or ?user=<id>.
+    Optional filters: term, is_required. Pagination: offset, limit (max 100).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    max_limit = 100
+
+    def get(self, request):
+        params = request.query_params
+        scopes = [name for name in ('course', 'enrollment_year', 'user') if params.get(name)]
+        if len(scopes) != 1:
+            return Response({'error': 'Specify exactly one of course, enrollment_year or user'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            value = int(params[scopes[0]])
+            offset = max(0, int(params.get('offset', 0)))
+            limit = min(self.max_limit, max(1, int(params.get('limit', 20))))
+        except ValueError:
+            return Response({'error': 'course, enrollment_year, user, offset and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        scope_filter = {
+            'course': Q(course_id=value),
+            'enrollment_year': Q(course__target_enrollment_year=value),
+            'user': Q(user_id=value),
+        }[scopes[0]]
+        if params.get('term'):
+            scope_filter &= Q(course__term=params['term'])
+        if params.get('is_required'):
+            scope_filter &= Q(course__is_required=params['is_required'].lower() in ('true', '1', 'yes'))
+
+        count, results = ranking.rank(scope_filter, offset=offset, limit=limit)
+        next_offset = offset + limit if offset + limit < count else None
+        return Response({'count': count, 'next_offset': next_offset, 'results': results})
+
+
 from .serializers import EventSerializer
 
+
+def _date_window(params):
+    """(from, to) dates from the query string, either may be None; ValueError when malformed."""
+    start, end = params.get('from'), params.get('to')
+    return (date.fromisoformat(start) if start else None, date.fromisoformat(end) if end else None)
+
+
 class EventViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Dated evaluation nodes of the user's courses, with the course name joined.
+    Optional window: ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive).
+    feed.ics serves the same events as an iCalendar subscription.
+    """
     serializer_class = EventSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = EventPagination
 
-    def get_queryset(self):
+    def visible_events(self, start=None, end=None):
         from .models import CourseEnrollment
-        # Get courses the user is enrolled in
-        enrolled_courses = CourseEnrollment.objects.filter(user=self.request.user).values_list('course_id', flat=True)
-        return EvalNode.objects.filter(course_id__in=enrolled_courses, due_date__isnull=False).order_by('due_date')
+        user = self.request.user
+        # Courses the user is enrolled in, plus the courses of their enrollment year
+        # (enrollments are only created on the first write). Resolving the courses
+        # first lets each one be range-scanned on evalnode_course_due_idx.
+        enrolled_courses = CourseEnrollment.objects.filter(user=user).values_list('course_id', flat=True)
+        visible = Q(id__in=enrolled_courses)
+        enrollment_year = getattr(getattr(user, 'profile', None), 'enrollment_year', None)
+        if enrollment_year:
+            visible |= Q(target_enrollment_year=enrollment_year)
+        events = EvalNode.objects.filter(
+            course_id__in=Course.objects.filter(visible).values('id'), due_date__isnull=False,
+        )
+        if start:
+            events = events.filter(due_date__gte=start)
+        if end:
+            events = events.filter(due_date__lte=end)
+        return events.select_related('course').order_by('due_date', 'id')
+
+    def get_queryset(self):
+        return self.visible_events()
+
+    def list(self, request, *args, **kwargs):
+        try:
+            start, end = _date_window(request.query_params)
+        except ValueError:
+            return Response({'error': 'from and to must be dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.visible_events(start, end)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(
+        detail=False, url_path='feed.ics', url_name='feed',
+        authentication_classes=[CalendarFeedAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+        renderer_classes=[*api_settings.DEFAULT_RENDERER_CLASSES, ical.ICalendarRenderer],
+    )
+    def feed(self, request):
+        """iCalendar subscription, streamed; calendar apps authenticate with ?key= (see feed_url)."""
+        try:
+            start, end = _date_window(request.query_params)
+        except ValueError:
+            return Response({'error': 'from and to must be dates (YYYY-MM-DD)'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(
+            ical.iter_calendar(self.visible_events(start, end), name='Rakutan Checker', host=request.get_host()),
+            content_type='text/calendar; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'inline; filename="rakutan.ics"'
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @action(detail=False, url_path='feed-url')
+    def feed_url(self, request):
+        """Subscription URL for the current user's feed.ics."""
+        url = request.build_absolute_uri(reverse('event-feed'))
+        return Response({'url': f'{url}?key={feed_key(request.user)}'})
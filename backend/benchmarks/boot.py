@@ -0,0 +1,66 @@
+"""
+Worker boot benchmark: how long a fresh process takes to become ready.
+
+Each run starts a new interpreter and times `django.setup()` (what every
+manage.py invocation pays) and `import config.wsgi` (what a gunicorn worker
+pays before taking traffic). Run it on two checkouts to compare them:
+
+    python benchmarks/boot.py --runs 20
+    python benchmarks/boot.py --runs 20 --json > boot.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    'django_setup': 'import django; django.setup()',
+    'wsgi_ready': 'import config.wsgi',
+}
+
+PROBE = """
+import os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+start = time.perf_counter()
+{statement}
+sys.stdout.write(repr(time.perf_counter() - start))
+"""
+
+
+def measure(statement, runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE.format(statement=statement)],
+            cwd=BACKEND_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]) * 1000)
+    return {
+        'runs': runs,
+        'median_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+        'max_ms': round(max(timings), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--target', choices=sorted(TARGETS), action='append')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    results = {name: measure(TARGETS[name], args.runs) for name in (args.target or TARGETS)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        print(f"{name:14} median {result['median_ms']:8.2f} ms  min {result['min_ms']:8.2f}  max {result['max_ms']:8.2f}  ({result['runs']} runs)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Request throughput under concurrent workers, with and without the database
+connection tuning in config/settings.py (_apply_connection_settings).
+
+A dataset is generated once into a temporary SQLite file. For each mode a
+copy of it is served by --workers processes, each driving Django's
+WSGIHandler directly (so request_started / request_finished and
+CONN_MAX_AGE behave as under gunicorn sync workers) with a mix of
+authenticated reads and entry writes for --seconds.
+
+    python -m benchmarks.concurrency --workers 3 --seconds 10
+
+Modes:
+    baseline  rollback journal, synchronous=FULL, DEFERRED transactions,
+              a new connection per request (the previous defaults)
+    tuned     WAL, synchronous=NORMAL, IMMEDIATE transactions, persistent
+              connections (the current defaults)
+"""
+import argparse
+import io
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'baseline': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_CACHE_SIZE': '-2000',
+        'SQLITE_TRANSACTION_MODE': '',
+        'DB_CONN_MAX_AGE': '0',
+    },
+    'tuned': {},
+}
+
+
+def _base_env(db_name):
+    return {
+        'DJANGO_SETTINGS_MODULE': 'config.settings',
+        'DEBUG': 'True',
+        'DEBUG_LOG_PATH': '',
+        'DB_ENGINE': 'django.db.backends.sqlite3',
+        'DB_NAME': db_name,
+    }
+
+
+def _prepare(db_name, args):
+    """Generates the dataset and returns [(token key, course ids, leaf ids)] per student."""
+    os.environ.update(_base_env(db_name))
+    sys.path.insert(0, BACKEND_DIR)
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from rest_framework.authtoken.models import Token
+
+    from api.models import Course, EvalNode
+    from benchmarks.datagen import Params, generate
+
+    call_command('migrate', verbosity=0)
+    params = Params(
+        seed=args.seed, years=1, courses_per_year=args.courses, depth=2, fanout=3,
+        students_per_year=args.students, density=0.6,
+    )
+    _, students_by_year = generate(params)
+    courses = list(Course.objects.values_list('id', flat=True))
+    leaves = list(EvalNode.objects.filter(is_leaf=True).values_list('id', 'course_id'))
+    clients = []
+    for student in students_by_year[params.first_year]:
+        token = Token.objects.create(user=student)
+        clients.append((token.key, courses, leaves))
+    connection.close()
+    return clients
+
+
+def _environ(method, path, token, body=None):
+    payload = json.dumps(body).encode() if body is not None else b''
+    return {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost',
+        'HTTP_AUTHORIZATION': f'Token {token}',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': io.BytesIO(payload),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+
+def _worker(env, clients, seconds, write_ratio, seed, results):
+    os.environ.update(env)
+    sys.path.insert(0, BACKEND_DIR)
+    import django
+    django.setup()
+    from django.core.handlers.wsgi import WSGIHandler
+
+    # "database is locked" failures are counted as errors, not logged.
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    handler = WSGIHandler()
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    statuses = []
+
+    def start_response(status, headers, exc_info=None):
+        statuses.append(int(status.split()[0]))
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        token, courses, leaves = rng.choice(clients)
+        course = rng.choice(courses)
+        if rng.random() < write_ratio:
+            node, course = rng.choice(leaves)
+            body = {'node': node, 'earned': rng.randint(0, 100), 'max': 100, 'status': 'completed'}
+            environ = _environ('POST', f'/api/courses/{course}/entries/', token, body)
+        else:
+            path = rng.choice(['/api/courses/', f'/api/courses/{course}/summary/',
+                               f'/api/courses/{course}/nodes/', f'/api/courses/{course}/entries/'])
+            environ = _environ('GET', path, token)
+        start = time.perf_counter()
+        response = handler(environ, start_response)
+        b''.join(response)
+        response.close()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if statuses.pop() >= 400:
+            errors += 1
+    results.put({'latencies': latencies, 'errors': errors})
+
+
+def run_mode(name, db_name, clients, args):
+    env = {**_base_env(db_name), **MODES[name]}
+    # Journal mode is a property of the file; switch it while no one is connected.
+    with sqlite3.connect(db_name) as conn:
+        conn.execute(f"PRAGMA journal_mode={env.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workers = [
+        context.Process(target=_worker, args=(env, clients, args.seconds, args.write_ratio, args.seed + i, results))
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    collected = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    latencies = sorted(latency for result in collected for latency in result['latencies'])
+    return {
+        'requests': len(latencies),
+        'errors': sum(result['errors'] for result in collected),
+        'throughput_rps': round(len(latencies) / args.seconds, 1),
+        'p50_ms': round(statistics.median(latencies), 2) if latencies else None,
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=3, help='worker processes (gunicorn --workers)')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='fraction of requests that write an entry')
+    parser.add_argument('--courses', type=int, default=10)
+    parser.add_argument('--students', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--mode', choices=sorted(MODES), action='append')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, 'source.sqlite3')
+        clients = _prepare(source, args)
+        with sqlite3.connect(source) as conn:
+            conn.execute('PRAGMA journal_mode=DELETE')
+
+        results = {}
+        for name in args.mode or MODES:
+            db_name = os.path.join(workdir, f'{name}.sqlite3')
+            shutil.copyfile(source, db_name)
+            results[name] = run_mode(name, db_name, clients, args)
+            r = results[name]
+            print(f"{name:9} {r['throughput_rps']:8.1f} req/s  p50 {r['p50_ms']:7.2f} ms  "
+                  f"p95 {r['p95_ms']:7.2f} ms  errors {r['errors']}  ({r['requests']} requests)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'params': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
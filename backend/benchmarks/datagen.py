@@ -0,0 +1,137 @@
+"""
+Seeded synthetic data for the benchmarks.
+
+generate() builds N enrollment years, each with M courses whose evaluation
+trees have the given depth and fan-out, K students enrolled in every
+course of their year, and entries for a `density` fraction of
+(student, leaf) pairs. Rows are written with bulk_create, one tree level
+at a time, so signals do not fire; the materialized summaries are
+rebuilt at the end unless materialize=False.
+"""
+import random
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+
+from api import summaries
+from api.models import Course, CourseEnrollment, EvalEntry, EvalNode, Threshold, UserProfile
+
+PASSWORD = 'benchmark'
+BATCH_SIZE = 2000
+
+
+@dataclass
+class Params:
+    seed: int = 42
+    years: int = 2
+    courses_per_year: int = 10
+    depth: int = 2
+    fanout: int = 4
+    students_per_year: int = 50
+    density: float = 0.7
+    first_year: int = 2024
+    materialize: bool = True
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def _leaf_values(rng, input_type):
+    if input_type == EvalNode.InputType.RATE:
+        return {'rate': round(rng.uniform(30, 100), 1)}
+    if input_type == EvalNode.InputType.ATTENDANCE:
+        total = rng.randint(10, 15)
+        return {'attended': rng.randint(total // 2, total), 'total': total}
+    return {'earned': round(rng.uniform(20, 100), 1), 'max': 100.0}
+
+
+def _build_trees(rng, courses, params):
+    """Creates every course tree level by level; returns {course_id: [leaf EvalNode]}."""
+    roots = EvalNode.objects.bulk_create([
+        EvalNode(course=course, name='全体評価', weight=100, input_type=EvalNode.InputType.NONE, order=0)
+        for course in courses
+    ])
+    leaves = {course.id: [] for course in courses}
+    level = roots
+    for depth in range(1, params.depth + 1):
+        is_leaf = depth == params.depth
+        children = []
+        for parent in level:
+            for k in range(params.fanout):
+                input_type = EvalNode.InputType.NONE
+                due_date = None
+                if is_leaf:
+                    input_type = rng.choice(
+                        [EvalNode.InputType.SCORE] * 3 + [EvalNode.InputType.RATE, EvalNode.InputType.ATTENDANCE]
+                    )
+                    due_date = date(parent.course.year, 4, 1) + timedelta(days=rng.randint(0, 300))
+                children.append(EvalNode(
+                    course=parent.course, parent=parent, name=f'L{depth}-{k + 1}',
+                    weight=rng.choice([10, 20, 25, 30, 40]), input_type=input_type,
+                    is_leaf=is_leaf, order=k, due_date=due_date,
+                ))
+        level = EvalNode.objects.bulk_create(children, batch_size=BATCH_SIZE)
+    for node in level:
+        leaves[node.course_id].append(node)
+    return leaves
+
+
+def generate(params=None):
+    """Writes the dataset to the default database and returns a summary of it."""
+    params = params or Params()
+    rng = random.Random(params.seed)
+    User = get_user_model()
+    password = make_password(PASSWORD)
+    terms = [choice for choice, _ in Course.Term.choices]
+    counts = {'users': 0, 'courses': 0, 'nodes': 0, 'entries': 0, 'enrollments': 0}
+    students_by_year = {}
+
+    for year in range(params.first_year, params.first_year + params.years):
+        users = User.objects.bulk_create([
+            User(username=f'student{year}-{i:04d}', password=password)
+            for i in range(params.students_per_year)
+        ], batch_size=BATCH_SIZE)
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, enrollment_year=year, student_id=f'{year}{i:04d}', full_name=user.username)
+            for i, user in enumerate(users)
+        ], batch_size=BATCH_SIZE)
+        students_by_year[year] = users
+
+        courses = Course.objects.bulk_create([
+            Course(
+                name=f'Course {year}-{k + 1:03d}', year=year, term=terms[k % len(terms)],
+                is_required=rng.random() < 0.5, target_enrollment_year=year,
+            )
+            for k in range(params.courses_per_year)
+        ])
+        Threshold.objects.bulk_create([Threshold(course=course, value=60.0) for course in courses])
+        leaves = _build_trees(rng, courses, params)
+
+        enrollments = []
+        entries = []
+        for user in users:
+            for course in courses:
+                enrollments.append(CourseEnrollment(
+                    user=user, course=course, attendance_mask=rng.getrandbits(course.total_classes),
+                ))
+                for leaf in leaves[course.id]:
+                    if rng.random() < params.density:
+                        entries.append(EvalEntry(
+                            user=user, node=leaf, status=EvalEntry.Status.COMPLETED,
+                            **_leaf_values(rng, leaf.input_type),
+                        ))
+        CourseEnrollment.objects.bulk_create(enrollments, batch_size=BATCH_SIZE)
+        EvalEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+
+        counts['users'] += len(users)
+        counts['courses'] += len(courses)
+        counts['enrollments'] += len(enrollments)
+        counts['entries'] += len(entries)
+
+        if params.materialize:
+            summaries.rebuild(courses)
+
+    counts['nodes'] = EvalNode.objects.count()
+    return counts, students_by_year
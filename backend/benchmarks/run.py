@@ -0,0 +1,208 @@
+"""
+Benchmarks for the API hot paths on seeded synthetic data.
+
+Builds a fresh SQLite database in a temporary directory (or uses
+DATABASE_URL with --use-env-database), generates the dataset with
+benchmarks/datagen.py and times each case. For every case it reports the
+median / min wall time over --repeat runs, the number of SQL queries and
+the peak traced memory of one run. Results are written as JSON so two
+commits can be compared:
+
+    python -m benchmarks.run --output before.json
+    git checkout other-branch
+    python -m benchmarks.run --output after.json --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--years', type=int, default=2, help='enrollment years (N)')
+    parser.add_argument('--courses-per-year', type=int, default=10, help='courses per year (M)')
+    parser.add_argument('--depth', type=int, default=2, help='tree depth below the root')
+    parser.add_argument('--fanout', type=int, default=4, help='children per inner node')
+    parser.add_argument('--students-per-year', type=int, default=50, help='students per year (K)')
+    parser.add_argument('--density', type=float, default=0.7, help='fraction of (student, leaf) pairs with an entry')
+    parser.add_argument('--no-materialize', action='store_true', help='do not build EnrollmentSummary rows')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--case', action='append', help='run only these cases')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='print the change against an earlier results file')
+    parser.add_argument('--use-env-database', action='store_true', help='use the configured database instead of a temporary SQLite file')
+    return parser.parse_args()
+
+
+def _setup_django(args, workdir):
+    sys.path.insert(0, BACKEND_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    os.environ.setdefault('DEBUG', 'True')
+    os.environ['DEBUG_LOG_PATH'] = ''
+    if not args.use_env_database:
+        os.environ.pop('DATABASE_URL', None)
+        os.environ['DB_ENGINE'] = 'django.db.backends.sqlite3'
+        os.environ['DB_NAME'] = os.path.join(workdir, 'benchmark.sqlite3')
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    call_command('migrate', verbosity=0)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(func, repeat):
+    from django.db import connection
+
+    # An execute_wrapper rather than CaptureQueriesContext: the test client
+    # resets connection.queries at the start of every request.
+    queries = []
+    with connection.execute_wrapper(lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)):
+        func()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'wall_ms_median': round(statistics.median(timings), 3),
+        'wall_ms_min': round(min(timings), 3),
+        'queries': len(queries),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+
+
+def _cases(student):
+    from rest_framework.test import APIClient
+
+    from api.course_tree import tree_cache
+    from api.models import Course
+    from api.services import CalculationService
+
+    client = APIClient()
+    client.force_authenticate(student)
+    year = student.profile.enrollment_year
+    courses = list(Course.objects.filter(target_enrollment_year=year))
+    course = courses[0]
+
+    def get(url):
+        def request():
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+        return request
+
+    def summaries_cold():
+        tree_cache.clear()
+        for c in courses:
+            CalculationService.get_course_summary(c, student)
+
+    def summaries_warm():
+        for c in courses:
+            CalculationService.get_course_summary(c, student)
+
+    return {
+        'get_course_summary_cold': summaries_cold,
+        'get_course_summary_warm': summaries_warm,
+        'course_list': get('/api/courses/'),
+        'course_detail': get(f'/api/courses/{course.pk}/'),
+        'course_summary': get(f'/api/courses/{course.pk}/summary/'),
+        'nodes_tree': get(f'/api/courses/{course.pk}/nodes/'),
+        'entries_list': get(f'/api/courses/{course.pk}/entries/'),
+        'events': get('/api/events/'),
+    }
+
+
+def _compare(results, previous, path):
+    print(f'\nchange against {path}:')
+    for name, result in results.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        delta = result['wall_ms_median'] - before['wall_ms_median']
+        ratio = result['wall_ms_median'] / before['wall_ms_median'] if before['wall_ms_median'] else float('inf')
+        print(f"  {name:26} {before['wall_ms_median']:9.2f} -> {result['wall_ms_median']:9.2f} ms "
+              f"({delta:+.2f}, x{ratio:.2f})  queries {before['queries']} -> {result['queries']}")
+
+
+def main():
+    args = _parse_args()
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    with tempfile.TemporaryDirectory() as workdir:
+        _setup_django(args, workdir)
+        from benchmarks.datagen import Params, generate
+
+        params = Params(
+            seed=args.seed, years=args.years, courses_per_year=args.courses_per_year, depth=args.depth,
+            fanout=args.fanout, students_per_year=args.students_per_year, density=args.density,
+            materialize=not args.no_materialize,
+        )
+        start = time.perf_counter()
+        counts, students_by_year = generate(params)
+        generate_seconds = time.perf_counter() - start
+        student = students_by_year[params.first_year][0]
+
+        results = {}
+        for name, func in _cases(student).items():
+            if args.case and name not in args.case:
+                continue
+            results[name] = _measure(func, args.repeat)
+            r = results[name]
+            print(f"{name:26} median {r['wall_ms_median']:9.2f} ms  min {r['wall_ms_min']:9.2f} ms  "
+                  f"queries {r['queries']:4d}  peak {r['peak_memory_kib']:9.1f} KiB")
+
+        import django
+        from django.db import connection
+
+        report = {
+            'meta': {
+                'commit': _git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'params': params.as_dict(),
+                'dataset': counts,
+                'generate_seconds': round(generate_seconds, 2),
+                'repeat': args.repeat,
+            },
+            'results': results,
+        }
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        if previous is not None:
+            _compare(results, previous, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -53,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Removed at startup unless PERFORMANCE_METRICS_ENABLED (see api/middleware.py)
+    'api.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -148,11 +150,59 @@ def _database_from_env() -> dict:
     }
 
 
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return value.lower() in ('true', '1', 'yes')
+
+
+def _apply_connection_settings(db: dict) -> dict:
+    """
+    Connection reuse for every engine, plus engine-specific tuning:
+    - PostgreSQL: persistent connections with health checks, or a psycopg 3
+      connection pool when DB_POOL is set (the two are mutually exclusive).
+    - SQLite: WAL journal and pragmas on connect, IMMEDIATE write transactions
+      so concurrent writers wait on busy_timeout instead of failing.
+    """
+    options = db.setdefault('OPTIONS', {})
+    db['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '60'))
+    db['CONN_HEALTH_CHECKS'] = _env_bool('DB_CONN_HEALTH_CHECKS', True)
+
+    if db['ENGINE'] == 'django.db.backends.postgresql':
+        options.setdefault('connect_timeout', int(os.environ.get('DB_CONNECT_TIMEOUT', '5')))
+        if _env_bool('DB_POOL', False):
+            # Requires psycopg>=3 with the pool extra (psycopg[pool]).
+            options['pool'] = {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            }
+            db['CONN_MAX_AGE'] = 0
+    elif db['ENGINE'] == 'django.db.backends.sqlite3':
+        busy_timeout_ms = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        pragmas = [
+            f'PRAGMA busy_timeout={busy_timeout_ms}',
+            'PRAGMA synchronous=' + os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            'PRAGMA cache_size=' + os.environ.get('SQLITE_CACHE_SIZE', '-20000'),  # negative: KiB
+            'PRAGMA temp_store=MEMORY',
+        ]
+        journal_mode = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+        if journal_mode:
+            pragmas.insert(0, f'PRAGMA journal_mode={journal_mode}')
+        options.setdefault('init_command', ';'.join(pragmas))
+        options.setdefault('transaction_mode', os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE') or None)
+        options.setdefault('timeout', busy_timeout_ms / 1000)
+    return db
+
+
 DATABASE_URL = os.environ.get('DATABASE_URL')
 DATABASES = {
-    'default': _database_from_url(DATABASE_URL)
-    if DATABASE_URL
-    else _database_from_env()
+    'default': _apply_connection_settings(
+        _database_from_url(DATABASE_URL)
+        if DATABASE_URL
+        else _database_from_env()
+    )
 }
 
 # CORS Configuration
@@ -167,7 +217,8 @@ CORS_ALLOW_CREDENTIALS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication with a cached identity and token expiry
+        'api.authentication.CachedTokenAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     ],
 }
@@ -209,3 +260,28 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static'
+
+# Compiled course-tree cache (api/course_tree.py)
+COURSE_TREE_CACHE_SIZE = int(os.environ.get('COURSE_TREE_CACHE_SIZE', '256'))
+WARM_TREE_CACHE_ON_BOOT = os.environ.get('WARM_TREE_CACHE_ON_BOOT', 'False').lower() in ('true', '1', 'yes')
+
+# Structured debug log (api/debug_log.py). Empty DEBUG_LOG_PATH disables it.
+# DEBUG_LOG_SAMPLING: comma-separated category=rate pairs, e.g. "ATT=0.1,H3=0,*=1".
+DEBUG_LOG_PATH = os.environ.get('DEBUG_LOG_PATH', '/var/log/rakutan-backend/debug.log')
+DEBUG_LOG_SAMPLING = {
+    category.strip(): float(rate)
+    for category, rate in (
+        pair.split('=', 1) for pair in os.environ.get('DEBUG_LOG_SAMPLING', '').split(',') if '=' in pair
+    )
+}
+DEBUG_LOG_MAX_BYTES = int(os.environ.get('DEBUG_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+DEBUG_LOG_BACKUP_COUNT = int(os.environ.get('DEBUG_LOG_BACKUP_COUNT', '3'))
+DEBUG_LOG_QUEUE_SIZE = int(os.environ.get('DEBUG_LOG_QUEUE_SIZE', '10000'))
+
+# Per-request Server-Timing header and /api/metrics/ histograms (api/middleware.py)
+PERFORMANCE_METRICS_ENABLED = os.environ.get('PERFORMANCE_METRICS_ENABLED', 'False').lower() in ('true', '1', 'yes')
+
+# Token authentication (api/authentication.py). TOKEN_EXPIRE_SECONDS unset: tokens never expire.
+TOKEN_CACHE_TTL = int(os.environ.get('TOKEN_CACHE_TTL', '60'))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', '10000'))
+TOKEN_EXPIRE_SECONDS = int(os.environ['TOKEN_EXPIRE_SECONDS']) if os.environ.get('TOKEN_EXPIRE_SECONDS') else None
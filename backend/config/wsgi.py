@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WARM_TREE_CACHE_ON_BOOT:
+    # Compile the trees of recent courses before this worker takes traffic.
+    from api.course_tree import warm_tree_cache
+
+    warm_tree_cache()
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import type { Page } from './types';
 
 const api = axios.create({
     baseURL: import.meta.env.VITE_API_URL || (import.meta.env.MODE === 'production' ? '/api/' : 'http://localhost:8000/api/'),
@@ -31,4 +32,19 @@ api.interceptors.response.use(
     }
 );
 
+// Largest page the API serves (ListCursorPagination.max_page_size)
+const MAX_PAGE_SIZE = 200;
+
+// Fetches every page of a list endpoint by following its next links
+export async function getAll<T>(url: string, params: Record<string, string> = {}): Promise<T[]> {
+    let res = await api.get<Page<T>>(url, { params: { page_size: MAX_PAGE_SIZE, ...params } });
+    const items = [...res.data.results];
+    while (res.data.next) {
+        // next is an absolute URL, so axios ignores baseURL for it
+        res = await api.get<Page<T>>(res.data.next);
+        items.push(...res.data.results);
+    }
+    return items;
+}
+
 export default api;
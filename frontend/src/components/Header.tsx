@@ -8,6 +8,11 @@ const Header: React.FC = () => {
     const [displayName, setDisplayName] = useState<string | null>(null);
 
     const handleLogout = () => {
+        // Revoke the token server-side; logging out locally must not wait on it
+        const token = localStorage.getItem('token');
+        if (token) {
+            api.post('logout/', null, { headers: { Authorization: `Token ${token}` } }).catch(() => {});
+        }
         localStorage.removeItem('token');
         navigate('/login');
     };
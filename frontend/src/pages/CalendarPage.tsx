@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import api from '../api';
+import api, { getAll } from '../api';
 
 interface Event {
     id: number;
@@ -10,22 +10,54 @@ interface Event {
     weight: number;
 }
 
+const formatDate = (date: Date) =>
+    `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}-${String(date.getDate()).padStart(2, '0')}`;
+
 const CalendarPage: React.FC = () => {
     const [events, setEvents] = useState<Event[]>([]);
     const [view, setView] = useState<'calendar' | 'weekly'>('calendar');
     const [currentDate, setCurrentDate] = useState(new Date());
 
+    // Fetch only the displayed month / week
     useEffect(() => {
         const fetchEvents = async () => {
+            let from: Date;
+            let to: Date;
+            if (view === 'calendar') {
+                from = new Date(currentDate.getFullYear(), currentDate.getMonth(), 1);
+                to = new Date(currentDate.getFullYear(), currentDate.getMonth() + 1, 0);
+            } else {
+                from = new Date(currentDate);
+                from.setDate(currentDate.getDate() - currentDate.getDay());
+                to = new Date(from);
+                to.setDate(from.getDate() + 6);
+            }
             try {
-                const res = await api.get('events/');
-                setEvents(res.data);
+                // Pad by a day: getEventsForDay compares against UTC dates
+                from.setDate(from.getDate() - 1);
+                to.setDate(to.getDate() + 1);
+                setEvents(await getAll<Event>('events/', { from: formatDate(from), to: formatDate(to) }));
             } catch (err) {
                 console.error(err);
             }
         };
         fetchEvents();
-    }, []);
+    }, [view, currentDate]);
+
+    const subscribe = async () => {
+        try {
+            const res = await api.get('events/feed-url/');
+            const url: string = res.data.url;
+            try {
+                await navigator.clipboard.writeText(url);
+                alert('購読用URLをコピーしました。カレンダーアプリの「URLで照会・購読」に貼り付けてください。');
+            } catch {
+                window.prompt('購読用URL (カレンダーアプリに登録してください)', url);
+            }
+        } catch (err) {
+            console.error(err);
+        }
+    };
 
     // Navigation handlers
     const prev = () => {
@@ -266,6 +298,7 @@ const CalendarPage: React.FC = () => {
                     </span>
                     <button onClick={next} style={{ padding: '0.5rem', fontSize: '0.8rem' }}>&gt;</button>
                     <button onClick={today} style={{ fontSize: '0.8rem', marginLeft: '0.5rem' }}>今日</button>
+                    <button onClick={subscribe} style={{ fontSize: '0.8rem', marginLeft: '0.5rem' }}>購読</button>
                 </div>
             </div>
 
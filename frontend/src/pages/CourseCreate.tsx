@@ -13,7 +13,8 @@ const CourseCreate: React.FC = () => {
     const handleSubmit = async (e: React.FormEvent) => {
         e.preventDefault();
         try {
-            const res = await api.post('courses/', {
+            // The new course has no grades yet; skip computing its summary
+            const res = await api.post('courses/?omit=summary', {
                 name,
                 year,
                 term,
@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useMemo } from 'react';
 import { useParams } from 'react-router-dom';
-import api from '../api';
+import api, { getAll } from '../api';
 import EvaluationNode from '../components/EvaluationNode';
 import type { Course, EvalNode, EvalEntry, CourseSummary } from '../types';
 
@@ -17,14 +17,14 @@ const CourseDetail: React.FC = () => {
         if (!id) return;
         try {
             const [courseRes, nodesRes, entriesRes, summaryRes] = await Promise.all([
-                api.get(`courses/${id}/`),
+                api.get(`courses/${id}/?omit=summary`),  // summary is fetched below
                 api.get(`courses/${id}/nodes/`),
-                api.get(`courses/${id}/entries/`),
+                getAll<EvalEntry>(`courses/${id}/entries/`),
                 api.get(`courses/${id}/summary/`)
             ]);
             setCourse(courseRes.data);
             setNodes(nodesRes.data);
-            setEntries(entriesRes.data);
+            setEntries(entriesRes);
             setSummary(summaryRes.data);
         } catch (err) {
             console.error(err);
@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import api from '../api';
+import api, { getAll } from '../api';
 import { useNavigate } from 'react-router-dom';
 import type { Course } from '../types';
 
@@ -17,9 +17,9 @@ const Dashboard: React.FC = () => {
                 setIsAdmin(userRes.data.is_staff || false);
 
                 // Fetch courses
-                const res = await api.get('courses/');
+                const list = await getAll<Course>('courses/');
                 // Sort by deficit descending (highest risk first), then name
-                const sorted = (res.data as Course[]).sort((a, b) => {
+                const sorted = list.sort((a, b) => {
                     const defA = a.summary?.deficit || 0;
                     const defB = b.summary?.deficit || 0;
                     if (defA !== defB) return defB - defA;
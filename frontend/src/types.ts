@@ -48,3 +48,10 @@ export interface CourseSummary {
     is_attendance_safe: boolean;
     threshold: number;
 }
+
+// Cursor-paginated list response
+export interface Page<T> {
+    next: string | null;
+    previous: string | null;
+    results: T[];
+}